@@ -0,0 +1,116 @@
+"""Tests for the local Wikidata and LLM stand-ins (bench/stubs.py)."""
+
+import json
+import random
+from collections import Counter
+
+import pytest
+import requests
+from wikidata_discover import crawl_policy, discovery, hierarchy, llm_helpers, wikidata_api
+from wikidata_discover.bench.stubs import Faults, Latency, Stubs
+from wikidata_discover.bench.world import StubWorld
+from wikidata_discover.discovery import Discovery
+from wikidata_discover.entity_store import EntityStore
+from wikidata_discover.harvester import fetch_us_universities
+from wikidata_discover.llm_helpers import LLMHelper
+
+
+@pytest.fixture
+def stubs(tmp_path, monkeypatch):
+    for module, name in (
+        (llm_helpers, "_CACHE_DIR"), (wikidata_api, "_SEARCH_CACHE_DIR"), (crawl_policy, "_CLOSURE_CACHE_DIR"),
+    ):
+        monkeypatch.setattr(module, name, tmp_path / name)
+    monkeypatch.setattr(wikidata_api, "_search_memo", {})
+    monkeypatch.setattr(crawl_policy, "_closure_memo", {})
+    s = Stubs(StubWorld(extra=5)).start()
+    with s.patched():
+        yield s
+    s.stop()
+
+
+@pytest.mark.parametrize("provider", ["openai", "anthropic", "gemini"])
+def test_discover_matching_through_each_provider(stubs, tmp_path, provider):
+    disc = Discovery("Q49210", store=EntityStore(tmp_path / "entities.sqlite"), harvest=False)
+    assert disc.university_label == "New York University"
+    units = list(LLMHelper.stream_divisions(provider, disc.university_label, disc.university_website))
+    rows = disc.match_divisions(units)
+
+    # every third school is linked, the next one sits below it, the next has no item
+    assert len(rows) == 19
+    assert Counter(r["status"] for r in rows) == {"linked": 7, "orphan": 6, "missing": 6}
+    assert stubs.llm.stats[200] >= 1
+
+
+@pytest.mark.parametrize("provider", ["openai", "anthropic", "gemini"])
+def test_judge_through_each_provider(stubs, provider):
+    kept = LLMHelper.judge_union("New York University", ["School of Law", "Law Library"], provider)
+    assert "School of Law" in kept
+
+
+def test_discover_missing_returns_a_report_per_call(stubs, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # CSV and QuickStatements
+    monkeypatch.setattr(discovery, "RESULTS_DIR", tmp_path)
+    monkeypatch.setattr(hierarchy, "SNAPSHOT_DIR", tmp_path / "hierarchies")
+    disc = Discovery("Q49210", store=EntityStore(tmp_path / "entities.sqlite"), harvest=False)
+
+    missing, first = disc.discover_missing()
+    assert first == json.loads((tmp_path / "reports" / "Q49210_report.json").read_text())
+    assert len(missing) == first["missing"] + first["exists_orphan"]
+    assert first["llm_usage"]["extract"]["calls"] == 1
+
+    disc.get_hierarchy()  # a crawl outside any run is not reported
+    _, second = disc.discover_missing()  # extraction now comes from the LLM cache
+    assert "extract" not in second["llm_usage"]
+    assert "crawl_stats" not in first and "crawl_stats" not in second
+
+
+def test_harvest_against_stub(stubs, tmp_path, monkeypatch):
+    from wikidata_discover import harvester
+
+    monkeypatch.setattr(harvester, "get_store", lambda: EntityStore(tmp_path / "entities.sqlite"))
+    out = tmp_path / "universities.ndjson"
+    stats = fetch_us_universities(out)
+    records = [json.loads(line) for line in out.read_text().splitlines()]
+    assert len(records) == len(stubs.world.universities()) == stats["universities"]
+    assert {"qid": "Q49210", "label": "New York University", "website": "https://www.nyu.edu"} in records
+
+
+def test_sharded_harvest_against_stub(stubs, tmp_path, monkeypatch):
+    from wikidata_discover import harvester
+    from wikidata_discover.bench.stubs import answer_sparql
+
+    world = stubs.world
+    _, rows = answer_sparql(world, harvester._shard_query(("Q30", 0, 1), ["Q3918"]))
+    assert len(rows) == len(world.universities())
+    _, rows = answer_sparql(world, harvester._shard_query(("Q30", 0, 1), ["Q875538"]))
+    assert rows == []
+
+    monkeypatch.setattr(harvester, "get_store", lambda: EntityStore(tmp_path / "entities.sqlite"))
+    stats = harvester.harvest_countries(["Q30"], tmp_path / "world.ndjson", workers=2)
+    assert stats["universities"] == len(world.universities()) and stats["duplicates"] == 0
+
+
+def test_prefetched_searches_finish_inside_the_patch(tmp_path, monkeypatch):
+    monkeypatch.setattr(wikidata_api, "_SEARCH_CACHE_DIR", tmp_path)
+    monkeypatch.setattr(wikidata_api, "_search_memo", {})
+    with Stubs(latency=Latency.parse("fixed:0.3")).start().patched() as s:
+        with wikidata_api.SearchPrefetcher() as prefetch:
+            prefetch.submit("School of Law")
+            running = prefetch._futures["School of Law"]
+        assert running.done()  # joined before the production endpoint comes back
+    s.stop()
+    assert wikidata_api.SearchPrefetcher.wait_on_close is False
+
+
+def test_injected_faults_and_latency():
+    s = Stubs(faults=Faults(throttle_rate=1.0, retry_after=7)).start()
+    resp = requests.get(f"{s.env()['WD_API_URL']}?action=wbgetentities&ids=Q49210", timeout=10)
+    s.stop()
+    assert resp.status_code == 429 and resp.headers["Retry-After"] == "7"
+
+    rng = random.Random(1)
+    assert Latency.parse("fixed:0.25").sample(rng) == 0.25
+    assert 0.1 <= Latency.parse("uniform:0.1:0.2").sample(rng) <= 0.2
+    with pytest.raises(ValueError):
+        Latency.parse("gaussian:1")
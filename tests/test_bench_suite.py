@@ -0,0 +1,41 @@
+"""Tests for the benchmark runner and regression check (bench/suite.py)."""
+
+import json
+
+from wikidata_discover.bench import suite
+
+
+def _results(path, medians):
+    path.write_text(json.dumps({"benchmarks": {
+        name: {"group": "micro", "items": 10, "times_s": [m], "median_s": m, "min_s": m, "items_per_s": 10 / m}
+        for name, m in medians.items()
+    }}))
+    return path
+
+
+def test_compare_flags_slowdowns_beyond_threshold(tmp_path, capsys):
+    base = _results(tmp_path / "base.json", {"a": 1.0, "b": 1.0, "c": 1.0, "gone": 1.0})
+    new = _results(tmp_path / "new.json", {"a": 1.05, "b": 1.3, "c": 0.5})
+
+    rows = {r["name"]: r for r in suite.compare(base, new, threshold=0.1)}
+    assert set(rows) == {"a", "b", "c"}
+    assert [n for n, r in sorted(rows.items()) if r["regression"]] == ["b"]
+    assert rows["c"]["ratio"] == 0.5
+
+    assert suite.main(["compare", str(base), str(new)]) == 1
+    assert "only in one file" in capsys.readouterr().out
+    assert suite.main(["compare", str(base), str(new), "--threshold", "0.5"]) == 0
+
+
+def test_run_stores_selected_results(tmp_path):
+    out = suite.run(select="micro.normalize_name", repeats=2, out=tmp_path / "r.json")
+    data = json.loads(out.read_text())
+    assert list(data["benchmarks"]) == ["micro.normalize_name"]
+    result = data["benchmarks"]["micro.normalize_name"]
+    assert result["items"] == 10_000 and len(result["times_s"]) == 2
+    assert result["median_s"] > 0 and data["repeats"] == 2
+
+
+def test_crawl_benchmark_walks_the_whole_tree():
+    (bench,) = suite._crawl((250,))
+    bench.setup()()  # asserts that all 249 edges were found
@@ -0,0 +1,45 @@
+"""Tests for the shared multi-root crawl (hierarchy.crawl_many)."""
+
+from unittest import mock
+
+from wikidata_discover import entity_store, hierarchy
+from wikidata_discover.entity_store import EntityStore
+
+# a system (SYS) whose campuses A and B are also crawled as roots
+TREE = {
+    "SYS": [("A", "P355"), ("B", "P355")],
+    "A": [("A-law", "P361"), ("Shared", "P361")],
+    "B": [("B-med", "P361"), ("Shared", "P361")],
+    "Shared": [("Lab", "P527")],
+}
+
+
+def test_shared_subtrees_are_fetched_once(tmp_path):
+    batches = []
+
+    def fetch_batch(parents):
+        batches.append(sorted(parents))
+        return {p: list(TREE.get(p, [])) for p in parents}
+
+    def entities(qids, **_):
+        return {q: {"qid": q, "label": q, "aliases": [], "claims": {}, "lastrevid": 1} for q in qids}
+
+    store = EntityStore(tmp_path / "store.sqlite", max_age=3600)
+    with mock.patch.object(hierarchy, "fetch_edges_batch", fetch_batch), \
+            mock.patch.object(entity_store, "fetch_entities", entities):
+        views = hierarchy.crawl_many(["SYS", "A", "B"], store)
+
+        # one batched query per BFS level, and no node expanded twice
+        expanded = [q for batch in batches for q in batch]
+        assert len(expanded) == len(set(expanded)) == 7
+        assert batches[0] == ["A", "B", "SYS"]
+
+        assert views["A"].descendants("A") == {"A-law", "Shared", "Lab"}
+        assert views["B"].descendants("B") == {"B-med", "Shared", "Lab"}
+        assert len(views["SYS"].descendants("SYS")) == 6
+
+        # a second run is answered from the entity store
+        batches.clear()
+        hierarchy.crawl_many(["A"], store)
+        assert batches == []
+    store.close()
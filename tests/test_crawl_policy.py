@@ -0,0 +1,82 @@
+"""Tests for crawl budgets and P31 type pruning (crawl_policy.py)."""
+
+from unittest import mock
+
+import pytest
+from wikidata_discover import crawl_policy, entity_store, hierarchy
+from wikidata_discover.crawl_policy import CrawlPolicy, CrawlStats
+from wikidata_discover.entity_store import EntityStore
+
+TREE = {
+    "U": [("Law", "P361"), ("Hosp", "P355"), ("Med", "P361")],
+    "Law": [("Clinic", "P361")],
+    "Hosp": [("Ward", "P527"), ("Cafe", "P527")],
+    "Med": [("Anatomy", "P361")],
+    "Anatomy": [("Lab", "P361")],
+}
+TYPES = {"Law": ["Q2467461"], "Hosp": ["Q1059324"], "Med": ["Q494230"]}
+# university hospital (Q1059324) is a subclass of hospital (Q16917)
+CLOSURES = {"Q16917": {"Q16917", "Q1059324"}, "Q2385804": {"Q2385804", "Q2467461", "Q494230"}}
+
+
+@pytest.fixture
+def store(tmp_path):
+    def entities(qids, **_):
+        return {
+            q: {"qid": q, "label": q, "aliases": [], "claims": {"P31": TYPES.get(q, [])}, "lastrevid": 1}
+            for q in qids
+        }
+
+    s = EntityStore(tmp_path / "store.sqlite", max_age=3600)
+    with mock.patch.object(hierarchy, "fetch_edges_batch", lambda ps: {p: list(TREE.get(p, [])) for p in ps}), \
+            mock.patch.object(entity_store, "fetch_entities", entities), \
+            mock.patch.object(crawl_policy, "subclass_closure", lambda q, fetch=True: CLOSURES[q]):
+        yield s
+    s.close()
+
+
+def _crawl(store, **policy):
+    stats = CrawlStats()
+    graph = hierarchy.crawl_graph("U", store, CrawlPolicy(**policy), stats)
+    return graph.descendants("U"), stats
+
+
+def test_unlimited_crawl(store):
+    nodes, stats = _crawl(store)
+    assert nodes == {"Law", "Hosp", "Med", "Clinic", "Ward", "Cafe", "Anatomy", "Lab"}
+    assert stats.queries == 4 and stats.truncated is None  # one batched query per level
+
+
+def test_denied_type_is_kept_but_not_expanded(store):
+    nodes, stats = _crawl(store, deny_types=["Q16917"])
+    assert "Hosp" in nodes and "Ward" not in nodes
+    assert stats.pruned == {"type": 1} and stats.pruned_types == {"Q1059324": 1}
+    assert stats.truncated is None
+
+
+def test_allow_list_keeps_untyped_nodes(store):
+    nodes, stats = _crawl(store, allow_types=["Q2385804"])
+    assert {"Clinic", "Anatomy", "Lab"} <= nodes and "Ward" not in nodes
+
+
+def test_depth_nodes_and_query_budgets(store):
+    nodes, stats = _crawl(store, max_depth=1)
+    assert nodes == {"Law", "Hosp", "Med"}
+    assert stats.truncated == "max_depth" and stats.pruned["max_depth"] == 3
+
+    nodes, stats = _crawl(store, max_nodes=5)
+    assert len(nodes) == 4 and stats.truncated == "max_nodes"
+
+
+def test_query_budget_counts_only_fetches(store):
+    nodes, stats = _crawl(store, max_queries=2)
+    assert stats.queries == 2 and stats.truncated == "max_queries"
+    assert nodes == {"Law", "Hosp", "Med", "Clinic", "Ward", "Cafe", "Anatomy"}
+    # the same budget goes further once expansions are cached
+    nodes, stats = _crawl(store, max_queries=2)
+    assert stats.queries == 2 and stats.truncated is None and "Lab" in nodes
+
+
+def test_deadline(store):
+    nodes, stats = _crawl(store, deadline=0)
+    assert nodes == set() and stats.truncated == "deadline"
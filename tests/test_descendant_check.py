@@ -0,0 +1,53 @@
+"""Tests for the lazy "is X under the university" check used by discover."""
+
+from unittest import mock
+
+import pytest
+from wikidata_discover import discovery, hierarchy
+from wikidata_discover.discovery import Discovery
+from wikidata_discover.entity_store import EntityStore
+from wikidata_discover.graph import HierarchyGraph
+
+
+@pytest.fixture
+def store(tmp_path):
+    s = EntityStore(tmp_path / "store.sqlite", max_age=3600)
+    s.put_entities([{
+        "qid": "U", "label": "Test University", "aliases": [],
+        "claims": {"P856": ["https://u.edu"]}, "lastrevid": 1,
+    }])
+    yield s
+    s.close()
+
+
+def test_ancestry_query_is_batched():
+    queries = []
+
+    def sparql(query):
+        queries.append(query)
+        return [{"x": {"value": "http://www.wikidata.org/entity/Q2"}}]
+
+    with mock.patch.object(hierarchy, "execute_sparql_bindings", sparql):
+        assert hierarchy.descendants_among("Q1", ["Q2", "Q3", "Q2"]) == {"Q2"}
+    assert len(queries) == 1
+    assert "VALUES ?x { wd:Q2 wd:Q3 }" in queries[0]
+    assert "(wdt:P361|wdt:P749|^wdt:P527|^wdt:P355|^wdt:P199)+ wd:Q1" in queries[0]
+
+
+def test_no_crawl_and_no_query_when_all_matches_are_direct(store):
+    no_crawl = mock.Mock(side_effect=AssertionError("must not crawl"))
+    ancestry = mock.Mock(return_value={"Q9"})
+    with mock.patch.object(discovery, "refresh_graph", no_crawl), \
+            mock.patch.object(discovery, "descendants_among", ancestry):
+        disc = Discovery("U", store=store)
+        assert disc.descendants_among(set()) == set()
+        ancestry.assert_not_called()
+        assert disc.descendants_among({"Q9", "Q8"}) == {"Q9"}
+        ancestry.assert_called_once_with("U", ["Q8", "Q9"])
+
+
+def test_local_graph_is_used_when_available(store):
+    graph = HierarchyGraph.from_edges([("U", "A", "P361"), ("A", "B", "P361")], root="U")
+    with mock.patch.object(discovery, "descendants_among", mock.Mock(side_effect=AssertionError)):
+        disc = Discovery("U", store=store, hierarchy=graph)
+        assert disc.descendants_among({"B", "Z"}) == {"B"}
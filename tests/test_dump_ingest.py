@@ -0,0 +1,104 @@
+"""Tests for the offline hierarchy index built by dump_ingest.py."""
+
+import gzip
+import json
+from unittest import mock
+
+import pytest
+from wikidata_discover import crawl_policy, entity_store, harvester, hierarchy
+from wikidata_discover.discovery import Discovery
+from wikidata_discover.dump_ingest import ingest_dump, parse_lines
+from wikidata_discover.entity_store import EntityStore
+
+
+def _item(qid, label, **claims):
+    return {
+        "type": "item",
+        "id": qid,
+        "lastrevid": 7,
+        "labels": {"en": {"language": "en", "value": label}},
+        "aliases": {},
+        "claims": {
+            prop: [
+                {"mainsnak": {"datavalue": {"value": {"id": v}, "type": "wikibase-entityid"}}}
+                for v in values
+            ]
+            for prop, values in claims.items()
+        },
+    }
+
+
+ITEMS = [
+    _item("Q1", "Test University", P31=["Q3918"], P17=["Q30"], P355=["Q3"]),
+    _item("Q2", "School of Law", P31=["Q31855"], P361=["Q1"]),
+    _item("Q3", "Test University Press", P31=["Q2085381"]),
+    _item("Q4", "Law Clinic", P361=["Q2"]),
+    _item("Q5", "Unrelated Painting", P31=["Q3305213"]),
+    _item("Q6", "Foreign University", P31=["Q3918"], P17=["Q142"]),
+    # a university subclass outside UNIVERSITY_TYPES, with no hierarchy claims
+    _item("Q7", "Test Polytechnic", P31=["Q1371037"], P17=["Q30"]),
+]
+CLOSURE = {"Q3918", "Q1371037"}
+
+
+@pytest.fixture
+def dump(tmp_path):
+    path = tmp_path / "dump.json.gz"
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        f.write("[\n")
+        f.write(",\n".join(json.dumps(item) for item in ITEMS))
+        f.write("\n]\n")
+    return path
+
+
+def test_parse_lines_keeps_hierarchy_and_universities():
+    lines = ["[\n"] + [json.dumps(item) + ",\n" for item in ITEMS] + ["]\n"]
+    kept = {ent["qid"]: edges for ent, edges in parse_lines(lines)}
+    assert set(kept) == {"Q1", "Q2", "Q4", "Q6"}
+    assert kept["Q1"] == [("Q1", "Q3", "P355")]
+    assert kept["Q2"] == [("Q1", "Q2", "P361")]
+
+
+@pytest.fixture(autouse=True)
+def closure(monkeypatch):
+    monkeypatch.setattr(crawl_policy, "_closure_memo", {"Q3918": CLOSURE})
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_ingest_builds_offline_index(dump, tmp_path, workers):
+    out = tmp_path / "index.sqlite"
+    stats = ingest_dump(dump, out, workers=workers, chunk_lines=2)
+    # Q3 is only named by Q1's P355 and comes from the second pass
+    assert stats == {"entities": 5, "edges": 3, "referenced": 1}
+
+    index = EntityStore(out, offline=True)
+    never = mock.Mock(side_effect=AssertionError("offline index must not fetch"))
+    with mock.patch.object(entity_store, "fetch_entities", never):
+        assert sorted(index.children("Q1", never)) == [("Q2", "P361"), ("Q3", "P355")]
+        assert index.children("Q404", never) == []
+        found = index.get_entities(["Q1", "Q3", "Q404"])
+        assert set(found) == {"Q1", "Q3"}
+        assert found["Q3"]["label"] == "Test University Press"
+        assert found["Q3"]["types"] == ["Q2085381"]
+        us = [e["qid"] for e in index.find_by_type(["Q3918"], country="Q30")]
+        assert us == ["Q1"]
+        edges, labels = hierarchy.all_descendants("Q1", store=index)
+    assert {(p, c) for p, c, _, _ in edges} == {("Q1", "Q2"), ("Q1", "Q3"), ("Q2", "Q4")}
+    assert labels["Q4"] == "Law Clinic"
+    index.close()
+
+
+def test_offline_discover_and_harvest_see_referenced_items(dump, tmp_path, monkeypatch):
+    out = tmp_path / "index.sqlite"
+    ingest_dump(dump, out, workers=1)
+    index = EntityStore(out, offline=True)
+    monkeypatch.setattr(entity_store, "_store", index)
+    monkeypatch.setattr(crawl_policy, "_closure_memo", {})  # the index carries its classes
+
+    disc = Discovery("Q1", store=index, harvest=False)
+    assert sorted(disc.get_existing_children()) == [("Q2", "School of Law"), ("Q3", "Test University Press")]
+
+    harvested = tmp_path / "us.ndjson"
+    harvester.fetch_us_universities(harvested)
+    assert [r["qid"] for r in harvester.iter_universities(harvested)] == ["Q7", "Q1"]
+    index.close()
@@ -0,0 +1,69 @@
+"""Unit tests for the read-through EntityStore in entity_store.py."""
+
+from unittest import mock
+
+import pytest
+from wikidata_discover import entity_store
+from wikidata_discover.entity_store import EntityStore
+
+
+def _compact(qid, label, p31=(), website=None, rev=1):
+    return {
+        "qid": qid, "label": label, "aliases": [f"{label} alias"],
+        "claims": {"P31": list(p31), "P856": [website] if website else []},
+        "lastrevid": rev,
+    }
+
+
+@pytest.fixture
+def store(tmp_path):
+    s = EntityStore(tmp_path / "store.sqlite", max_age=3600)
+    yield s
+    s.close()
+
+
+def test_entities_are_fetched_once(store):
+    fake = mock.Mock(return_value={"Q1": _compact("Q1", "School of Law", ["Q31855"])})
+    with mock.patch.object(entity_store, "fetch_entities", fake):
+        first = store.get_entities(["Q1", "Q404"])
+        second = store.get_entities(["Q1"])
+    assert first["Q1"]["types"] == ["Q31855"]
+    assert second == {"Q1": first["Q1"]}
+    assert fake.call_count == 1
+
+
+def test_stale_entities_are_refetched(tmp_path):
+    store = EntityStore(tmp_path / "store.sqlite", max_age=0)
+    fake = mock.Mock(return_value={"Q1": _compact("Q1", "Law")})
+    with mock.patch.object(entity_store, "fetch_entities", fake):
+        store.get_entities(["Q1"])
+        store.get_entities(["Q1"])
+    assert fake.call_count == 2
+
+
+def test_put_basic_is_partial_and_never_overwrites_full_rows(store):
+    store.put_basic([("Q1", "Harvested", "https://a.edu"), ("Q2", "Other", None)])
+    assert store.lookup("Q1")["website"] == "https://a.edu"
+
+    fake = mock.Mock(return_value={"Q1": _compact("Q1", "Fetched", website="https://b.edu")})
+    with mock.patch.object(entity_store, "fetch_entities", fake):
+        # partial rows do not count as cached
+        assert store.get_entities(["Q1"])["Q1"]["label"] == "Fetched"
+    store.put_basic([("Q1", "Harvested again", None)])
+    assert store.lookup("Q1")["label"] == "Fetched"
+
+
+def test_children_read_through(store):
+    fetch = mock.Mock(return_value=[("Q2", "P361"), ("Q3", "P527"), ("Q2", "P361")])
+    assert store.children("Q1", fetch) == [("Q2", "P361"), ("Q3", "P527")]
+    assert store.children("Q1", fetch) == [("Q2", "P361"), ("Q3", "P527")]
+    assert fetch.call_count == 1
+    assert store.parents("Q3") == [("Q1", "P527")]
+
+
+def test_put_edges_many_replaces_in_one_transaction(store):
+    store.put_edges("Q1", [("Q9", "P361")])
+    store.put_edges_many({"Q1": [("Q2", "P361")], "Q5": []})
+    assert store.cached_children("Q1") == [("Q2", "P361")]
+    assert store.cached_children("Q5") == []
+    assert store._conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
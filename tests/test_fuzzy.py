@@ -1,7 +1,7 @@
-"""Unit tests for normalize_name and is_fuzzy_match in discovery.py."""
+"""Unit tests for normalize_name, is_fuzzy_match and shortlist_choices in discovery.py."""
 
 import pytest
-from wikidata_discover.discovery import normalize_name, is_fuzzy_match
+from wikidata_discover.discovery import normalize_name, is_fuzzy_match, shortlist_choices
 
 
 # ── normalize_name ──────────────────────────────────────────────────────────
@@ -99,3 +99,33 @@ class TestIsFuzzyMatchNegatives:
         # pilot revealed Missouri hallucinated extra schools
         # "School of Journalism" should not match "School of Medicine"
         assert not is_fuzzy_match("School of Journalism", "School of Medicine")
+
+
+# ── shortlist_choices ───────────────────────────────────────────────────────
+
+CHOICES = [(f"Q{i}", f"Department of Subject {i}") for i in range(40)] + [
+    ("Q100", "Leonard N. Stern School of Business"),
+    ("Q101", "Tisch School of the Arts"),
+]
+
+
+class TestShortlistChoices:
+    def test_keeps_best_match_within_k(self):
+        shortlist = shortlist_choices("Stern School of Business", CHOICES, k=5)
+        assert len(shortlist) == 5
+        assert shortlist[0] == ("Q100", "Leonard N. Stern School of Business")
+
+    def test_uses_alt_labels(self):
+        shortlist = shortlist_choices(
+            "NYU Tisch", CHOICES, k=3, alt_labels={"Q101": ["NYU Tisch"]}
+        )
+        assert shortlist[0][0] == "Q101"
+
+    def test_falls_back_to_full_list_on_low_score(self):
+        assert shortlist_choices("Zzyzx", CHOICES, k=5, min_score=60) == CHOICES
+
+    def test_short_lists_are_untouched(self):
+        assert shortlist_choices("Anything", CHOICES[:3], k=5) == CHOICES[:3]
+
+    def test_zero_k_disables(self):
+        assert shortlist_choices("Stern School", CHOICES, k=0) == CHOICES
@@ -0,0 +1,59 @@
+"""Tests for the CSR HierarchyGraph in graph.py."""
+
+import numpy as np
+import pytest
+from wikidata_discover.graph import HierarchyGraph
+
+EDGES = [
+    ("U", "Law", "P361"),
+    ("U", "Med", "P355"),
+    ("Law", "Clinic", "P361"),
+    ("Med", "Hospital", "P527"),
+    ("Hospital", "Ward", "P527"),
+]
+LABELS = {"U": "Test University", "Law": "School of Law", "Med": "School of Medicine"}
+TYPES = {"Law": ["law school"], "Med": ["medical school", "faculty"]}
+
+
+@pytest.fixture
+def graph():
+    return HierarchyGraph.from_edges(EDGES, LABELS, TYPES, root="U")
+
+
+def test_descendants_and_depth(graph):
+    assert graph.descendants("U") == {"Law", "Med", "Clinic", "Hospital", "Ward"}
+    assert graph.descendants("U", max_depth=1) == {"Law", "Med"}
+    assert graph.descendants("U", predicates=["P361"]) == {"Law", "Clinic"}
+    assert graph.descendants("Ward") == set()
+    assert graph.descendants("Q404") == set()
+
+
+def test_ancestors(graph):
+    assert graph.ancestors("Ward") == {"Hospital", "Med", "U"}
+    assert graph.ancestors("Ward", max_depth=2) == {"Hospital", "Med"}
+
+
+def test_edge_tuples_match_old_format(graph):
+    tuples = set(graph.edge_tuples())
+    assert ("U", "Med", "P355", "medical school") in tuples
+    assert ("U", "Med", "P355", "faculty") in tuples
+    assert ("Law", "Clinic", "P361", "—") in tuples
+    assert len(tuples) == len(EDGES) + 1
+    assert graph.labels_dict()["Clinic"] == "Clinic"
+    assert graph.children("U") == [("Med", "P355"), ("Law", "P361")]
+
+
+def test_cycles_terminate():
+    g = HierarchyGraph.from_edges([("A", "B", "P527"), ("B", "A", "P361")], root="A")
+    assert g.descendants("A") == {"B"}
+
+
+def test_save_and_mmap_load(graph, tmp_path):
+    graph.save(tmp_path / "g")
+    loaded = HierarchyGraph.load(tmp_path / "g")
+    assert isinstance(loaded.down["P527"][1], np.memmap)
+    assert loaded.descendants("U") == graph.descendants("U")
+    assert loaded.ancestors("Clinic") == {"Law", "U"}
+    assert set(loaded.edge_tuples()) == set(graph.edge_tuples())
+    assert loaded.label("Law") == "School of Law"
+    assert loaded.types_of("Med") == ["medical school", "faculty"]
@@ -0,0 +1,57 @@
+"""Tests for the indexed SQLite harvest store (harvest_store.py)."""
+
+import json
+from unittest import mock
+
+import pytest
+from wikidata_discover.discovery import Discovery
+from wikidata_discover.entity_store import EntityStore
+from wikidata_discover.harvest_store import HarvestStore, convert_harvest
+
+RECORDS = [
+    {"qid": "Q49210", "label": "New York University", "website": "https://www.nyu.edu"},
+    {"qid": "Q49115", "label": "Cornell University", "website": "https://www.cornell.edu"},
+    {"qid": "Q13371", "label": "Harvard University", "website": None},
+    {"qid": "Q1", "label": "New School 100%_", "website": None},
+]
+
+
+@pytest.fixture
+def harvest(tmp_path):
+    src = tmp_path / "u.ndjson"
+    src.write_text("".join(json.dumps(r) + "\n" for r in RECORDS))
+    assert convert_harvest(src, tmp_path / "u.sqlite") == 4
+    store = HarvestStore(tmp_path / "u.sqlite")
+    yield store
+    store.close()
+
+
+def test_lookup_prefix_search_iterate(harvest):
+    assert harvest.lookup("Q49115")["website"] == "https://www.cornell.edu"
+    assert harvest.lookup("Q404") is None
+    assert "Q13371" in harvest and len(harvest) == 4
+    assert [r["qid"] for r in harvest.by_prefix("new")] == ["Q1", "Q49210"]
+    assert [r["qid"] for r in harvest.search("university")] == ["Q49115", "Q13371", "Q49210"]
+    assert [r["qid"] for r in harvest.search("100%_")] == ["Q1"]
+    assert [r["qid"] for r in harvest.search("york")] == ["Q49210"]
+    assert sorted(r["qid"] for r in harvest) == sorted(r["qid"] for r in RECORDS)
+
+
+def test_convert_legacy_bindings(tmp_path):
+    src = tmp_path / "universities_us.json"
+    src.write_text(json.dumps([
+        {"university": {"value": "http://www.wikidata.org/entity/Q2820388"},
+         "universityLabel": {"value": "Q2820388"}},
+    ], indent=2))
+    convert_harvest(src, tmp_path / "legacy.sqlite")
+    assert HarvestStore(tmp_path / "legacy.sqlite").lookup("Q2820388")["label"] == "Q2820388"
+
+
+def test_discovery_takes_label_and_website_from_harvest(harvest, tmp_path):
+    store = EntityStore(tmp_path / "entities.sqlite")
+    with mock.patch.object(store, "get_entities", side_effect=AssertionError("no lookup")):
+        disc = Discovery("Q49210", store=store, harvest=harvest)
+    assert (disc.university_label, disc.university_website) == (
+        "New York University", "https://www.nyu.edu"
+    )
+    store.close()
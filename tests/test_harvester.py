@@ -0,0 +1,145 @@
+"""Tests for the streaming harvester and its NDJSON reader."""
+
+import json
+from unittest import mock
+
+import pytest
+import requests
+from wikidata_discover import harvester
+from wikidata_discover.entity_store import EntityStore
+
+
+def _rows(n):
+    for i in range(n):
+        yield {"univ": f"http://www.wikidata.org/entity/Q{i}", "website": f"https://u{i}.edu" if i % 2 else ""}
+        if i == 3:  # a second website for the same QID
+            yield {"univ": "http://www.wikidata.org/entity/Q3", "website": "https://other.edu"}
+
+
+@pytest.fixture
+def store(tmp_path):
+    s = EntityStore(tmp_path / "store.sqlite", max_age=3600)
+    with mock.patch.object(harvester, "get_store", lambda: s):
+        yield s
+    s.close()
+
+
+def test_harvest_streams_ndjson(store, tmp_path):
+    lookups = []
+
+    def labels(qids, props):
+        lookups.append(list(qids))
+        return {q: {"label": f"University {q}"} for q in qids if q != "Q7"}
+
+    out = tmp_path / "u.ndjson"
+    with mock.patch.object(harvester, "stream_sparql_rows", lambda q: _rows(120)), \
+            mock.patch.object(harvester, "get_entities", labels):
+        stats = harvester.fetch_us_universities(out, show_table=True)
+
+    assert stats == {"universities": 120, "with_website": 60}
+    assert [len(batch) for batch in lookups] == [50, 50, 20]
+    records = list(harvester.iter_universities(out))
+    assert len(records) == len(out.read_text().splitlines()) == 120
+    assert records[3] == {"qid": "Q3", "label": "University Q3", "website": "https://u3.edu"}
+    assert records[7]["label"] == "Q7"
+    assert store.lookup("Q5")["website"] == "https://u5.edu"
+    assert not (tmp_path / "u.ndjson.part").exists()
+
+
+def test_iter_universities_reads_legacy_formats(tmp_path):
+    pairs = tmp_path / "pairs.json"
+    pairs.write_text(json.dumps([["Q1", "Alpha"], ["Q2", "Beta"]], indent=2))
+    assert [r["label"] for r in harvester.iter_universities(pairs)] == ["Alpha", "Beta"]
+
+    bindings = tmp_path / "bindings.json"
+    bindings.write_text(json.dumps([{
+        "university": {"type": "uri", "value": "http://www.wikidata.org/entity/Q49210"},
+        "universityLabel": {"xml:lang": "en", "type": "literal", "value": "New York University"},
+    }]))
+    assert list(harvester.iter_universities(bindings)) == [
+        {"qid": "Q49210", "label": "New York University", "website": None}
+    ]
+
+
+def test_sharded_harvest_splits_dedupes_and_resumes(store, tmp_path):
+    from wikidata_discover import crawl_policy
+    from wikidata_discover.sparql_helpers import QueryTimeout
+
+    queries = []
+
+    def rows(query):
+        queries.append(query)
+        assert "FILTER" not in query
+        if "wd:Q30 ." in query:
+            if "VALUES ?type { wd:Q3918 wd:Q875538 }" in query:
+                raise QueryTimeout("too big")
+            qids = ["Q1", "Q2"] if "VALUES ?type { wd:Q3918 }" in query else ["Q900000000"]
+        else:
+            assert "VALUES ?type { wd:Q3918 wd:Q875538 }" in query
+            qids = ["Q3", "Q2"]  # Q2 also lists a second country
+        return iter([{"univ": f"http://www.wikidata.org/entity/{q}", "website": ""} for q in qids])
+
+    out = tmp_path / "world.ndjson"
+    with mock.patch.object(harvester, "stream_sparql_rows", rows), \
+            mock.patch.object(harvester, "get_entities", lambda qids, props: {}), \
+            mock.patch.object(crawl_policy, "subclass_closure", lambda q, fetch=True: {"Q3918", "Q875538"}):
+        stats = harvester.harvest_countries(["Q30", "Q145"], out, workers=2)
+        assert stats["universities"] == 4 and stats["splits"] == 1 and stats["duplicates"] == 1
+        records = list(harvester.iter_universities(out))
+        assert sorted(r["qid"] for r in records) == ["Q1", "Q2", "Q3", "Q900000000"]
+        assert {r["country"] for r in records if r["qid"] == "Q3"} == {"Q145"}
+
+        # resume: everything is done, nothing is queried again
+        queries.clear()
+        harvester.harvest_countries(["Q30", "Q145"], out, workers=2)
+        assert queries == []
+        assert len(list(harvester.iter_universities(out))) == 4
+
+
+def test_failed_shard_is_recorded_and_retried(store, tmp_path):
+    from wikidata_discover import crawl_policy
+    from wikidata_discover.sparql_helpers import QueryTimeout
+
+    queries, broken = [], {"Q30"}
+
+    def rows(query):
+        queries.append(query)
+        country = "Q30" if "wd:Q30 ." in query else "Q145"
+        if country in broken:
+            raise QueryTimeout("single class still too big")
+        qid = "Q1" if country == "Q30" else "Q3"
+        return iter([{"univ": f"http://www.wikidata.org/entity/{qid}", "website": ""}])
+
+    out = tmp_path / "world.ndjson"
+    with mock.patch.object(harvester, "stream_sparql_rows", rows), \
+            mock.patch.object(harvester, "get_entities", lambda qids, props: {}), \
+            mock.patch.object(crawl_policy, "subclass_closure", lambda q, fetch=True: {"Q3918"}):
+        stats = harvester.harvest_countries(["Q30", "Q145"], out, workers=2)
+        assert stats["failed"] == 1 and stats["universities"] == 1
+        progress = json.loads((tmp_path / "world.ndjson.progress.json").read_text())
+        assert progress["failed"] == ["Q30:0-1"] and progress["done"] == ["Q145:0-1"]
+
+        # a rerun retries only the failed shard
+        broken.clear()
+        queries.clear()
+        stats = harvester.harvest_countries(["Q30", "Q145"], out, workers=2)
+        assert len(queries) == 1 and stats["failed"] == 0
+        progress = json.loads((tmp_path / "world.ndjson.progress.json").read_text())
+        assert progress["failed"] == []
+    assert sorted(r["qid"] for r in harvester.iter_universities(out)) == ["Q1", "Q3"]
+
+
+@pytest.mark.parametrize("status,body,timeout", [
+    (500, "java.util.concurrent.TimeoutException", True),
+    (504, "<html>Gateway Time-out</html>", True),
+    (502, "upstream request timeout", True),
+    (500, "MalformedQueryException", False),
+    (429, "Too Many Requests", False),
+])
+def test_wdqs_timeouts_are_query_timeouts(status, body, timeout):
+    from wikidata_discover import sparql_helpers
+
+    resp = requests.Response()
+    resp.status_code = status
+    resp._content = body.encode()
+    assert sparql_helpers._is_timeout(resp) is timeout
@@ -0,0 +1,125 @@
+"""Tests for lastrevid-based incremental hierarchy refresh in hierarchy.py."""
+
+from unittest import mock
+
+import pytest
+from wikidata_discover import entity_store, hierarchy
+from wikidata_discover.entity_store import EntityStore
+
+
+class FakeWikidata:
+    """Mutable tree standing in for WDQS + wbgetentities."""
+
+    def __init__(self):
+        self.edges = {"U": [("Law", "P361"), ("Med", "P355")], "Law": [("Clinic", "P361")]}
+        self.revs = {"U": 1, "Law": 1, "Med": 1, "Clinic": 1}
+        self.expanded = []
+
+    def fetch_edges(self, parent):
+        self.expanded.append(parent)
+        return list(self.edges.get(parent, []))
+
+    def fetch_edges_batch(self, parents):
+        return {p: self.fetch_edges(p) for p in parents}
+
+    def revisions(self, qids):
+        return {q: self.revs[q] for q in qids if q in self.revs}
+
+    def incoming(self, nodes):
+        return {
+            (p, c, prop) for p, kids in self.edges.items() if p in nodes
+            for c, prop in kids if prop in hierarchy.PREDICATES_UP
+        }
+
+    def entities(self, qids, **_):
+        return {
+            q: {"qid": q, "label": q.lower(), "aliases": [], "claims": {}, "lastrevid": self.revs[q]}
+            for q in qids if q in self.revs
+        }
+
+
+@pytest.fixture
+def wd(tmp_path):
+    fake = FakeWikidata()
+    with mock.patch.object(hierarchy, "fetch_edges_batch", fake.fetch_edges_batch), \
+            mock.patch.object(hierarchy, "get_revisions", fake.revisions), \
+            mock.patch.object(hierarchy, "fetch_incoming_edges", fake.incoming), \
+            mock.patch.object(hierarchy, "sleep", lambda _: None), \
+            mock.patch.object(entity_store, "fetch_entities", fake.entities):
+        yield fake
+
+
+def test_refresh_reexpands_only_changed_nodes(wd, tmp_path):
+    # max_age=0: the entity store never answers from cache, so any reuse comes from the snapshot
+    store = EntityStore(tmp_path / "store.sqlite", max_age=0)
+    snap = tmp_path / "snap"
+
+    graph, diff = hierarchy.refresh_graph("U", store, snap)
+    assert diff["full_crawl"] and graph.descendants("U") == {"Law", "Med", "Clinic"}
+    assert sorted(wd.expanded) == ["Clinic", "Law", "Med", "U"]
+
+    wd.expanded.clear()
+    graph, diff = hierarchy.refresh_graph("U", store, snap)
+    assert wd.expanded == []
+    assert diff["changed"] == [] and diff["added"] == diff["removed"] == []
+
+    # Med gains a part (its revision changes); a new item claims P361 Law
+    wd.edges["Med"] = [("Hospital", "P527")]
+    wd.edges["Law"].append(("Library", "P361"))
+    wd.revs.update({"Med": 2, "Hospital": 1, "Library": 1})
+    graph, diff = hierarchy.refresh_graph("U", store, snap)
+    assert sorted(wd.expanded) == ["Hospital", "Law", "Library", "Med"]
+    assert diff["changed"] == ["Law", "Med"]
+    assert diff["added"] == [("Law", "Library", "P361"), ("Med", "Hospital", "P527")]
+    assert graph.label("Hospital") == "hospital"
+
+    path = hierarchy.write_change_report(diff, tmp_path / "reports")
+    assert path.name == "U_hierarchy_changes.json"
+    store.close()
+
+
+def test_refresh_expands_nodes_a_bounded_crawl_left_unexpanded(wd, tmp_path):
+    from wikidata_discover.crawl_policy import CrawlPolicy
+
+    store = EntityStore(tmp_path / "store.sqlite", max_age=0)
+    snap = tmp_path / "snap"
+    # a P355 child is not an incoming P361/P749 claim, so only expanding Med finds it
+    wd.edges["Med"] = [("Lab", "P355")]
+    wd.revs["Lab"] = 1
+
+    graph, _ = hierarchy.refresh_graph("U", store, snap, policy=CrawlPolicy(max_depth=1))
+    assert graph.descendants("U") == {"Law", "Med"} and wd.expanded == ["U"]
+
+    # Med's revision is unchanged, but it was never expanded
+    wd.expanded.clear()
+    graph, diff = hierarchy.refresh_graph("U", store, snap, policy=CrawlPolicy())
+    assert sorted(wd.expanded) == ["Clinic", "Lab", "Law", "Med"]
+    assert diff["changed"] == ["Law"]  # the incoming P361 from Clinic
+    assert diff["added"] == [("Law", "Clinic", "P361"), ("Med", "Lab", "P355")]
+    assert graph.descendants("U") == {"Law", "Med", "Clinic", "Lab"}
+
+    wd.expanded.clear()
+    hierarchy.refresh_graph("U", store, snap, policy=CrawlPolicy())
+    assert wd.expanded == []
+    store.close()
+
+
+def test_snapshot_edges_are_fetched_not_read_from_stale_store_rows(wd, tmp_path):
+    # a week-long max_age: store rows written before the edits below stay "fresh"
+    store = EntityStore(tmp_path / "store.sqlite", max_age=7 * 86400)
+    snap = tmp_path / "snap"
+    store.put_edges("Med", [])
+    store.put_edges("Library", [])
+    wd.edges["Med"] = [("Hospital", "P527")]
+    wd.revs.update({"Hospital": 1, "Library": 1, "Room": 1})
+
+    graph, _ = hierarchy.refresh_graph("U", store, snap)
+    assert "Hospital" in graph.descendants("U")
+
+    # Library joins the tree with edits its stored row predates
+    wd.edges["Law"].append(("Library", "P361"))
+    wd.edges["Library"] = [("Room", "P527")]
+    graph, diff = hierarchy.refresh_graph("U", store, snap)
+    assert ("Library", "Room", "P527") in diff["added"]
+    assert "Room" in graph.descendants("U")
+    store.close()
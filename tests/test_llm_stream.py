@@ -0,0 +1,119 @@
+"""Unit tests for streamed extraction and match prompt layout in llm_helpers.py."""
+
+import json
+from types import SimpleNamespace
+from unittest import mock
+
+import pytest
+from wikidata_discover import llm_helpers
+from wikidata_discover.llm_helpers import LLMHelper, _UnitsStreamParser, _stream_units
+
+PAYLOAD = json.dumps({
+    "units": [
+        {"name": "School of Law", "unit_type": "school", "city": "New York",
+         "state": "NY", "website": None},
+        "Tisch School of the Arts",
+        {"name": 'College of "Arts" and [Science]', "unit_type": "college",
+         "city": "New York", "state": "NY", "website": "https://cas.nyu.edu"},
+    ],
+    "reference": "https://www.nyu.edu/academics/schools-and-colleges.html",
+})
+
+
+def test_units_are_yielded_as_soon_as_complete():
+    parser = _UnitsStreamParser()
+    seen_at = []
+    for i, ch in enumerate(PAYLOAD):
+        for itm in parser.feed(ch):
+            seen_at.append((i, itm))
+    assert [itm if isinstance(itm, str) else itm["name"] for _, itm in seen_at] == [
+        "School of Law", "Tisch School of the Arts", 'College of "Arts" and [Science]',
+    ]
+    # the first unit is available long before the response finishes
+    assert seen_at[0][0] < len(PAYLOAD) // 2
+    assert parser.done
+
+
+def test_markdown_wrapped_response():
+    parser = _UnitsStreamParser()
+    items = parser.feed("Here you go:\n```json\n" + PAYLOAD[:40])
+    items += parser.feed(PAYLOAD[40:] + "\n```")
+    assert len(items) == 3
+
+
+def test_stream_units_normalizes_and_caches_full_list():
+    chunks = [PAYLOAD[i:i + 7] for i in range(0, len(PAYLOAD), 7)]
+    with mock.patch.object(llm_helpers, "_save_cache") as save:
+        units = list(_stream_units("openai", "NYU", chunks, "key"))
+    assert units[1] == {"name": "Tisch School of the Arts"}
+    save.assert_called_once_with("key", units)
+
+
+def test_stream_units_does_not_cache_truncated_response():
+    with mock.patch.object(llm_helpers, "_save_cache") as save:
+        units = list(_stream_units("openai", "NYU", [PAYLOAD[:150]], "key"))
+    assert units[0]["name"] == "School of Law"
+    save.assert_not_called()
+
+
+def _providers(**behaviour):
+    """stream_divisions stand-in: each provider yields its units, then maybe raises."""
+    def stream(provider, label, website):
+        units, error = behaviour[provider]
+        yield from ({"name": n} for n in units)
+        if error:
+            raise RuntimeError(error)
+    keys = {k: "key" for k in ("OPENAI_API_KEY", "ANTHROPIC_API_KEY", "GOOGLE_API_KEY")}
+    return mock.patch.object(LLMHelper, "stream_divisions", stream), mock.patch.multiple(llm_helpers, **keys)
+
+
+def test_best_available_stream_raises_when_every_provider_fails():
+    patch_stream, patch_keys = _providers(
+        openai=([], "boom"), anthropic=([], None), gemini=([], "quota"),
+    )
+    with patch_stream, patch_keys:
+        units = LLMHelper.stream_divisions_best_available("NYU", "https://nyu.edu")
+        with pytest.raises(ValueError):
+            list(units)
+
+
+def test_best_available_stream_reports_a_partial_failure():
+    patch_stream, patch_keys = _providers(
+        openai=([], "boom"), anthropic=(["School of Law", "School of Dance"], "connection reset"),
+        gemini=(["never asked"], None),
+    )
+    with patch_stream, patch_keys:
+        units = LLMHelper.stream_divisions_best_available("NYU", "https://nyu.edu")
+        assert [u["name"] for u in units] == ["School of Law", "School of Dance"]
+    assert units.provider == "anthropic"
+    assert units.error == "anthropic failed after 2 units: connection reset"
+
+
+def _anthropic(answer):
+    resp = SimpleNamespace(content=[SimpleNamespace(text=answer)], usage=None)
+    client = SimpleNamespace(messages=SimpleNamespace(create=mock.Mock(return_value=resp)))
+    return client, mock.patch.multiple(
+        llm_helpers, _get_openai_client=mock.Mock(side_effect=ValueError("no key")),
+        _get_anthropic_client=lambda: client,
+    )
+
+
+def test_cache_mark_only_on_prefixes_long_enough_to_cache():
+    small = [("Q1", "School of Law")]
+    large = [(f"Q{i}", f"School of Subject Number {i}") for i in range(1, 201)]
+    assert not LLMHelper.match_prefix_cacheable("U", small)
+    assert LLMHelper.match_prefix_cacheable("U", large)
+
+    for children, cached in ((small, False), (large, True)):
+        client, patched = _anthropic("Q1")
+        with patched:
+            assert LLMHelper.choose_match("Law School", "U", children, extra=[("Q9", "Law")]) == children[0]
+        prefix, suffix = client.messages.create.call_args.kwargs["messages"][0]["content"]
+        assert ("cache_control" in prefix) is cached and "cache_control" not in suffix
+        assert suffix["text"] == f"[{len(children) + 1}] Q9 -- Law\n\nCANDIDATE: Law School"
+
+    # the judge prompt is far below the minimum: nothing to mark
+    client, patched = _anthropic('{"keep": ["School of Law"]}')
+    with patched:
+        assert LLMHelper.judge_union("U", ["School of Law"], "anthropic") == ["School of Law"]
+    assert client.messages.create.call_args.kwargs["system"] == llm_helpers.JUDGE_INSTRUCTIONS
@@ -0,0 +1,72 @@
+"""Tests for the batched multi-university prefetch (discovery.prefetch_universities)."""
+
+from unittest import mock
+
+from wikidata_discover import discovery, entity_store
+from wikidata_discover.discovery import Discovery, prefetch_universities
+from wikidata_discover.entity_store import EntityStore
+
+
+def test_prefetch_batches_and_preloads(tmp_path):
+    qids = [f"U{i}" for i in range(120)]
+    entity_calls, edge_calls = [], []
+
+    def entities(ids, **_):
+        ids = list(ids)
+        entity_calls.append(ids)
+        return {
+            q: {"qid": q, "label": f"{q} label", "aliases": [f"{q} alias"],
+                "claims": {"P856": [f"https://{q}.edu"]}, "lastrevid": 1}
+            for q in ids if q != "U7"
+        }
+
+    def edges(parents):
+        edge_calls.append(list(parents))
+        return {p: [(f"{p}-law", "P361"), (f"{p}-part", "P527")] for p in parents}
+
+    store = EntityStore(tmp_path / "store.sqlite", max_age=3600)
+    with mock.patch.object(entity_store, "fetch_entities", entities), \
+            mock.patch.object(discovery, "fetch_edges_batch", edges):
+        state = prefetch_universities(qids, store)
+
+        # one entity pass for universities, one batched edge pass, one for children
+        assert len(entity_calls) == 2 and len(edge_calls) == 1
+        assert "U7" not in state and len(state) == 119
+        assert set(state["U3"]["children"]) == {"U3-law"}  # P527 is not a direct link
+
+        def offline(*_, **__):
+            raise AssertionError("preloaded Discovery must not query")
+
+        with mock.patch.object(store, "get_entities", offline), \
+                mock.patch.object(store, "children", offline):
+            disc = Discovery("U3", store=store, harvest=None, preloaded=state["U3"])
+            assert disc.university_website == "https://U3.edu"
+            assert disc.get_existing_children() == [("U3-law", "U3-law label")]
+            assert disc.get_children_alt_labels() == {"U3-law": ["U3-law alias"]}
+
+        # a second prefetch finds the edges in the entity store
+        prefetch_universities(qids[:5], store)
+        assert len(edge_calls) == 1
+    store.close()
+
+
+def test_match_divisions_searches_only_unresolved_names(tmp_path):
+    from wikidata_discover import wikidata_api
+
+    store = EntityStore(tmp_path / "store.sqlite", max_age=3600)
+    state = {
+        "label": "Test University", "website": None,
+        "children": {"U3-law": {"label": "School of Law", "aliases": ["Law School"]}},
+    }
+    searched = []
+
+    def search(label):
+        searched.append(label)
+        return []
+
+    with mock.patch.object(wikidata_api, "cached_wd_search", search):
+        disc = Discovery("U3", store=store, harvest=None, preloaded=state)
+        rows = disc.match_divisions([{"name": "School of Law"}, {"name": "Quantum Basketweaving"}])
+    assert [r["status"] for r in rows] == ["linked", "missing"]
+    assert searched == ["Quantum Basketweaving"]
+    store.close()
@@ -0,0 +1,61 @@
+"""Tests for yield-aware ordering of batch discover (prioritize.py)."""
+
+import json
+from unittest import mock
+
+import pytest
+from wikidata_discover import prioritize
+from wikidata_discover.entity_store import EntityStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    s = EntityStore(tmp_path / "store.sqlite", max_age=3600)
+    # Q1's edges are cached: two linked children, one P527 part that does not count
+    s.put_edges("Q1", [("A", "P361"), ("B", "P749"), ("C", "P527"), ("A", "P355")])
+    yield s
+    s.close()
+
+
+def test_child_counts_batch_uncached_qids(store):
+    queries = []
+
+    def sparql(query):
+        queries.append(query)
+        return [
+            {"u": {"value": "http://www.wikidata.org/entity/Q2"}, "n": {"value": "12"}},
+            {"u": {"value": "http://www.wikidata.org/entity/Q3"}, "n": {"value": "0"}},
+        ]
+
+    with mock.patch.object(prioritize, "execute_sparql_bindings", sparql):
+        counts = prioritize.count_children(["Q1", "Q2", "Q3", "Q4"], store)
+    assert counts == {"Q1": 2, "Q2": 12, "Q3": 0, "Q4": 0}
+    assert len(queries) == 1
+    assert "VALUES ?u { wd:Q2 wd:Q3 wd:Q4 }" in queries[0]
+
+
+def test_rank_prefers_expected_yield(store, tmp_path):
+    reports = tmp_path / "reports"
+    reports.mkdir()
+    for qid, size in (("Q5", 14), ("Q9", 6)):
+        (reports / f"{qid}_report.json").write_text(
+            json.dumps({"university_qid": qid, "total_candidates": size, "missing": 3})
+        )
+    (reports / "Q5_hierarchy_changes.json").write_text("{}")
+    counts = {"Q1": 2, "Q2": 12, "Q3": 0, "Q4": 0, "Q5": 0}
+    records = {
+        "Q3": {"qid": "Q3", "label": "Alpha University", "website": "https://a.edu"},
+        "Q4": {"qid": "Q4", "label": "Q4", "website": None},
+    }
+
+    with mock.patch.object(prioritize, "count_children", lambda qids, store=None: counts):
+        ranked = prioritize.rank_universities(
+            ["Q1", "Q2", "Q3", "Q4", "Q5"], records, store=store, harvest=None, reports_dir=reports
+        )
+
+    # expected size is the mean report size (10): Q3 has nothing linked and a
+    # website, Q4 has no label or website, Q5 was already processed
+    assert [r["qid"] for r in ranked] == ["Q3", "Q1", "Q4", "Q5", "Q2"]
+    assert ranked[0]["score"] == pytest.approx(11 * 1.2)
+    assert ranked[-1]["score"] == 1.0
+    assert ranked[3]["reported"] and not ranked[0]["reported"]
@@ -0,0 +1,134 @@
+"""Tests for recursive discovery on the budgeted frontier (recursive.py)."""
+
+import json
+from unittest import mock
+
+import pytest
+from wikidata_discover import llm_helpers, recursive, wikidata_api
+from wikidata_discover.llm_helpers import LLMHelper
+from wikidata_discover.recursive import RecursionBudget, RecursiveDiscovery
+
+# Wikidata: label, website and linked children of each existing unit
+WIKIDATA = {
+    "Q1": ("Test University", ["Q10", "Q11"]),
+    "Q10": ("School of Law", ["Q100"]),
+    "Q11": ("School of Medicine", []),
+    "Q100": ("Department of Torts", []),
+}
+
+# what the model extracts, keyed by (unit, enclosing units)
+EXTRACTED = {
+    ("Test University", None): ["School of Law", "School of Medicine", "School of Dance"],
+    ("School of Law", "Test University"): ["Department of Torts", "Property Law Program"],
+    ("School of Medicine", "Test University"): ["Department of Surgery"],
+    ("School of Dance", "Test University"): ["Ballet Program"],
+    ("Department of Torts", "Test University > School of Law"): ["Tort Clinic"],
+}
+
+
+def _state(qid):
+    label, kids = WIKIDATA[qid]
+    return {
+        "label": label,
+        "website": None,
+        "children": {k: {"label": WIKIDATA[k][0], "aliases": []} for k in kids},
+    }
+
+
+@pytest.fixture
+def world():
+    calls = {"extract": [], "prefetch": []}
+
+    def extract(label, website, parent=None):
+        calls["extract"].append((label, parent))
+        llm_helpers._add_usage({
+            "call": "extract", "provider": "openai", "model": "m", "input_tokens": 80,
+            "output_tokens": 20, "cache_read_tokens": 0, "cache_write_tokens": 0, "latency_s": 0.0,
+        })
+        return [{"name": n, "unit_type": "department"} for n in EXTRACTED.get((label, parent), [])]
+
+    def prefetch(qids, store=None):
+        calls["prefetch"].append(sorted(set(qids)))
+        return {q: _state(q) for q in qids if q in WIKIDATA}
+
+    with mock.patch.object(LLMHelper, "extract_divisions_best_available", extract), \
+            mock.patch.object(LLMHelper, "choose_match", lambda *a, **k: None), \
+            mock.patch.object(recursive, "prefetch_universities", prefetch), \
+            mock.patch.object(wikidata_api, "cached_wd_search", lambda label: []):
+        yield calls
+
+
+def test_full_tree_level_by_level(world, tmp_path):
+    run = RecursiveDiscovery(
+        "Q1", RecursionBudget(max_depth=3), workers=2, store=mock.Mock(offline=True),
+        state_path=tmp_path / "Q1.json",
+    )
+    summary = run.run()
+
+    assert summary["by_depth"] == {
+        "1": {"linked": 2, "orphan": 0, "missing": 1},
+        "2": {"linked": 1, "orphan": 0, "missing": 3},
+        "3": {"linked": 0, "orphan": 0, "missing": 1},
+    }
+    assert summary["stopped"] is None and summary["usage"]["llm_calls"] == 8
+    # existing schools are expanded before the new one, with the parent chain as context
+    assert world["extract"][0] == ("Test University", None)
+    assert ("Department of Torts", "Test University > School of Law") in world["extract"]
+    assert world["extract"].index(("School of Dance", "Test University")) > \
+        world["extract"].index(("School of Medicine", "Test University"))
+    # one batched Wikidata load per level
+    assert world["prefetch"] == [["Q1"], ["Q10", "Q11"], ["Q100"]]
+
+    tree = run.tree()
+    law = next(c for c in tree["children"] if c["qid"] == "Q10")
+    assert [c["name"] for c in law["children"]] == ["Department of Torts", "Property Law Program"]
+    rows = run.missing_rows()
+    assert rows[0]["name"] == "School of Dance" and rows[0]["parent_qid"] == "Q1"
+    assert rows[-1]["path"] == "Test University > School of Law > Department of Torts"
+
+
+def test_budget_stops_and_run_resumes(world, tmp_path):
+    path = tmp_path / "Q1.json"
+    store = mock.Mock(offline=True)
+    first = RecursiveDiscovery(
+        "Q1", RecursionBudget(max_depth=2, max_llm_calls=2), workers=1, store=store, state_path=path,
+    )
+    summary = first.run()
+    assert summary["stopped"] == "llm_calls"
+    assert summary["states"]["pending"] == 2
+    assert json.loads(path.read_text())["root"] == "Q1"
+
+    world["extract"].clear()
+    second = RecursiveDiscovery("Q1", RecursionBudget(max_depth=2), workers=1, store=store, state_path=path)
+    summary = second.run()
+    assert summary["stopped"] is None and "pending" not in summary["states"]
+    assert [label for label, _ in world["extract"]] == ["School of Medicine", "School of Dance"]
+
+    # a deeper rerun expands only the previous leaves
+    world["extract"].clear()
+    third = RecursiveDiscovery("Q1", RecursionBudget(max_depth=3), workers=1, store=store, state_path=path)
+    third.run()
+    assert len(world["extract"]) == 4
+    assert ("Department of Torts", "Test University > School of Law") in world["extract"]
+    assert third.summary()["by_depth"]["3"] == {"linked": 0, "orphan": 0, "missing": 1}
+
+
+def test_budget_limits():
+    budget = RecursionBudget(max_tokens=150)
+    with budget.running():
+        assert budget.exhausted() is None
+        llm_helpers._add_usage({"input_tokens": 100, "output_tokens": 60})
+        assert budget.exhausted() == "tokens"
+    budget = RecursionBudget(deadline=0)
+    with budget.running():
+        assert budget.exhausted() == "deadline"
+
+
+def test_sub_unit_prompt_and_cache_key():
+    system, user = llm_helpers._extract_prompt("School of Law", "https://law.u.edu", "Test University")
+    assert system is llm_helpers.SYSTEM_EXTRACT_SUBUNITS
+    assert user == "School of Law (part of Test University) -- https://law.u.edu"
+    assert llm_helpers._extract_prompt("Test University", None)[0] is llm_helpers.SYSTEM_EXTRACT
+    # top-level keys are unchanged, so existing extraction caches stay valid
+    assert llm_helpers._cache_key("X", "openai", "m") == llm_helpers._cache_key("X", "openai", "m", None)
+    assert llm_helpers._cache_key("X", "openai", "m") != llm_helpers._cache_key("X", "openai", "m", "P")
@@ -0,0 +1,97 @@
+"""Tests for recording and replaying external responses (replay.py)."""
+
+from types import SimpleNamespace
+from unittest import mock
+
+import pytest
+from wikidata_discover import config, llm_helpers, replay, wikidata_api
+from wikidata_discover.replay import ReplayMissError
+
+
+@pytest.fixture(autouse=True)
+def _stopped():
+    yield
+    replay.stop()
+
+
+def _entity(qid, label):
+    return {"id": qid, "labels": {"en": {"value": label}}, "claims": {}, "lastrevid": 1}
+
+
+class FakeResponse:
+    def __init__(self, data):
+        self.data = data
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.data
+
+
+def _live_get(calls):
+    def get(url, params=None, **kwargs):
+        calls.append(params or url)
+        if params:
+            ids = params["ids"].split("|")
+            return FakeResponse({"entities": {q: _entity(q, f"Label {q}") for q in ids}})
+        return FakeResponse({"search": [{"id": "Q5", "label": "School of Law"}]})
+    return get
+
+
+def test_wikidata_requests_replay_offline(tmp_path):
+    calls = []
+    replay.start(tmp_path / "rec")
+    with mock.patch.object(wikidata_api._session, "get", _live_get(calls)):
+        live = wikidata_api.get_entities(["Q1", "Q2"])
+        hits = wikidata_api.quick_wd_search("School of Law")
+    assert replay.stop().stats == {"wbgetentities": 1, "wbsearchentities": 1}
+
+    replay.start(tmp_path / "rec", replaying=True)
+    with mock.patch.object(wikidata_api._session, "get", side_effect=AssertionError("network")):
+        assert wikidata_api.get_entities(["Q1", "Q2"]) == live
+        assert wikidata_api.quick_wd_search("School of Law") == hits == [("Q5", "School of Law")]
+        with pytest.raises(ReplayMissError):
+            wikidata_api.get_entities(["Q3"])
+    assert len(calls) == 2
+
+
+def test_llm_calls_replay_without_keys(tmp_path):
+    resp = SimpleNamespace(
+        output=[object()],
+        output_text='{"units": []}',
+        usage=SimpleNamespace(
+            input_tokens=10, output_tokens=3, input_tokens_details=SimpleNamespace(cached_tokens=4)
+        ),
+    )
+    sdk = SimpleNamespace(responses=SimpleNamespace(create=mock.Mock(return_value=resp)))
+    with mock.patch.object(config, "OPENAI_API_KEY", "sk-test"), \
+            mock.patch.object(config, "ANTHROPIC_API_KEY", None), \
+            mock.patch.object(llm_helpers, "_openai_client", sdk):
+        replay.start(tmp_path / "rec")
+        assert llm_helpers._get_openai_client().responses.create(model="m", input="hi") is resp
+        replay.stop()
+
+    replay.start(tmp_path / "rec", replaying=True)
+    assert llm_helpers.OPENAI_API_KEY == "replay"
+    client = llm_helpers._get_openai_client()
+    again = client.responses.create(model="m", input="hi")
+    assert again.output and again.output_text == '{"units": []}'
+    assert again.usage.input_tokens_details.cached_tokens == 4
+    with pytest.raises(ValueError):  # not configured when recorded
+        llm_helpers._get_anthropic_client()
+
+    # a changed prompt is a miss, and the pipeline's broad handlers do not hide it
+    with pytest.raises(ReplayMissError):
+        try:
+            client.responses.create(model="m", input="changed")
+        except Exception:
+            pass
+    assert sdk.responses.create.call_count == 1
+    replay.stop()
+    assert llm_helpers.OPENAI_API_KEY == config.OPENAI_API_KEY
+
+
+def test_replay_needs_a_recording(tmp_path):
+    with pytest.raises(ValueError):
+        replay.start(tmp_path / "nothing", replaying=True)
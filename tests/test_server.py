@@ -0,0 +1,136 @@
+"""Tests for the long-lived discover service (server.py)."""
+
+import http.client
+import json
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import pytest
+from wikidata_discover import llm_helpers, server
+from wikidata_discover.server import DiscoverService, make_server
+
+
+class FakeDiscovery:
+    built = 0
+
+    def __init__(self, qid):
+        if qid == "Q404":
+            raise ValueError(f"Info not found for {qid}")
+        FakeDiscovery.built += 1
+        self.qid = qid
+        self.university_label = "Test University"
+
+    def discover_missing(self, stream=False):
+        # the real one: one usage scope per call, calls of other requests interleaved
+        with llm_helpers.usage_scope() as usage:
+            for _ in range(int(self.qid[1:])):
+                llm_helpers._add_usage({
+                    "call": "extract", "provider": "openai", "model": "m", "input_tokens": 1,
+                    "output_tokens": 1, "cache_read_tokens": 0, "cache_write_tokens": 0, "latency_s": 0.0,
+                })
+                time.sleep(0.01)
+            report = {"llm_usage": llm_helpers.summarize_usage(usage)}
+        return [], report
+
+    def match_divisions(self, divisions, match_stats=None):
+        match_stats["candidates"] = len(divisions)
+        return [
+            {"name": d["name"], "division": d, "status": "linked" if "Law" in d["name"] else "missing",
+             "qid": "Q10" if "Law" in d["name"] else None, "label": None}
+            for d in divisions
+        ]
+
+
+@pytest.fixture
+def tcp_server():
+    FakeDiscovery.built = 0
+    with mock.patch.object(server, "Discovery", FakeDiscovery):
+        srv = make_server(DiscoverService(), port=0)
+        thread = threading.Thread(target=srv.serve_forever, daemon=True)
+        thread.start()
+        yield srv.server_address[1]
+        srv.shutdown()
+        srv.server_close()
+
+
+def _call(port, method, path, body=None):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    conn.request(method, path, body=None if body is None else json.dumps(body))
+    resp = conn.getresponse()
+    payload = json.loads(resp.read())
+    conn.close()
+    return resp.status, payload
+
+
+def test_match_reuses_warm_state_across_concurrent_requests(tcp_server):
+    body = {"qid": "Q1", "names": ["School of Law", "School of Dance"]}
+    with ThreadPoolExecutor(8) as pool:
+        results = list(pool.map(lambda _: _call(tcp_server, "POST", "/match", body), range(16)))
+
+    assert all(status == 200 for status, _ in results)
+    assert results[0][1]["matches"] == [
+        {"name": "School of Law", "status": "linked", "qid": "Q10", "label": None},
+        {"name": "School of Dance", "status": "missing", "qid": None, "label": None},
+    ]
+    assert FakeDiscovery.built == 1
+    status, health = _call(tcp_server, "GET", "/health")
+    assert status == 200 and health["requests"]["match"] == 16
+    assert health["requests"]["cache_hits"] == 15
+
+
+def test_concurrent_discover_reports_count_their_own_calls(tcp_server):
+    with ThreadPoolExecutor(3) as pool:
+        results = dict(pool.map(
+            lambda qid: (qid, _call(tcp_server, "POST", "/discover", {"qid": qid})[1]), ["Q3", "Q5", "Q8"]
+        ))
+    for qid, payload in results.items():
+        assert payload["report"]["llm_usage"]["extract"]["calls"] == int(qid[1:])
+    assert len(llm_helpers.LLM_USAGE) <= llm_helpers._USAGE_KEEP
+
+
+def test_harvest_output_stays_under_results(tcp_server, tmp_path):
+    with mock.patch.object(server, "RESULTS_DIR", tmp_path):
+        for out in ("../escape.ndjson", "/etc/passwd", 5):
+            assert _call(tcp_server, "POST", "/harvest", {"out": out})[0] == 400
+        assert DiscoverService._harvest_path("sub/u.ndjson") == tmp_path.resolve() / "sub" / "u.ndjson"
+
+
+def test_errors_map_to_status_codes(tcp_server):
+    assert _call(tcp_server, "POST", "/match", {"qid": "Q1"})[0] == 400
+    assert _call(tcp_server, "POST", "/match", {"qid": "Q404", "names": []})[0] == 422
+    assert _call(tcp_server, "POST", "/nope", {})[0] == 404
+    conn = http.client.HTTPConnection("127.0.0.1", tcp_server, timeout=10)
+    conn.request("POST", "/match", body="{not json")
+    assert conn.getresponse().status == 400
+    conn.close()
+
+
+def test_unix_socket(tmp_path):
+    path = str(tmp_path / "discover.sock")
+    with mock.patch.object(server, "Discovery", FakeDiscovery):
+        srv = make_server(DiscoverService(), socket_path=path)
+        threading.Thread(target=srv.serve_forever, daemon=True).start()
+        try:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.connect(path)
+            sock.sendall(b"GET /health HTTP/1.1\r\nHost: x\r\nConnection: close\r\n\r\n")
+            data = b""
+            while chunk := sock.recv(4096):
+                data += chunk
+            sock.close()
+        finally:
+            srv.shutdown()
+            srv.server_close()
+    head, _, body = data.partition(b"\r\n\r\n")
+    assert head.startswith(b"HTTP/1.1 200")
+    assert json.loads(body)["status"] == "ok"
+
+
+def test_qid_locks_stay_bounded():
+    service = DiscoverService()
+    locks = {id(service._qid_lock(f"Q{i}")) for i in range(10_000)}
+    assert len(locks) <= server._QID_LOCK_STRIPES
+    assert service._qid_lock("Q49210") is service._qid_lock("Q49210")
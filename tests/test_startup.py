@@ -0,0 +1,44 @@
+"""Import-time regression tests: `--help` and `harvest` must not load the discover stack."""
+
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+# generous for slow CI machines; locally `--help` takes well under 0.3 s
+STARTUP_BUDGET_S = float(os.getenv("STARTUP_BUDGET_S", "1.0"))
+
+HEAVY = [
+    "pandas", "numpy", "rapidfuzz", "openai", "anthropic", "google.genai", "rich",
+    "SPARQLWrapper", "wikidata_discover.discovery", "wikidata_discover.llm_helpers",
+]
+
+
+def _loaded_after(code: str) -> list:
+    probe = f"{code}\nimport json, sys\nprint(json.dumps(sorted(sys.modules)))"
+    out = subprocess.run(
+        [sys.executable, "-c", probe], cwd=ROOT, capture_output=True, text=True, check=True
+    ).stdout
+    modules = set(json.loads(out.splitlines()[-1]))
+    return [m for m in HEAVY if m in modules]
+
+
+def test_cli_import_is_light():
+    assert _loaded_after("import wikidata_discover.cli") == []
+
+
+def test_harvest_path_is_light():
+    assert _loaded_after("import wikidata_discover.cli, wikidata_discover.harvester") == []
+
+
+def test_help_within_budget():
+    started = time.monotonic()
+    subprocess.run(
+        [sys.executable, "-m", "wikidata_discover.scripts.wikidata_division_discover", "--help"],
+        cwd=ROOT, capture_output=True, check=True,
+    )
+    assert time.monotonic() - started < STARTUP_BUDGET_S
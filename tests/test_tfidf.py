@@ -0,0 +1,89 @@
+"""Unit tests for the char n-gram TF-IDF matcher in tfidf_matcher.py."""
+
+import pytest
+from wikidata_discover.discovery import normalize_name
+from wikidata_discover.tfidf_matcher import (
+    TfidfMatcher, calibrate_thresholds, char_ngrams,
+)
+
+NYU_CHILDREN = [
+    ("Q1", "Stern School"),
+    ("Q2", "Tisch School of the Arts"),
+    ("Q3", "School of Law"),
+    ("Q4", "Rory Meyers College of Nursing"),
+    ("Q5", "College of Dentistry"),
+    ("Q6", "School of Global Public Health"),
+]
+
+
+@pytest.fixture
+def matcher():
+    return TfidfMatcher(
+        NYU_CHILDREN,
+        {"Q3": ["NYU School of Law"]},
+        normalizer=normalize_name,
+    )
+
+
+def test_char_ngrams_pads_word_edges():
+    grams = char_ngrams("law")
+    assert grams[" la"] == 1 and grams["aw "] == 1
+
+
+def test_top_k_is_sorted_and_unique_per_qid(matcher):
+    hits = matcher.top_k("NYU Law", 3)
+    assert hits[0][0] == "Q3"
+    assert len({qid for qid, _, _ in hits}) == len(hits)
+    assert [s for _, _, s in hits] == sorted((s for _, _, s in hits), reverse=True)
+
+
+def test_confident_match_by_margin(matcher):
+    hit = matcher.confident_match("Leonard N. Stern School of Business")
+    assert hit is not None and hit[0] == "Q1"
+
+
+def test_unrelated_name_is_not_confident(matcher):
+    assert matcher.confident_match("Department of Physics") is None
+
+
+@pytest.mark.parametrize("name,child", [
+    ("School of Medicine", "School of Veterinary Medicine"),
+    ("School of Public Health", "School of Public Policy"),
+    ("School of Social Work", "School of Social Sciences"),
+    # is_fuzzy_match negatives
+    ("College of Nursing", "College of Dentistry"),
+    ("School of Medicine", "School of Engineering"),
+    ("School of Journalism", "School of Medicine"),
+])
+def test_distinct_units_are_not_confident(name, child):
+    # a single child: there is no runner-up for the margin rule to beat
+    assert TfidfMatcher([("Q1", child)], normalizer=normalize_name).confident_match(name) is None
+    both = TfidfMatcher(NYU_CHILDREN + [("Q9", child)], normalizer=normalize_name)
+    hit = both.confident_match(name)
+    assert hit is None or hit[0] != "Q9"
+
+
+def test_confident_match_through_alt_label(matcher):
+    assert matcher.confident_match("NYU School of Law")[0] == "Q3"
+
+
+def test_similarity_handles_unseen_ngrams(matcher):
+    assert matcher.similarity("Quantum Computing Lab", "School of Law") < 0.25
+    assert matcher.similarity("School of Law", "Law School") == pytest.approx(1.0)
+
+
+def test_empty_index():
+    assert TfidfMatcher([]).top_k("anything") == []
+
+
+def test_calibrate_thresholds_separates_pairs():
+    pairs = [
+        ("Tisch School of the Arts", "NYU Tisch School of the Arts", True),
+        ("School of Law", "Law School", True),
+        ("College of Nursing", "College of Dentistry", False),
+        ("School of Law", "School of Global Public Health", False),
+    ]
+    accept, reject = calibrate_thresholds(
+        pairs, [n for _, n in NYU_CHILDREN], normalizer=normalize_name
+    )
+    assert 0.0 < reject <= accept < 1.0
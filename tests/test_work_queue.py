@@ -0,0 +1,112 @@
+"""Tests for the lease-based discover work queue (work_queue.py)."""
+
+import threading
+import time
+from unittest import mock
+
+import pytest
+from wikidata_discover import sparql_helpers, wikidata_api
+from wikidata_discover.bench.stubs import Stubs
+from wikidata_discover.sparql_helpers import execute_sparql_bindings
+from wikidata_discover.work_queue import WorkQueue, run_worker, share_rate_limits
+
+
+@pytest.fixture
+def queue(tmp_path):
+    q = WorkQueue(tmp_path / "queue.sqlite", max_attempts=2)
+    yield q
+    q.close()
+
+
+def test_claims_follow_priority_and_are_exclusive(queue, tmp_path):
+    assert queue.enqueue(["Q1", "Q2", "Q3"], {"Q2": 5.0}) == 3
+    assert queue.enqueue(["Q3", "Q4"]) == 1  # known QIDs are not re-added
+
+    other = WorkQueue(tmp_path / "queue.sqlite")  # a second process
+    assert queue.claim("a", lease=60) == "Q2"
+    assert other.claim("b", lease=60) == "Q1"
+    assert queue.stats() == {"leased": 2, "queued": 2}
+
+    # only the lease holder can record the result
+    assert not other.complete("Q2", "b", {"missing": 1})
+    assert queue.complete("Q2", "a", {"missing": 1})
+    assert queue.job("Q2")["result"] == {"missing": 1}
+    other.close()
+
+
+def test_expired_lease_is_reclaimed_and_old_owner_locked_out(queue):
+    queue.enqueue(["Q1"])
+    assert queue.claim("a", lease=0.05) == "Q1"
+    assert queue.claim("b", lease=60) is None
+    time.sleep(0.1)
+    assert queue.claim("b", lease=60) == "Q1"
+    assert not queue.heartbeat("Q1", "a", 60)
+    assert not queue.complete("Q1", "a", {})
+    assert queue.complete("Q1", "b", {})
+
+
+def test_failures_are_retried_then_given_up(queue):
+    queue.enqueue(["Q1"])
+    assert queue.claim("a", 60) == "Q1" and queue.fail("Q1", "a", "boom")
+    assert queue.job("Q1")["status"] == "queued"
+    assert queue.claim("a", 60) == "Q1" and queue.fail("Q1", "a", "boom")
+    assert queue.job("Q1")["status"] == "failed"
+    assert queue.claim("a", 60) is None
+
+
+def test_concurrent_workers_process_each_qid_once(tmp_path):
+    path = tmp_path / "queue.sqlite"
+    setup = WorkQueue(path)
+    setup.enqueue(f"Q{i}" for i in range(60))
+    seen, lock = [], threading.Lock()
+
+    def process(qid):
+        with lock:
+            seen.append(qid)
+        if qid == "Q7":
+            raise RuntimeError("flaky")
+        return {"missing": 0}
+
+    results = []
+
+    def work(name):
+        q = WorkQueue(path, max_attempts=1)
+        results.append(run_worker(q, process, worker=name, lease=30))
+        q.close()
+
+    threads = [threading.Thread(target=work, args=(f"w{i}",)) for i in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert sorted(seen) == sorted(f"Q{i}" for i in range(60))
+    assert sum(r["done"] for r in results) == 59 and sum(r["failed"] for r in results) == 1
+    assert setup.stats() == {"done": 59, "failed": 1}
+    setup.close()
+
+
+def test_shared_rate_limiter_spans_connections(tmp_path):
+    a, b = WorkQueue(tmp_path / "q.sqlite"), WorkQueue(tmp_path / "q.sqlite")
+    la, lb = a.rate_limiter("api", rate=20.0, burst=2), b.rate_limiter("api", rate=20.0, burst=2)
+    started = time.monotonic()
+    for limiter in (la, lb, la, lb, la, lb):
+        limiter.acquire()
+    # 2 from the burst, then 4 more at 20/s
+    assert time.monotonic() - started >= 0.15
+    a.close()
+    b.close()
+
+
+def test_discover_sparql_takes_from_the_shared_bucket(queue, monkeypatch):
+    monkeypatch.setattr(wikidata_api, "_api_limiter", wikidata_api._api_limiter)
+    monkeypatch.setattr(sparql_helpers, "sparql_limiter", sparql_helpers.sparql_limiter)
+    share_rate_limits(queue)
+    shared = mock.Mock(wraps=sparql_helpers.sparql_limiter)
+    sparql_helpers.sparql_limiter = shared
+
+    stubs = Stubs().start()
+    with stubs.patched():
+        rows = execute_sparql_bindings("SELECT DISTINCT ?cls WHERE { ?cls wdt:P279* wd:Q3918 . }")
+    stubs.stop()
+    assert rows and shared.acquire.call_count == 1
@@ -0,0 +1 @@
+"""Benchmark fixtures: local stand-ins for Wikidata and the LLM providers (see stubs.py)."""
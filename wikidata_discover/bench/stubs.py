@@ -0,0 +1,574 @@
+"""
+Local HTTP stand-ins for WDQS, the Wikidata API and the LLM providers.
+
+    python -m wikidata_discover.bench.stubs --latency lognormal:0.05:0.6 --throttle-rate 0.02
+
+starts both servers and prints the environment to point `discover`,
+`harvest` or `run_eval` at them:
+
+    WikidataStub  GET|POST /sparql      SPARQL JSON results, or CSV for Accept: text/csv
+                  GET      /w/api.php   wbsearchentities, wbgetentities
+    LLMStub       POST /v1/responses                          OpenAI Responses (and stream)
+                  POST /v1/messages                           Anthropic Messages (and stream)
+                  POST /v1beta/models/<m>:generateContent     Gemini (and :streamGenerateContent)
+
+Answers come from a StubWorld (see world.py). Only the query shapes the
+pipeline sends are understood; anything else gets a 400, so a new query
+shape shows up as an error instead of an empty result.
+
+Every request first waits for a delay drawn from the server's Latency and
+may then be answered with a 429 (with Retry-After) or a 503 instead, at the
+rates given in Faults. Draws come from one seeded RNG per server.
+"""
+
+import argparse
+import json
+import logging
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from wikidata_discover.bench.world import COUNTRY, StubWorld
+
+logger = logging.getLogger(__name__)
+
+ENTITY = "http://www.wikidata.org/entity/"
+PROP = "http://www.wikidata.org/prop/direct/"
+_MAX_IDS = 50  # wbgetentities limit
+_STREAM_CHUNK = 24  # characters per streamed text delta
+
+
+@dataclass
+class Latency:
+    """Per-request delay: fixed:S, uniform:LO:HI, lognormal:MEDIAN:SIGMA or exponential:MEAN (seconds)."""
+
+    kind: str = "fixed"
+    a: float = 0.0
+    b: float = 0.0
+
+    @classmethod
+    def parse(cls, spec: str) -> "Latency":
+        kind, *params = spec.split(":")
+        if kind not in ("fixed", "uniform", "lognormal", "exponential") or len(params) > 2:
+            raise ValueError(f"bad latency spec {spec!r}")
+        values = [float(p) for p in params] + [0.0, 0.0]
+        return cls(kind, values[0], values[1])
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == "uniform":
+            return rng.uniform(self.a, self.b)
+        if self.kind == "lognormal":
+            return self.a * math.exp(rng.gauss(0, self.b))
+        if self.kind == "exponential":
+            return rng.expovariate(1 / self.a) if self.a > 0 else 0.0
+        return self.a
+
+
+@dataclass
+class Faults:
+    """Fractions of requests answered 503 (error_rate) or 429 (throttle_rate)."""
+
+    error_rate: float = 0.0
+    throttle_rate: float = 0.0
+    retry_after: float = 1.0  # seconds, sent with every 429
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format: str, *args: Any) -> None:
+        logger.debug("%s %s", self.server.stub.name, format % args)
+
+    def do_GET(self) -> None:
+        self.server.stub.handle(self, "GET")
+
+    def do_POST(self) -> None:
+        self.server.stub.handle(self, "POST")
+
+
+@dataclass
+class Reply:
+    status: int = 200
+    payload: Any = None
+    content_type: str = "application/json"
+    # server-sent events: (event name or None, JSON data) pairs
+    events: Optional[List[Tuple[Optional[str], Any]]] = None
+    headers: Optional[Dict[str, str]] = None
+
+
+class StubServer:
+    """Threaded HTTP server on 127.0.0.1 that routes requests to route()."""
+
+    name = "stub"
+
+    def __init__(
+        self,
+        world: StubWorld,
+        latency: Optional[Latency] = None,
+        faults: Optional[Faults] = None,
+        seed: int = 0,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ):
+        self.world = world
+        self.latency = latency or Latency()
+        self.faults = faults or Faults()
+        self.stats: Counter = Counter()
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._server.stub = self
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "StubServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _draw(self) -> Tuple[float, Optional[int]]:
+        with self._lock:
+            delay = self.latency.sample(self._rng)
+            roll = self._rng.random()
+        if roll < self.faults.throttle_rate:
+            return delay, 429
+        if roll < self.faults.throttle_rate + self.faults.error_rate:
+            return delay, 503
+        return delay, None
+
+    def handle(self, handler: BaseHTTPRequestHandler, method: str) -> None:
+        length = int(handler.headers.get("Content-Length") or 0)
+        body = handler.rfile.read(length) if length else b""
+        delay, fault = self._draw()
+        if delay > 0:
+            time.sleep(delay)
+        if fault == 429:
+            reply = Reply(429, {"error": {"code": 429, "message": "rate limited", "type": "rate_limit_error"}},
+                          headers={"Retry-After": f"{self.faults.retry_after:g}"})
+        elif fault == 503:
+            reply = Reply(503, {"error": {"code": 503, "message": "injected error", "type": "overloaded_error"}})
+        else:
+            try:
+                reply = self.route(method, urlsplit(handler.path), body, handler.headers)
+            except Exception as e:  # a bug in the stub should not look like a hang
+                logger.exception("%s %s failed", self.name, handler.path)
+                reply = Reply(500, {"error": {"code": 500, "message": f"{type(e).__name__}: {e}"}})
+        with self._lock:
+            self.stats["requests"] += 1
+            self.stats[reply.status] += 1
+        self._send(handler, reply)
+
+    def route(self, method: str, url, body: bytes, headers) -> Reply:
+        raise NotImplementedError
+
+    @staticmethod
+    def _send(handler: BaseHTTPRequestHandler, reply: Reply) -> None:
+        handler.send_response(reply.status)
+        for name, value in (reply.headers or {}).items():
+            handler.send_header(name, value)
+        if reply.events is not None:
+            handler.send_header("Content-Type", "text/event-stream")
+            handler.send_header("Connection", "close")
+            handler.end_headers()
+            handler.close_connection = True
+            for event, data in reply.events:
+                chunk = (f"event: {event}\n" if event else "") + f"data: {json.dumps(data)}\n\n"
+                handler.wfile.write(chunk.encode())
+                handler.wfile.flush()
+            return
+        if isinstance(reply.payload, (bytes, str)):
+            data = reply.payload.encode() if isinstance(reply.payload, str) else reply.payload
+        else:
+            data = json.dumps(reply.payload).encode()
+        handler.send_header("Content-Type", reply.content_type)
+        handler.send_header("Content-Length", str(len(data)))
+        handler.end_headers()
+        handler.wfile.write(data)
+
+
+# ─────────────────────────  WDQS + Wikidata API  ─────────────────────────
+
+
+def _values(query: str, var: str) -> List[str]:
+    match = re.search(r"VALUES \?%s \{([^}]*)\}" % var, query)
+    return re.findall(r"wd:(Q\d+)", match.group(1)) if match else []
+
+
+def _uri(qid: str) -> Dict[str, str]:
+    return {"type": "uri", "value": ENTITY + qid}
+
+
+def answer_sparql(world: StubWorld, query: str) -> Tuple[List[str], List[Dict[str, Dict[str, str]]]]:
+    """(variables, bindings) for the query shapes the pipeline sends; ValueError otherwise."""
+    if "COUNT(DISTINCT ?child)" in query:  # prioritize.CHILD_COUNT_TEMPLATE
+        return ["u", "n"], [
+            {"u": _uri(u), "n": {"type": "literal", "value": str(len({c for c, _ in world.edges(u)})),
+                                 "datatype": "http://www.w3.org/2001/XMLSchema#integer"}}
+            for u in _values(query, "u")
+        ]
+    closure = re.search(r"wdt:P279\* wd:(Q\d+)", query)
+    if closure and "?cls" in query:  # crawl_policy subclass closure
+        return ["cls"], [{"cls": _uri(closure.group(1))}]
+    ancestry = re.search(r"\?x \(.+?\)\+ wd:(Q\d+)", query)
+    if ancestry:  # hierarchy.ANCESTRY_TEMPLATE
+        root = ancestry.group(1)
+        return ["x"], [{"x": _uri(q)} for q in _values(query, "x") if root in world.ancestors(q)]
+    if "?univ ?website" in query:  # harvester queries
+        country = re.search(r"wdt:P17\s+wd:(Q\d+)", query)
+        if country and country.group(1) != COUNTRY:
+            return ["univ", "website"], []
+        # a sharded harvest sends its slice of the class closure as VALUES ?type
+        types = set(_values(query, "type"))
+        rows = []
+        for item in world.universities():
+            if types and not types & set(item.claims.get("P31", ())):
+                continue
+            row = {"univ": _uri(item.qid)}
+            for website in item.claims.get("P856", []):
+                row["website"] = {"type": "uri", "value": website}
+            rows.append(row)
+        return ["univ", "website"], rows
+    if re.search(r"SELECT DISTINCT \?country\b", query):
+        return ["country"], [{"country": _uri(COUNTRY)}]
+    if "?child ?prop" in query:  # hierarchy edge templates
+        props = set(re.findall(r"wdt:(P\d+)", query))
+        rows = []
+        for parent in _values(query, "parent"):
+            for child, prop in world.edges(parent):
+                if prop in props:
+                    rows.append({"parent": _uri(parent), "child": _uri(child),
+                                 "prop": {"type": "uri", "value": PROP + prop}})
+        variables = ["parent", "child", "prop"] if "?parent ?child ?prop" in query else ["child", "prop"]
+        return variables, [{k: r[k] for k in variables} for r in rows]
+    raise ValueError("query shape not supported by the stub")
+
+
+def _csv(variables: List[str], rows: List[Dict[str, Dict[str, str]]]) -> str:
+    lines = [",".join(variables)]
+    for row in rows:
+        lines.append(",".join(
+            '"%s"' % row[v]["value"].replace('"', '""') if v in row else "" for v in variables
+        ))
+    return "\r\n".join(lines) + "\r\n"
+
+
+class WikidataStub(StubServer):
+    """WDQS at /sparql and the Wikidata action API at /w/api.php."""
+
+    name = "wikidata"
+
+    def route(self, method, url, body, headers) -> Reply:
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        if method == "POST":
+            if headers.get("Content-Type", "").startswith("application/sparql-query"):
+                params["query"] = body.decode()
+            else:
+                params.update({k: v[-1] for k, v in parse_qs(body.decode()).items()})
+        if url.path.endswith("/sparql"):
+            return self._sparql(params.get("query", ""), headers.get("Accept", ""))
+        if url.path.endswith("/api.php"):
+            return self._api(params)
+        return Reply(404, {"error": f"unknown path {url.path}"})
+
+    def _sparql(self, query: str, accept: str) -> Reply:
+        try:
+            variables, rows = answer_sparql(self.world, query)
+        except ValueError as e:
+            return Reply(400, f"{e}\n{query}", "text/plain")
+        if "text/csv" in accept:
+            return Reply(200, _csv(variables, rows), "text/csv; charset=utf-8")
+        return Reply(200, {"head": {"vars": variables}, "results": {"bindings": rows}},
+                     "application/sparql-results+json")
+
+    def _api(self, params: Dict[str, str]) -> Reply:
+        action = params.get("action")
+        if action == "wbsearchentities":
+            hits = self.world.search(params.get("search", ""), int(params.get("limit", 7)))
+            return Reply(200, {
+                "searchinfo": {"search": params.get("search", "")},
+                "search": [{"id": i.qid, "label": i.label, "description": ""} for i in hits],
+                "success": 1,
+            })
+        if action == "wbgetentities":
+            ids = [i for i in params.get("ids", "").split("|") if i]
+            if len(ids) > _MAX_IDS:
+                return Reply(200, {"error": {"code": "toomanyvalues",
+                                             "info": f"Too many values supplied for parameter \"ids\". The limit is {_MAX_IDS}."}})
+            props = set(params.get("props", "info|labels|aliases|claims").split("|"))
+            language = params.get("languages", "en")
+            return Reply(200, {
+                "entities": {q: self.world.entity_json(q, props, language) for q in ids},
+                "success": 1,
+            })
+        return Reply(200, {"error": {"code": "badvalue", "info": f"unsupported action {action!r}"}})
+
+
+# ─────────────────────────  LLM providers  ─────────────────────────
+
+
+def _texts(value: Any) -> Iterator[str]:
+    """Every text in a message content: a string, a list of blocks or parts."""
+    if isinstance(value, str):
+        yield value
+    elif isinstance(value, list):
+        for v in value:
+            yield from _texts(v)
+    elif isinstance(value, dict):
+        if isinstance(value.get("text"), str):
+            yield value["text"]
+        for key in ("content", "parts"):
+            if key in value:
+                yield from _texts(value[key])
+
+
+def answer_prompt(world: StubWorld, prompt: str) -> str:
+    """What the pipeline's prompts expect: a QID/NONE, a judge verdict or extracted units."""
+    candidate = re.search(r"CANDIDATE: (.+)", prompt)
+    if candidate:
+        want = re.sub(r"[^a-z0-9]+", " ", candidate.group(1).lower()).strip()
+        for qid, label in re.findall(r"^\[\d+\] (Q\d+) -- (.+)$", prompt, re.M):
+            if re.sub(r"[^a-z0-9]+", " ", label.lower()).strip() == want:
+                return qid
+        return "NONE"
+    if "Proposed units:" in prompt:
+        return json.dumps({"keep": re.findall(r"^- (.+)$", prompt.split("Proposed units:", 1)[1], re.M)})
+    return json.dumps({"units": world.units_for(prompt), "reference": "https://stub.invalid/"})
+
+
+def _tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def _chunks(text: str) -> List[str]:
+    return [text[i:i + _STREAM_CHUNK] for i in range(0, len(text), _STREAM_CHUNK)] or [""]
+
+
+class LLMStub(StubServer):
+    """OpenAI Responses, Anthropic Messages and Gemini generateContent, with streaming."""
+
+    name = "llm"
+
+    def route(self, method, url, body, headers) -> Reply:
+        request = json.loads(body or b"{}")
+        if url.path.endswith("/responses"):
+            return self._openai(request)
+        if url.path.endswith("/messages"):
+            return self._anthropic(request)
+        gemini = re.search(r"/models/([^/:]+):(generateContent|streamGenerateContent)$", url.path)
+        if gemini:
+            return self._gemini(request, gemini.group(1), gemini.group(2) == "streamGenerateContent")
+        return Reply(404, {"error": {"message": f"unknown path {url.path}"}})
+
+    def _openai(self, request: Dict[str, Any]) -> Reply:
+        messages = request.get("input", [])
+        if isinstance(messages, str):
+            messages = [{"role": "user", "content": messages}]
+        user = "\n".join(_texts([m for m in messages if m.get("role") != "system"]))
+        text = answer_prompt(self.world, user)
+        rid, mid = f"resp_{uuid.uuid4().hex}", f"msg_{uuid.uuid4().hex}"
+        response = {
+            "id": rid, "object": "response", "created_at": int(time.time()), "status": "completed",
+            "model": request.get("model"), "error": None, "incomplete_details": None,
+            "instructions": None, "metadata": {}, "parallel_tool_calls": True, "tool_choice": "auto",
+            "tools": [], "temperature": 1.0, "top_p": 1.0,
+            "output": [{"type": "message", "id": mid, "status": "completed", "role": "assistant",
+                        "content": [{"type": "output_text", "text": text, "annotations": []}]}],
+            "usage": {"input_tokens": _tokens(user), "output_tokens": _tokens(text),
+                      "total_tokens": _tokens(user) + _tokens(text),
+                      "input_tokens_details": {"cached_tokens": 0},
+                      "output_tokens_details": {"reasoning_tokens": 0}},
+        }
+        if not request.get("stream"):
+            return Reply(200, response)
+        events = [("response.created", {"type": "response.created", "sequence_number": 0,
+                                        "response": {**response, "status": "in_progress", "output": []}})]
+        for piece in _chunks(text):
+            events.append(("response.output_text.delta", {
+                "type": "response.output_text.delta", "item_id": mid, "output_index": 0,
+                "content_index": 0, "delta": piece, "logprobs": [], "sequence_number": len(events),
+            }))
+        events.append(("response.completed", {"type": "response.completed", "response": response,
+                                              "sequence_number": len(events)}))
+        return Reply(200, events=events)
+
+    def _anthropic(self, request: Dict[str, Any]) -> Reply:
+        user = "\n".join(_texts(request.get("messages", [])))
+        text = answer_prompt(self.world, user)
+        usage = {"input_tokens": _tokens(user), "output_tokens": _tokens(text),
+                 "cache_read_input_tokens": 0, "cache_creation_input_tokens": 0}
+        message = {
+            "id": f"msg_{uuid.uuid4().hex}", "type": "message", "role": "assistant",
+            "model": request.get("model"), "content": [{"type": "text", "text": text}],
+            "stop_reason": "end_turn", "stop_sequence": None, "usage": usage,
+        }
+        if not request.get("stream"):
+            return Reply(200, message)
+        events = [
+            ("message_start", {"type": "message_start",
+                               "message": {**message, "content": [], "stop_reason": None,
+                                           "usage": {**usage, "output_tokens": 1}}}),
+            ("content_block_start", {"type": "content_block_start", "index": 0,
+                                     "content_block": {"type": "text", "text": ""}}),
+        ]
+        events += [("content_block_delta", {"type": "content_block_delta", "index": 0,
+                                            "delta": {"type": "text_delta", "text": piece}})
+                   for piece in _chunks(text)]
+        events += [
+            ("content_block_stop", {"type": "content_block_stop", "index": 0}),
+            ("message_delta", {"type": "message_delta",
+                               "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                               "usage": {"output_tokens": usage["output_tokens"]}}),
+            ("message_stop", {"type": "message_stop"}),
+        ]
+        return Reply(200, events=events)
+
+    def _gemini(self, request: Dict[str, Any], model: str, stream: bool) -> Reply:
+        user = "\n".join(_texts(request.get("contents", [])))
+        text = answer_prompt(self.world, user)
+
+        def chunk(piece: str, final: bool) -> Dict[str, Any]:
+            candidate = {"content": {"role": "model", "parts": [{"text": piece}]}, "index": 0}
+            if final:
+                candidate["finishReason"] = "STOP"
+            return {
+                "candidates": [candidate], "modelVersion": model,
+                "usageMetadata": {"promptTokenCount": _tokens(user), "candidatesTokenCount": _tokens(text),
+                                  "totalTokenCount": _tokens(user) + _tokens(text)},
+            }
+
+        if not stream:
+            return Reply(200, chunk(text, True))
+        pieces = _chunks(text)
+        return Reply(200, events=[(None, chunk(p, i == len(pieces) - 1)) for i, p in enumerate(pieces)])
+
+
+# ─────────────────────────  wiring  ─────────────────────────
+
+
+class Stubs:
+    """A WikidataStub and an LLMStub sharing one world."""
+
+    def __init__(
+        self,
+        world: Optional[StubWorld] = None,
+        latency: Optional[Latency] = None,
+        llm_latency: Optional[Latency] = None,
+        faults: Optional[Faults] = None,
+        seed: int = 0,
+        port: int = 0,
+    ):
+        self.world = world or StubWorld(seed=seed)
+        self.wikidata = WikidataStub(self.world, latency, faults, seed, port=port)
+        self.llm = LLMStub(self.world, llm_latency or latency, faults, seed + 1, port=port + 1 if port else 0)
+
+    def start(self) -> "Stubs":
+        self.wikidata.start()
+        self.llm.start()
+        return self
+
+    def stop(self) -> None:
+        self.wikidata.stop()
+        self.llm.stop()
+
+    def env(self) -> Dict[str, str]:
+        """Environment for a separate process (CLI, run_eval) to use the stubs."""
+        return {
+            "SPARQL_ENDPOINT": f"{self.wikidata.url}/sparql",
+            "WD_API_URL": f"{self.wikidata.url}/w/api.php",
+            "OPENAI_BASE_URL": f"{self.llm.url}/v1",
+            "ANTHROPIC_BASE_URL": self.llm.url,
+            "GEMINI_BASE_URL": self.llm.url,
+            "OPENAI_API_KEY": "stub",
+            "ANTHROPIC_API_KEY": "stub",
+            "GOOGLE_API_KEY": "stub",
+        }
+
+    @contextmanager
+    def patched(self):
+        """
+        Point this process's already-imported modules at the stubs, restoring
+        them on exit. Prefetched searches are joined on close, so no retry
+        can reach the restored production endpoint.
+        """
+        from wikidata_discover import config, llm_helpers, sparql_helpers, wikidata_api
+
+        env = self.env()
+        settings = {(config, k): v for k, v in env.items()}
+        settings.update({
+            (sparql_helpers, "SPARQL_ENDPOINT"): env["SPARQL_ENDPOINT"],
+            (wikidata_api, "WD_API_URL"): env["WD_API_URL"],
+            (wikidata_api.SearchPrefetcher, "wait_on_close"): True,
+            (llm_helpers, "_openai_client"): None,
+            (llm_helpers, "_anthropic_client"): None,
+            (llm_helpers, "_gemini_client"): None,
+        })
+        for name in ("OPENAI_BASE_URL", "ANTHROPIC_BASE_URL", "GEMINI_BASE_URL",
+                     "OPENAI_API_KEY", "ANTHROPIC_API_KEY", "GOOGLE_API_KEY"):
+            settings[(llm_helpers, name)] = env[name]
+        saved = {key: getattr(*key) for key in settings}
+        for (module, name), value in settings.items():
+            setattr(module, name, value)
+        try:
+            yield self
+        finally:
+            for (module, name), value in saved.items():
+                setattr(module, name, value)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run local WDQS, Wikidata API and LLM stand-ins")
+    parser.add_argument("--port", type=int, default=0,
+                        help="Wikidata stub port; the LLM stub takes the next one (default: any free)")
+    parser.add_argument("--latency", type=Latency.parse, default=Latency(),
+                        help="Wikidata delay, e.g. fixed:0.05, uniform:0.01:0.2, lognormal:0.05:0.6, exponential:0.1")
+    parser.add_argument("--llm-latency", type=Latency.parse, default=None,
+                        help="LLM delay (default: same as --latency)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered 503")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Fraction of requests answered 429")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After of injected 429s (seconds)")
+    parser.add_argument("--universities", type=int, default=0,
+                        help="Generated universities added to the ground-truth ones")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    stubs = Stubs(
+        StubWorld(extra=args.universities, seed=args.seed),
+        latency=args.latency,
+        llm_latency=args.llm_latency,
+        faults=Faults(args.error_rate, args.throttle_rate, args.retry_after),
+        seed=args.seed,
+        port=args.port,
+    ).start()
+    print(f"# {len(stubs.world.universities())} universities, {len(stubs.world.items)} items")
+    for name, value in stubs.env().items():
+        print(f"export {name}={value}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"# wikidata: {dict(stubs.wikidata.stats)}  llm: {dict(stubs.llm.stats)}")
+        stubs.stop()
+
+
+if __name__ == "__main__":
+    main()
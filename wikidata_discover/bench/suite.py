@@ -0,0 +1,391 @@
+"""
+Benchmark suite with stored results and a regression check.
+
+    python -m wikidata_discover.bench.suite run                    # all benchmarks
+    python -m wikidata_discover.bench.suite run --quick -k crawl   # smaller sizes, one group
+    python -m wikidata_discover.bench.suite compare base.json new.json --threshold 0.15
+
+Groups:
+
+    micro   normalize_name, is_fuzzy_match, compute_metrics, union_names and
+            export_quickstatements over 10k names. compute_metrics and
+            union_names are quadratic per list, so their 10k names are
+            spread over 500 university-sized lists, as in run_eval.
+    crawl   all_descendants on synthetic trees of 10^2 to 10^5 nodes (10^4
+            with --quick), with SPARQL and wbgetentities answered in memory
+            and a fresh entity store for every repeat.
+    e2e     discover_missing for the ground-truth universities against the
+            local stubs (bench/stubs.py), with cold caches for every repeat.
+            The Wikidata API and WDQS rate limiters are lifted unless
+            --rate-limits is given, so the stubs' latency is what is timed.
+
+Each benchmark is run once untimed, then timed --repeats times. A result
+file records the per-repeat times, the median and items per second.
+compare exits with status 1 if any benchmark's median grew by more than
+the threshold.
+"""
+
+import argparse
+import atexit
+import contextlib
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from unittest import mock
+
+from wikidata_discover.bench.stubs import Latency, Stubs, answer_sparql
+
+RESULTS_DIR = Path(__file__).resolve().parents[1] / "results" / "bench"
+DEFAULT_THRESHOLD = 0.10  # fraction of the baseline median
+_MICRO_ITEMS = 10_000
+_LIST_SIZE = 20  # names per list for the quadratic micro-benchmarks
+_TREE_FANOUT = 10
+_CRAWL_SIZES = (100, 1_000, 10_000, 100_000)
+_QUICK_CRAWL_SIZES = (100, 1_000, 10_000)
+
+_WORDS = (
+    "School", "College", "Institute", "Center", "Department", "Faculty", "Graduate", "Law", "Medicine",
+    "Business", "Engineering", "Arts", "Sciences", "Public", "Health", "Nursing", "Music", "Social",
+    "Work", "Education", "Dental", "Global", "Studies", "Policy", "Design", "Architecture", "of", "and",
+)
+
+
+@dataclass
+class Benchmark:
+    name: str
+    group: str
+    items: int
+    # called before every repeat (untimed); returns the callable that is timed
+    setup: Callable[[], Callable[[], Any]]
+
+
+_scratch_root: Optional[Path] = None
+
+
+def _scratch(prefix: str) -> Path:
+    """A fresh directory under one temporary root that is removed at exit."""
+    global _scratch_root
+    if _scratch_root is None:
+        _scratch_root = Path(tempfile.mkdtemp(prefix="wikidata-discover-bench-"))
+        atexit.register(shutil.rmtree, _scratch_root, True)
+    return Path(tempfile.mkdtemp(prefix=prefix, dir=_scratch_root))
+
+
+def _names(count: int, seed: int = 0) -> List[str]:
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(_WORDS) for _ in range(rng.randint(2, 6))) for _ in range(count)]
+
+
+def _quiet_console():
+    from rich.console import Console
+
+    from wikidata_discover import discovery, to_qs_wikidata
+
+    quiet = Console(quiet=True)
+    stack = contextlib.ExitStack()
+    stack.enter_context(mock.patch.object(discovery, "console", quiet))
+    stack.enter_context(mock.patch.object(to_qs_wikidata, "console", quiet))
+    return stack
+
+
+# ─────────────────────────  micro  ─────────────────────────
+
+
+def _micro() -> List[Benchmark]:
+    from wikidata_discover.discovery import is_fuzzy_match, normalize_name
+    from wikidata_discover.eval.run_eval import compute_metrics, union_names
+    from wikidata_discover.to_qs_wikidata import export_quickstatements
+
+    names = _names(_MICRO_ITEMS)
+    variants = _names(_MICRO_ITEMS, seed=1)
+    lists = [names[i:i + _LIST_SIZE] for i in range(0, len(names), _LIST_SIZE)]
+    other = [variants[i:i + _LIST_SIZE] for i in range(0, len(variants), _LIST_SIZE)]
+    units = [{"name": n, "unit_type": random.Random(i).choice(["school", "department", None])}
+             for i, n in enumerate(names)]
+
+    def export():
+        workdir = _scratch("qs-")
+
+        def run():
+            cwd = os.getcwd()
+            os.chdir(workdir)  # the export writes to the current directory
+            try:
+                with _quiet_console():
+                    export_quickstatements(units, "Q1", "Benchmark University")
+            finally:
+                os.chdir(cwd)
+        return run
+
+    return [
+        Benchmark("micro.normalize_name", "micro", len(names),
+                  lambda: lambda: [normalize_name(n) for n in names]),
+        Benchmark("micro.is_fuzzy_match", "micro", len(names),
+                  lambda: lambda: [is_fuzzy_match(a, b) for a, b in zip(names, variants)]),
+        Benchmark("micro.compute_metrics", "micro", len(names),
+                  lambda: lambda: [compute_metrics(p, t) for p, t in zip(lists, other)]),
+        Benchmark("micro.union_names", "micro", 2 * len(names),
+                  lambda: lambda: [union_names(a, b) for a, b in zip(lists, other)]),
+        Benchmark("micro.export_quickstatements", "micro", len(units), export),
+    ]
+
+
+# ─────────────────────────  crawl  ─────────────────────────
+
+
+class _Tree:
+    """Complete tree of size nodes Q1..Qsize, each linked to its parent by P361."""
+
+    def __init__(self, size: int, fanout: int = _TREE_FANOUT):
+        self.size = size
+        self.fanout = fanout
+
+    def edges(self, parent: str) -> List[Tuple[str, str]]:
+        first = (int(parent[1:]) - 1) * self.fanout + 2
+        return [(f"Q{i}", "P361") for i in range(first, min(first + self.fanout, self.size + 1))]
+
+    def entities(self, qids, *args, **kwargs) -> Dict[str, Dict[str, Any]]:
+        return {
+            q: {"qid": q, "label": f"Unit {q}", "aliases": [], "lastrevid": 1,
+                "claims": {"P31": ["Q2385804"], "P361": [], "P749": [], "P856": []}}
+            for q in qids
+        }
+
+
+def _crawl(sizes) -> List[Benchmark]:
+    from wikidata_discover import crawl_policy, entity_store, hierarchy
+    from wikidata_discover.entity_store import EntityStore
+    from wikidata_discover.hierarchy import all_descendants
+
+    def bench(size: int) -> Benchmark:
+        tree = _Tree(size)
+
+        def setup():
+            workdir = _scratch("crawl-")
+            store = EntityStore(workdir / "entities.sqlite")
+
+            def run():
+                with mock.patch.object(hierarchy, "execute_sparql_bindings",
+                                       lambda q: answer_sparql(tree, q)[1]), \
+                        mock.patch.object(crawl_policy, "execute_sparql_bindings", lambda q: []), \
+                        mock.patch.object(crawl_policy, "_CLOSURE_CACHE_DIR", workdir / "closure"), \
+                        mock.patch.object(crawl_policy, "_closure_memo", {}), \
+                        mock.patch.object(entity_store, "fetch_entities", tree.entities), \
+                        mock.patch.object(hierarchy, "time_sleep", 0):
+                    edges, _ = all_descendants("Q1", store)
+                assert len(edges) == size - 1, (len(edges), size)
+            return run
+
+        return Benchmark(f"crawl.all_descendants.{size}", "crawl", size, setup)
+
+    return [bench(size) for size in sizes]
+
+
+# ─────────────────────────  e2e  ─────────────────────────
+
+
+class _NoLimit:
+    """Stands in for a RateLimiter in e2e runs without rate limits."""
+
+    def acquire(self) -> None:
+        pass
+
+
+def _e2e(quick: bool, latency: Optional[Latency], rate_limits: bool = False) -> List[Benchmark]:
+    from wikidata_discover import crawl_policy, discovery, hierarchy, llm_helpers, sparql_helpers, wikidata_api
+    from wikidata_discover.entity_store import EntityStore
+    from wikidata_discover.eval.ground_truth import GROUND_TRUTH
+
+    qids = list(GROUND_TRUTH)[:3 if quick else None]
+
+    def bench(stream: bool) -> Benchmark:
+        def setup():
+            workdir = _scratch("e2e-")
+
+            def run():
+                stubs = Stubs(latency=latency).start()
+                cwd = os.getcwd()
+                os.chdir(workdir)  # CSV and QuickStatements go to the current directory
+                limits = contextlib.ExitStack()
+                if not rate_limits:
+                    limits.enter_context(mock.patch.object(wikidata_api, "_api_limiter", _NoLimit()))
+                    limits.enter_context(mock.patch.object(sparql_helpers, "sparql_limiter", _NoLimit()))
+                try:
+                    with stubs.patched(), limits, _quiet_console(), \
+                            mock.patch.object(discovery, "RESULTS_DIR", workdir), \
+                            mock.patch.object(llm_helpers, "_CACHE_DIR", workdir / "llm"), \
+                            mock.patch.object(wikidata_api, "_SEARCH_CACHE_DIR", workdir / "wd_search"), \
+                            mock.patch.object(wikidata_api, "_search_memo", {}), \
+                            mock.patch.object(crawl_policy, "_CLOSURE_CACHE_DIR", workdir / "closure"), \
+                            mock.patch.object(crawl_policy, "_closure_memo", {}), \
+                            mock.patch.object(hierarchy, "SNAPSHOT_DIR", workdir / "hierarchies"):
+                        store = EntityStore(workdir / "entities.sqlite")
+                        for qid in qids:
+                            discovery.Discovery(qid, store=store, harvest=False).discover_missing(stream)
+                finally:
+                    os.chdir(cwd)
+                    stubs.stop()
+            return run
+
+        name = "e2e.discover_missing" + (".stream" if stream else "")
+        return Benchmark(name, "e2e", len(qids), setup)
+
+    return [bench(False), bench(True)]
+
+
+def collect(quick: bool = False, latency: Optional[Latency] = None, rate_limits: bool = False) -> List[Benchmark]:
+    return (
+        _micro()
+        + _crawl(_QUICK_CRAWL_SIZES if quick else _CRAWL_SIZES)
+        + _e2e(quick, latency, rate_limits)
+    )
+
+
+# ─────────────────────────  run / compare  ─────────────────────────
+
+
+def measure(bench: Benchmark, repeats: int) -> Dict[str, Any]:
+    bench.setup()()  # warm-up: imports, lazy clients, first-call caches
+    times = []
+    for _ in range(repeats):
+        run = bench.setup()
+        started = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - started)
+    median = statistics.median(times)
+    return {
+        "group": bench.group,
+        "items": bench.items,
+        "times_s": [round(t, 6) for t in times],
+        "median_s": round(median, 6),
+        "min_s": round(min(times), 6),
+        "items_per_s": round(bench.items / median, 1) if median else None,
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=Path(__file__).parent,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(
+    select: Optional[str] = None,
+    repeats: int = 5,
+    quick: bool = False,
+    latency: Optional[Latency] = None,
+    out: Optional[Path] = None,
+    progress: Callable[[str, Dict[str, Any]], None] = lambda name, result: None,
+    rate_limits: bool = False,
+) -> Path:
+    """Run the benchmarks whose name contains select and write the results as JSON."""
+    results: Dict[str, Any] = {}
+    for bench in collect(quick, latency, rate_limits):
+        if select and select not in bench.name:
+            continue
+        results[bench.name] = measure(bench, repeats)
+        progress(bench.name, results[bench.name])
+    out = Path(out) if out else RESULTS_DIR / f"{time.strftime('%Y%m%d-%H%M%S')}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps({
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeats": repeats,
+        "quick": quick,
+        "rate_limits": rate_limits,
+        "benchmarks": results,
+    }, indent=2))
+    return out
+
+
+def compare(base: Path, new: Path, threshold: float = DEFAULT_THRESHOLD) -> List[Dict[str, Any]]:
+    """
+    One row per benchmark in both files: medians, their ratio and whether
+    the new median is more than threshold slower than the base one.
+    """
+    old = json.loads(Path(base).read_text())["benchmarks"]
+    cur = json.loads(Path(new).read_text())["benchmarks"]
+    rows = []
+    for name in old.keys() & cur.keys():
+        before, after = old[name]["median_s"], cur[name]["median_s"]
+        ratio = after / before if before else float("inf")
+        rows.append({
+            "name": name, "base_s": before, "new_s": after, "ratio": round(ratio, 3),
+            "regression": ratio > 1 + threshold,
+        })
+    return sorted(rows, key=lambda r: r["name"])
+
+
+def _iter_lines(rows: List[Dict[str, Any]], missing: List[str]) -> Iterator[str]:
+    for r in rows:
+        flag = "REGRESSION" if r["regression"] else ""
+        yield f"{r['name']:<40} {r['base_s']:>10.4f}s {r['new_s']:>10.4f}s {r['ratio']:>7.2f}x  {flag}"
+    for name in missing:
+        yield f"{name:<40} (only in one file)"
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Run the benchmark suite or compare two result files")
+    sub = parser.add_subparsers(dest="command", required=True)
+    r = sub.add_parser("run", help="Run benchmarks and store the results as JSON")
+    r.add_argument("-k", dest="select", default=None, help="Only benchmarks whose name contains this")
+    r.add_argument("--repeats", type=int, default=5, help="Timed runs per benchmark (default: 5)")
+    r.add_argument("--quick", action="store_true", help="Crawl trees up to 10^4 nodes, 3 e2e universities")
+    r.add_argument("--stub-latency", type=Latency.parse, default=None,
+                   help="Delay of the e2e stubs, e.g. lognormal:0.05:0.6 (default: none)")
+    r.add_argument("--rate-limits", action="store_true",
+                   help="Keep the production Wikidata API / WDQS rate limits in the e2e benchmarks")
+    r.add_argument("--out", default=None, help="Result file (default: results/bench/<timestamp>.json)")
+    c = sub.add_parser("compare", help="Flag benchmarks that got slower than a baseline")
+    c.add_argument("base")
+    c.add_argument("new")
+    c.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                   help=f"Allowed slowdown of the median, as a fraction (default: {DEFAULT_THRESHOLD})")
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        out = run(
+            args.select, args.repeats, args.quick, args.stub_latency, args.out,
+            progress=lambda name, res: print(
+                f"{name:<40} median {res['median_s']:.4f}s  {res['items_per_s'] or 0:>12,.0f} items/s",
+                flush=True,
+            ),
+            rate_limits=args.rate_limits,
+        )
+        print(f"Results written to {out}")
+        return 0
+
+    rows = compare(Path(args.base), Path(args.new), args.threshold)
+    names = {r["name"] for r in rows}
+    base_file = json.loads(Path(args.base).read_text())
+    new_file = json.loads(Path(args.new).read_text())
+    if base_file.get("rate_limits") != new_file.get("rate_limits"):
+        print("warning: only one of the runs kept the rate limits; e2e timings are not comparable")
+    base, new = base_file["benchmarks"], new_file["benchmarks"]
+    for line in _iter_lines(rows, sorted((base.keys() | new.keys()) - names)):
+        print(line)
+    regressions = [r["name"] for r in rows if r["regression"]]
+    if regressions:
+        print(f"{len(regressions)} regression(s) beyond {args.threshold:.0%}: {', '.join(regressions)}")
+        return 1
+    print(f"No regressions beyond {args.threshold:.0%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,166 @@
+"""
+Synthetic Wikidata served by the benchmark stubs, seeded from eval/ground_truth.py.
+
+Every ground-truth university becomes an item (P31 university, P17 United
+States, P856 website) and each of its schools one of three kinds, in turn:
+linked (P361 to the university), orphan (P361 to the school before it, so
+only search and the ancestry check find it) or missing (no item at all).
+Discover therefore exercises all of its matching paths. `extra` adds
+generated universities of the same shape, for harvest and batch runs of
+any size.
+"""
+
+import random
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from wikidata_discover.eval.ground_truth import GROUND_TRUTH
+
+UNIVERSITY_CLASS = "Q3918"
+COUNTRY = "Q30"
+_SCHOOL_TYPE = "Q2385804"  # educational institution
+_DEPARTMENTS = ("Department of Mathematics", "Department of History", "Department of Chemistry")
+# generated items are numbered from here, far from the ground-truth QIDs
+_FIRST_QID = 90_000_000
+_SUBJECTS = (
+    "Law", "Medicine", "Business", "Engineering", "Nursing", "Education", "Public Health",
+    "Arts and Sciences", "Architecture", "Social Work", "Journalism", "Music", "Dentistry",
+)
+
+
+@dataclass
+class Item:
+    qid: str
+    label: str
+    claims: Dict[str, List[str]] = field(default_factory=dict)
+    aliases: List[str] = field(default_factory=list)
+    lastrevid: int = 1
+
+
+class StubWorld:
+    """Items, edges and search index behind the stub WDQS and Wikidata API."""
+
+    def __init__(self, extra: int = 0, seed: int = 0):
+        self.items: Dict[str, Item] = {}
+        # university QID -> every school name an LLM should extract
+        self.schools: Dict[str, List[str]] = {}
+        self._children: Dict[str, List[Tuple[str, str]]] = {}
+        self._next = _FIRST_QID
+        for qid, truth in GROUND_TRUTH.items():
+            self._add_university(qid, truth["name"], truth.get("website"), truth["schools"])
+        rng = random.Random(seed)
+        for i in range(extra):
+            name = f"University {i + 1}"
+            count = rng.randint(4, len(_SUBJECTS))
+            self._add_university(
+                self._new_qid(), name, f"https://u{i + 1}.example.edu",
+                [f"{name} School of {s}" for s in rng.sample(_SUBJECTS, count)],
+            )
+        self._labels = {
+            qid: [item.label.lower()] + [a.lower() for a in item.aliases]
+            for qid, item in self.items.items()
+        }
+
+    def _new_qid(self) -> str:
+        self._next += 1
+        return f"Q{self._next}"
+
+    def _add(self, item: Item) -> Item:
+        self.items[item.qid] = item
+        for prop, values in item.claims.items():
+            if prop in ("P361", "P749"):
+                for parent in values:
+                    self._children.setdefault(parent, []).append((item.qid, prop))
+        return item
+
+    def _add_university(self, qid: str, name: str, website: Optional[str], schools: List[str]) -> None:
+        claims = {"P31": [UNIVERSITY_CLASS], "P17": [COUNTRY]}
+        if website:
+            claims["P856"] = [website]
+        self._add(Item(qid, name, claims))
+        self.schools[qid] = list(schools)
+        parent = qid
+        for i, school in enumerate(schools):
+            kind = i % 3
+            if kind == 2:
+                continue  # missing: only the LLM knows it
+            item = self._add(Item(self._new_qid(), school, {"P31": [_SCHOOL_TYPE], "P361": [parent]}))
+            parent = item.qid if kind == 0 else qid
+
+    # ---- WDQS ----
+
+    def universities(self) -> List[Item]:
+        return [i for i in self.items.values() if UNIVERSITY_CLASS in i.claims.get("P31", ())]
+
+    def edges(self, parent: str) -> List[Tuple[str, str]]:
+        """(child, prop) pairs below parent, as the hierarchy queries return them."""
+        return list(self._children.get(parent, []))
+
+    def ancestors(self, qid: str) -> Set[str]:
+        seen: Set[str] = set()
+        todo = [qid]
+        while todo:
+            item = self.items.get(todo.pop())
+            for prop in ("P361", "P749"):
+                for parent in item.claims.get(prop, []) if item else ():
+                    if parent not in seen:
+                        seen.add(parent)
+                        todo.append(parent)
+        return seen
+
+    # ---- Wikidata API ----
+
+    def search(self, text: str, limit: int = 10) -> List[Item]:
+        """wbsearchentities: label or alias prefix first, then word containment."""
+        needle = text.lower().strip()
+        words = set(re.findall(r"\w+", needle))
+        prefix, contained = [], []
+        for qid, labels in self._labels.items():
+            if any(label.startswith(needle) for label in labels):
+                prefix.append(qid)
+            elif words and any(words <= set(re.findall(r"\w+", label)) for label in labels):
+                contained.append(qid)
+        return [self.items[q] for q in (prefix + contained)[:limit]]
+
+    def entity_json(self, qid: str, props: Set[str], language: str = "en") -> Dict[str, Any]:
+        """One entity in wbgetentities shape."""
+        item = self.items.get(qid)
+        if item is None:
+            return {"id": qid, "missing": ""}
+        entity: Dict[str, Any] = {"id": qid, "type": "item"}
+        if "info" in props or not props:
+            entity["lastrevid"] = item.lastrevid
+        if "labels" in props:
+            entity["labels"] = {language: {"language": language, "value": item.label}}
+        if "aliases" in props:
+            entity["aliases"] = {language: [{"language": language, "value": a} for a in item.aliases]}
+        if "claims" in props:
+            entity["claims"] = {
+                prop: [{"mainsnak": {"snaktype": "value", "datavalue": {"value": _datavalue(v)}}}
+                       for v in values]
+                for prop, values in item.claims.items()
+            }
+        return entity
+
+    # ---- LLM ----
+
+    def units_for(self, prompt: str) -> List[Dict[str, Any]]:
+        """What a model would extract for the university or sub-unit named in prompt."""
+        line = re.sub(r"^Input:\s*", "", prompt.strip().splitlines()[-1])  # Gemini inlines the system prompt
+        subunit = re.match(r"(.+?) \(part of (.+?)\) --", line)
+        if subunit:
+            return [_unit(f"{subunit.group(1)} {d}") for d in _DEPARTMENTS]
+        label = line.rsplit(" -- ", 1)[0].strip()
+        for qid, schools in self.schools.items():
+            if self.items[qid].label == label:
+                return [_unit(s) for s in schools]
+        return []
+
+
+def _datavalue(value: str) -> Any:
+    return {"entity-type": "item", "id": value} if re.fullmatch(r"Q\d+", value) else value
+
+
+def _unit(name: str) -> Dict[str, Any]:
+    return {"name": name, "unit_type": "school", "city": "", "state": "", "website": None}
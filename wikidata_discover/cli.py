@@ -1,10 +1,14 @@
 import argparse
 import logging
-from wikidata_discover.discovery import Discovery
-from wikidata_discover.harvester import fetch_us_universities
 import wikidata_discover.config as config
 
+# batch discover prefetches this many universities ahead, so a run cut short
+# by a budget has not loaded the rest
+_PREFETCH_CHUNK = 50
 
+
+# Subcommands import what they use inside their branch, so `--help` and
+# `harvest` never load pandas, rapidfuzz, numpy or the LLM SDKs.
 def run_cli():
     parser = argparse.ArgumentParser(
         description="Wikidata tools: discover divisions or harvest universities"
@@ -15,24 +19,342 @@ def run_cli():
     d = sub.add_parser("discover", help="Find missing divisions for a university")
     d.add_argument(
     "university_qids",
-    nargs="+",
+    nargs="*",
     help="One or more Wikidata Q-IDs (e.g. Q49210 Q49115 ...)",
     )
+    d.add_argument(
+        "--from-harvest", metavar="FILE", default=None,
+        help="Also take the universities of a harvest file (NDJSON or legacy JSON)",
+    )
+    d.add_argument(
+        "--prioritize", action="store_true",
+        help="Process universities with the most expected missing units first",
+    )
+    d.add_argument(
+        "--budget", type=int, default=None, metavar="N",
+        help="Process at most N universities (the top N with --prioritize)",
+    )
     d.add_argument("--llm", dest="llm_model", default=None)
     d.add_argument("--debug", action="store_true", help="Enable debug logging")
+    d.add_argument(
+        "--stream", action="store_true",
+        help="Stream LLM extraction and start matching units as they arrive",
+    )
+
+    d.add_argument("--max-depth", type=int, default=None, help="Hierarchy crawl depth limit")
+    d.add_argument("--max-nodes", type=int, default=None, help="Hierarchy crawl node limit")
+    d.add_argument(
+        "--max-queries", type=int, default=None, help="SPARQL query budget per hierarchy crawl"
+    )
+    d.add_argument(
+        "--crawl-deadline", type=float, default=None, help="Wall-time budget per crawl (seconds)"
+    )
+    d.add_argument(
+        "--index", default=None,
+        help="Offline hierarchy index built by ingest-dump (overrides ENTITY_INDEX_PATH)",
+    )
+    d.add_argument(
+        "--recursive", action="store_true",
+        help="Also discover departments, programs, ... below each unit (default depth 3)",
+    )
+    d.add_argument(
+        "--depth", type=int, default=None,
+        help="Levels to discover: 1 = schools, 2 = +departments, 3 = full tree (implies --recursive)",
+    )
+    d.add_argument(
+        "--max-llm-calls", type=int, default=None,
+        help="LLM call budget per recursive run or per batch",
+    )
+    d.add_argument(
+        "--max-tokens", type=int, default=None, help="Token budget per recursive run or per batch"
+    )
+    d.add_argument(
+        "--time-budget", type=float, default=None,
+        help="Wall-time budget per recursive run or per batch (seconds)",
+    )
+    d.add_argument(
+        "--workers", type=int, default=None,
+        help="Units expanded in parallel in a recursive run (default: RECURSIVE_WORKERS or 4)",
+    )
+    snapshots = d.add_mutually_exclusive_group()
+    snapshots.add_argument(
+        "--record", metavar="DIR", default=None,
+        help="Save every Wikidata, SPARQL and LLM response of the run to DIR",
+    )
+    snapshots.add_argument(
+        "--replay", metavar="DIR", default=None,
+        help="Run offline from the responses saved by --record DIR; unrecorded requests fail",
+    )
+
+    # enqueue / worker subcommands: discover through a shared work queue
+    e = sub.add_parser("enqueue", help="Add universities to the discover work queue")
+    e.add_argument("university_qids", nargs="*", help="Q-IDs to add")
+    e.add_argument(
+        "--from-harvest", metavar="FILE", default=None,
+        help="Add every university of a harvest file (NDJSON or legacy JSON)",
+    )
+    e.add_argument(
+        "--prioritize", action="store_true",
+        help="Give universities with more expected missing units a higher priority",
+    )
+    e.add_argument(
+        "--queue", default=None,
+        help="Queue file (default: WORK_QUEUE_PATH or results/queue.sqlite)",
+    )
+
+    w = sub.add_parser("worker", help="Claim universities from the work queue and discover them")
+    w.add_argument(
+        "--queue", default=None,
+        help="Queue file (default: WORK_QUEUE_PATH or results/queue.sqlite)",
+    )
+    w.add_argument("--llm", dest="llm_model", default=None)
+    w.add_argument("--stream", action="store_true", help="Stream LLM extraction")
+    w.add_argument(
+        "--lease", type=float, default=None,
+        help="Lease length in seconds (default: WORK_QUEUE_LEASE or 600)",
+    )
+    w.add_argument("--max-items", type=int, default=None, help="Stop after N universities")
+    w.add_argument(
+        "--wait", action="store_true", help="Keep polling when the queue is empty instead of exiting"
+    )
+    w.add_argument("--worker-id", default=None, help="Name in the queue (default: host:pid)")
+
+    # serve subcommand
+    s = sub.add_parser(
+        "serve", help="Run a long-lived JSON service for discover, match and harvest requests"
+    )
+    s.add_argument("--host", default="127.0.0.1", help="Address to listen on (default: 127.0.0.1)")
+    s.add_argument("--port", type=int, default=8765, help="Port to listen on (default: 8765)")
+    s.add_argument("--socket", default=None, help="Listen on this Unix socket instead of TCP")
+    s.add_argument("--llm", dest="llm_model", default=None)
 
     # harvest subcommand
-    h = sub.add_parser("harvest", help="Fetch all U.S. universities to JSON")
+    h = sub.add_parser("harvest", help="Fetch all U.S. universities to NDJSON")
+    h.add_argument(
+        "--out", default=None,
+        help="Output file, one JSON object per line (default: universities_us.ndjson, "
+        "or universities.ndjson with --countries/--all)",
+    )
+    h.add_argument("--table", action="store_true", help="Print a sample table of the results")
+    scope = h.add_mutually_exclusive_group()
+    scope.add_argument(
+        "--countries", nargs="+", metavar="QID",
+        help="Harvest these countries (e.g. Q30 Q145 Q183) into one file with a country column",
+    )
+    scope.add_argument("--all", action="store_true", help="Harvest every country")
+    h.add_argument(
+        "--workers", type=int, default=None,
+        help="Concurrent country shards (default: HARVEST_WORKERS or 4)",
+    )
+    h.add_argument(
+        "--index", default=None,
+        help="Offline hierarchy index built by ingest-dump (overrides ENTITY_INDEX_PATH)",
+    )
+
+    # ingest-dump subcommand
+    i = sub.add_parser(
+        "ingest-dump", help="Build an offline hierarchy index from a Wikidata JSON dump"
+    )
+    i.add_argument("dump", help="Path to latest-all.json.bz2 / .gz (or plain JSON)")
+    i.add_argument(
+        "--out", default="results/cache/hierarchy_index.sqlite",
+        help="SQLite index to write (default: results/cache/hierarchy_index.sqlite)",
+    )
+    i.add_argument(
+        "--workers", type=int, default=None,
+        help="Decoder processes (default: CPU count - 1)",
+    )
+
+    # refresh-hierarchy subcommand
+    r = sub.add_parser(
+        "refresh-hierarchy",
+        help="Re-check saved hierarchy crawls by lastrevid and report changed edges",
+    )
+    r.add_argument("university_qids", nargs="+", help="Root Q-IDs to refresh")
+
+    # convert-harvest subcommand
+    c = sub.add_parser(
+        "convert-harvest", help="Index a harvest file (NDJSON or legacy JSON) into SQLite"
+    )
+    c.add_argument("src", help="e.g. universities_us.ndjson or results/universities_us.json")
+    c.add_argument(
+        "--out", default=None,
+        help="SQLite file (default: HARVEST_STORE_PATH or results/cache/universities.sqlite)",
+    )
 
     args = parser.parse_args()
+    if getattr(args, "index", None):
+        config.ENTITY_INDEX_PATH = args.index
 
     if args.command == "discover":
         if args.debug:
             logging.basicConfig(level=logging.DEBUG, force=True)
         if args.llm_model:
             config.LLM_MODEL = args.llm_model
-        for qid in args.university_qids:
-            Discovery(qid).discover_missing()
+        for name, value in (
+            ("CRAWL_MAX_DEPTH", args.max_depth),
+            ("CRAWL_MAX_NODES", args.max_nodes),
+            ("CRAWL_MAX_QUERIES", args.max_queries),
+            ("CRAWL_DEADLINE", args.crawl_deadline),
+        ):
+            if value is not None:
+                setattr(config, name, value)
+        if args.record or args.replay:
+            from wikidata_discover import replay
+
+            replay.start(args.record or args.replay, replaying=bool(args.replay))
+            try:
+                _discover(args, d)
+            finally:
+                recorder = replay.stop()
+                print(f"{'Replayed' if args.replay else 'Recorded'} {dict(recorder.stats)}")
+        else:
+            _discover(args, d)
+
+    elif args.command == "enqueue":
+        from wikidata_discover.work_queue import WorkQueue
+
+        qids = list(args.university_qids)
+        records = {}
+        if args.from_harvest:
+            from wikidata_discover.harvester import iter_universities
+
+            records = {r["qid"]: r for r in iter_universities(args.from_harvest)}
+            qids += list(records)
+        priorities = None
+        if args.prioritize and qids:
+            from wikidata_discover.prioritize import rank_universities
+
+            priorities = {r["qid"]: r["score"] for r in rank_universities(qids, records)}
+        queue = WorkQueue(args.queue)
+        added = queue.enqueue(qids, priorities)
+        print(f"Queued {added} new universities in {queue.path}: {queue.stats()}")
+
+    elif args.command == "worker":
+        from wikidata_discover.work_queue import WorkQueue, discover_one, run_worker, share_rate_limits
+
+        logging.basicConfig(level=logging.INFO)
+        if args.llm_model:
+            config.LLM_MODEL = args.llm_model
+        queue = WorkQueue(args.queue)
+        share_rate_limits(queue)
+        stats = run_worker(
+            queue,
+            lambda qid: discover_one(qid, stream=args.stream),
+            worker=args.worker_id,
+            lease=args.lease,
+            max_items=args.max_items,
+            wait=args.wait,
+        )
+        print(f"Worker finished: {stats}; queue: {queue.stats()}")
+
+    elif args.command == "serve":
+        from wikidata_discover.server import serve
+
+        logging.basicConfig(level=logging.INFO)
+        if args.llm_model:
+            config.LLM_MODEL = args.llm_model
+        serve(args.host, args.port, args.socket)
 
     elif args.command == "harvest":
-        fetch_us_universities()
+        if args.countries or args.all:
+            from wikidata_discover.harvester import harvest_countries
+
+            harvest_countries(
+                None if args.all else args.countries,
+                args.out or "universities.ndjson",
+                workers=args.workers,
+            )
+        else:
+            from wikidata_discover.harvester import fetch_us_universities
+
+            fetch_us_universities(args.out or "universities_us.ndjson", show_table=args.table)
+
+    elif args.command == "refresh-hierarchy":
+        from wikidata_discover.hierarchy import (
+            SNAPSHOT_DIR, crawl_many, refresh_graph, write_change_report,
+        )
+
+        qids = list(dict.fromkeys(args.university_qids))
+        first_time = [q for q in qids if not (SNAPSHOT_DIR / q).exists()]
+        if len(first_time) > 1:
+            # one shared crawl fills the entity store, so overlapping
+            # systems/campuses are fetched once and the full crawls below hit it
+            crawl_many(first_time)
+        for qid in qids:
+            graph, diff = refresh_graph(qid)
+            path = write_change_report(diff)
+            print(
+                f"{qid}: {len(graph)} nodes, {len(diff['changed'])} changed, "
+                f"+{len(diff['added'])}/-{len(diff['removed'])} edges -> {path}"
+            )
+
+    elif args.command == "convert-harvest":
+        from wikidata_discover.harvest_store import DEFAULT_HARVEST_STORE, convert_harvest
+
+        dest = args.out or config.HARVEST_STORE_PATH or DEFAULT_HARVEST_STORE
+        count = convert_harvest(args.src, dest)
+        print(f"Indexed {count} universities into {dest}")
+
+    elif args.command == "ingest-dump":
+        from wikidata_discover.dump_ingest import ingest_dump
+
+        logging.basicConfig(level=logging.INFO)
+        stats = ingest_dump(args.dump, args.out, workers=args.workers)
+        print(
+            f"Indexed {stats['entities']} entities (+{stats['referenced']} referenced) "
+            f"and {stats['edges']} edges into {args.out}"
+        )
+
+
+def _discover(args, parser):
+    """Batch or recursive discover for the QIDs given on the command line."""
+    from wikidata_discover.recursive import RecursionBudget
+
+    records = {}
+    if args.from_harvest:
+        from wikidata_discover.harvester import iter_universities
+
+        records = {r["qid"]: r for r in iter_universities(args.from_harvest)}
+    # no crawl up front: discover only checks ancestry of indirect matches
+    qids = list(dict.fromkeys(args.university_qids + list(records)))
+    if not qids:
+        parser.error("give one or more Q-IDs or --from-harvest")
+    if args.prioritize:
+        from wikidata_discover.prioritize import rank_universities
+
+        ranked = rank_universities(qids, records)
+        qids = [r["qid"] for r in ranked]
+        for r in ranked[:10]:
+            print(
+                f"{r['qid']}: score {r['score']} ({r['children']} linked children"
+                f"{', reported before' if r['reported'] else ''})"
+            )
+    if args.budget is not None:
+        qids = qids[:args.budget]
+
+    limits = dict(
+        max_llm_calls=args.max_llm_calls, max_tokens=args.max_tokens, deadline=args.time_budget
+    )
+    if args.recursive or args.depth is not None:
+        from wikidata_discover.recursive import discover_recursive
+
+        for qid in qids:
+            budget = RecursionBudget.from_config(max_depth=args.depth or 3, **limits)
+            discover_recursive(qid, budget, workers=args.workers)
+        return
+
+    from wikidata_discover.discovery import Discovery, prefetch_universities
+
+    budget = RecursionBudget.from_config(**limits)
+    preloaded = {}
+    with budget.running():
+        for i, qid in enumerate(qids):
+            reason = budget.exhausted()
+            if reason:
+                print(f"Stopped at the {reason} limit; {len(qids) - i} universities not processed")
+                break
+            if len(qids) > 1 and i % _PREFETCH_CHUNK == 0:
+                # labels, websites and direct children for the next QIDs in a few batched calls
+                preloaded.update(prefetch_universities(qids[i:i + _PREFETCH_CHUNK]))
+            Discovery(qid, preloaded=preloaded.pop(qid, None)).discover_missing(stream=args.stream)
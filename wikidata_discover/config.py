@@ -1,6 +1,5 @@
 from dotenv import load_dotenv
 import os
-from rich.console import Console
 
 load_dotenv()
 
@@ -12,9 +11,83 @@ USER_AGENT = os.getenv("WD_BOT_USERAGENT", "AcademiaBot/1.0 (ipeirotis@example.c
 LLM_MODEL = os.getenv("LLM_MODEL", "gpt-4o")
 ANTHROPIC_MODEL = os.getenv("ANTHROPIC_MODEL", "claude-opus-4-6")
 GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
-SPARQL_ENDPOINT = "https://query.wikidata.org/sparql"
+# service endpoints; point them at local stand-ins (wikidata_discover.bench)
+# for load tests. The LLM SDKs use their default URLs when these are unset.
+SPARQL_ENDPOINT = os.getenv("SPARQL_ENDPOINT", "https://query.wikidata.org/sparql")
+WD_API_URL = os.getenv("WD_API_URL", "https://www.wikidata.org/w/api.php")
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
+ANTHROPIC_BASE_URL = os.getenv("ANTHROPIC_BASE_URL") or None
+GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL") or None
 
-console = Console()
+# choose_match prompts list only the K most similar choices, unless the best
+# rapidfuzz score is below MIN_SCORE (then the full list is sent); 0 disables.
+# Universities whose children listing is long enough for prompt caching
+# keep the full listing and shortlist only the search hits.
+MATCH_SHORTLIST_K = int(os.getenv("MATCH_SHORTLIST_K", "15"))
+MATCH_SHORTLIST_MIN_SCORE = float(os.getenv("MATCH_SHORTLIST_MIN_SCORE", "60"))
+
+# local SQLite entity/edge store shared by harvest, hierarchy and discover
+ENTITY_STORE_PATH = os.getenv("ENTITY_STORE_PATH", "")  # default: results/cache/entities.sqlite
+ENTITY_STORE_MAX_AGE_DAYS = float(os.getenv("ENTITY_STORE_MAX_AGE_DAYS", "7"))
+# SQLite journal mode of the store; use "delete" on network filesystems
+ENTITY_STORE_JOURNAL = os.getenv("ENTITY_STORE_JOURNAL", "wal")
+# offline index built by `ingest-dump`; when set, hierarchy/discover/harvest
+# read entities and edges from it and never query Wikidata for them
+ENTITY_INDEX_PATH = os.getenv("ENTITY_INDEX_PATH", "")
+
+# hierarchy crawl budgets (empty = unlimited) and P31 types whose subclasses
+# are recorded but never expanded. The default classes (hospital, periodical)
+# have small subclass closures; broad ones such as business (Q4830453) or
+# building (Q41176) mean one very large closure query per fresh cache, so they
+# are opt-in.
+def _opt_num(name: str, cast=int):
+    value = os.getenv(name, "")
+    return cast(value) if value else None
+
+
+CRAWL_MAX_DEPTH = _opt_num("CRAWL_MAX_DEPTH")
+CRAWL_MAX_NODES = _opt_num("CRAWL_MAX_NODES")
+CRAWL_MAX_QUERIES = _opt_num("CRAWL_MAX_QUERIES")
+CRAWL_DEADLINE = _opt_num("CRAWL_DEADLINE", float)  # seconds
+CRAWL_DENY_TYPES = [
+    t for t in os.getenv("CRAWL_DENY_TYPES", "Q16917,Q1002697").split(",") if t
+]
+CRAWL_ALLOW_TYPES = [t for t in os.getenv("CRAWL_ALLOW_TYPES", "").split(",") if t]
+
+# indexed harvest (see `convert-harvest`); Discovery reads labels/websites from it
+HARVEST_STORE_PATH = os.getenv("HARVEST_STORE_PATH", "")  # default: results/cache/universities.sqlite
+# concurrent country shards in `harvest --countries/--all`
+HARVEST_WORKERS = int(os.getenv("HARVEST_WORKERS", "4"))
+
+# `discover --recursive`: run-wide limits (empty = unlimited) and parallel expansions
+RECURSIVE_MAX_LLM_CALLS = _opt_num("RECURSIVE_MAX_LLM_CALLS")
+RECURSIVE_MAX_TOKENS = _opt_num("RECURSIVE_MAX_TOKENS")
+RECURSIVE_DEADLINE = _opt_num("RECURSIVE_DEADLINE", float)  # seconds
+RECURSIVE_WORKERS = int(os.getenv("RECURSIVE_WORKERS", "4"))
+
+# shared work queue for `enqueue` / `worker`; use "delete" on network filesystems
+WORK_QUEUE_PATH = os.getenv("WORK_QUEUE_PATH", "")  # default: results/queue.sqlite
+WORK_QUEUE_LEASE = float(os.getenv("WORK_QUEUE_LEASE", "600"))  # seconds
+WORK_QUEUE_MAX_ATTEMPTS = int(os.getenv("WORK_QUEUE_MAX_ATTEMPTS", "3"))
+WORK_QUEUE_JOURNAL = os.getenv("WORK_QUEUE_JOURNAL", "wal")
+
+# `serve`: how long a university's children and match index stay in memory
+SERVE_CACHE_TTL = float(os.getenv("SERVE_CACHE_TTL", "3600"))  # seconds
+
+_console = None
+
+
+def __getattr__(name: str):
+    # `console` is created on first use so that importing config (every
+    # command does) does not load rich
+    global _console
+    if name == "console":
+        if _console is None:
+            from rich.console import Console
+
+            _console = Console()
+        return _console
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def require_key(name: str, val) -> str:
@@ -0,0 +1,173 @@
+"""
+Budgets and P31 type pruning for hierarchy crawls.
+
+A CrawlPolicy bounds a crawl by depth, node count, number of SPARQL
+queries and wall time, and stops expansion at nodes whose P31 type falls
+under a denied class (or outside the allowed classes). Nodes that are
+pruned are still recorded as children; only their own subtrees are
+skipped. What was cut and why is collected in CrawlStats.
+
+Class membership uses the P279 subclass closure of each listed class,
+fetched once from WDQS and cached on disk.
+"""
+
+import json
+import logging
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Set
+
+import wikidata_discover.config as config
+from wikidata_discover.sparql_helpers import execute_sparql_bindings
+
+logger = logging.getLogger(__name__)
+
+_CLOSURE_CACHE_DIR = Path(__file__).parent / "results" / "cache" / "subclass_closure"
+_CLOSURE_TTL = 30 * 24 * 3600  # seconds; the class tree changes slowly
+
+_SUBCLASS_SPARQL = """
+SELECT DISTINCT ?cls WHERE {{ ?cls wdt:P279* wd:{qid} . }}
+"""
+
+_closure_memo: Dict[str, Set[str]] = {}
+
+
+def subclass_closure(qid: str, fetch: bool = True) -> Set[str]:
+    """
+    qid plus all its transitive P279 subclasses, memoized in-process and on
+    disk (results/cache/subclass_closure/). With fetch=False (offline use)
+    a missing cache entry yields just {qid}.
+    """
+    if qid in _closure_memo:
+        return _closure_memo[qid]
+
+    path = _CLOSURE_CACHE_DIR / f"{qid}.json"
+    closure: Optional[Set[str]] = None
+    if path.exists() and time.time() - path.stat().st_mtime < _CLOSURE_TTL:
+        try:
+            closure = set(json.loads(path.read_text()))
+        except ValueError:
+            closure = None
+
+    if closure is None and fetch:
+        rows = execute_sparql_bindings(_SUBCLASS_SPARQL.format(qid=qid))
+        closure = {b["cls"]["value"].rsplit("/", 1)[-1] for b in rows} | {qid}
+        _CLOSURE_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(sorted(closure)))
+        logger.info("subclass closure of %s: %d classes", qid, len(closure))
+    elif closure is None:
+        logger.warning("no cached subclass closure for %s; matching it exactly", qid)
+        closure = {qid}
+
+    _closure_memo[qid] = closure
+    return closure
+
+
+@dataclass
+class CrawlStats:
+    """What a crawl did and what it left out."""
+
+    nodes: int = 0
+    queries: int = 0
+    depth: int = 0
+    seconds: float = 0.0
+    # nodes recorded but not expanded, by reason ("type", "max_depth", ...)
+    pruned: Counter = field(default_factory=Counter)
+    # P31 classes that caused type pruning
+    pruned_types: Counter = field(default_factory=Counter)
+    # first budget that cut the crawl short, if any
+    truncated: Optional[str] = None
+    examples: Dict[str, List[str]] = field(default_factory=dict)
+
+    def prune(self, reason: str, nodes: Sequence[str]) -> None:
+        if not nodes:
+            return
+        self.pruned[reason] += len(nodes)
+        sample = self.examples.setdefault(reason, [])
+        sample.extend(nodes[: max(0, 10 - len(sample))])
+        if reason != "type" and self.truncated is None:
+            self.truncated = reason
+
+    def as_dict(self) -> Dict:
+        return {
+            "nodes": self.nodes,
+            "queries": self.queries,
+            "depth": self.depth,
+            "seconds": round(self.seconds, 2),
+            "pruned": dict(self.pruned),
+            "pruned_types": dict(self.pruned_types.most_common(10)),
+            "truncated": self.truncated,
+            "examples": self.examples,
+        }
+
+
+@dataclass
+class CrawlPolicy:
+    """Limits for one crawl; None means unlimited, empty type lists mean no filter."""
+
+    max_depth: Optional[int] = None
+    max_nodes: Optional[int] = None
+    max_queries: Optional[int] = None
+    deadline: Optional[float] = None  # seconds of wall time
+    allow_types: Sequence[str] = ()
+    deny_types: Sequence[str] = ()
+    # resolve subclass closures over the network when not cached
+    fetch_closures: bool = True
+
+    _started: float = field(default=0.0, init=False, repr=False)
+    _allowed: Optional[Set[str]] = field(default=None, init=False, repr=False)
+    _denied: Optional[Set[str]] = field(default=None, init=False, repr=False)
+
+    @classmethod
+    def from_config(cls, **overrides) -> "CrawlPolicy":
+        settings = dict(
+            max_depth=config.CRAWL_MAX_DEPTH,
+            max_nodes=config.CRAWL_MAX_NODES,
+            max_queries=config.CRAWL_MAX_QUERIES,
+            deadline=config.CRAWL_DEADLINE,
+            allow_types=config.CRAWL_ALLOW_TYPES,
+            deny_types=config.CRAWL_DENY_TYPES,
+        )
+        settings.update({k: v for k, v in overrides.items() if v is not None})
+        return cls(**settings)
+
+    @property
+    def filters_types(self) -> bool:
+        return bool(self.allow_types or self.deny_types)
+
+    def start(self) -> None:
+        self._started = time.monotonic()
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self._started
+
+    def out_of_time(self) -> bool:
+        return self.deadline is not None and self.elapsed() >= self.deadline
+
+    def may_query(self, stats: CrawlStats) -> bool:
+        return self.max_queries is None or stats.queries < self.max_queries
+
+    def _closures(self):
+        if self._denied is None:
+            self._denied = set().union(
+                *(subclass_closure(t, self.fetch_closures) for t in self.deny_types)
+            )
+            self._allowed = set().union(
+                *(subclass_closure(t, self.fetch_closures) for t in self.allow_types)
+            )
+        return self._allowed, self._denied
+
+    def blocking_type(self, types: Iterable[str]) -> Optional[str]:
+        """The P31 type that stops expansion of a node, or None to expand it."""
+        types = list(types)
+        if not types:
+            return None  # untyped nodes are kept: often new, sparsely edited units
+        allowed, denied = self._closures()
+        for t in types:
+            if t in denied:
+                return t
+        if self.allow_types and not any(t in allowed for t in types):
+            return types[0]
+        return None
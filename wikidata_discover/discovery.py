@@ -1,91 +1,129 @@
+import csv
 import json
 import logging
-from typing import List, Dict, Any, Tuple
-from wikidata_discover.sparql_helpers import run_sparql
-from wikidata_discover.sparql_helpers import execute_sparql_bindings
-from wikidata_discover.wikidata_api import quick_wd_search
-from wikidata_discover.hierarchy       import all_descendants
-from wikidata_discover.llm_helpers import LLMHelper
+from typing import Any, Dict, Iterable, List, Tuple
+from wikidata_discover.wikidata_api import cached_wd_search, SearchPrefetcher
+from wikidata_discover.entity_store import EntityStore, get_store
+from wikidata_discover.harvest_store import HarvestStore, get_harvest_store
+from wikidata_discover.hierarchy       import (
+    descendants_among, fetch_edges, fetch_edges_batch, refresh_graph, write_change_report,
+)
+from wikidata_discover.graph           import HierarchyGraph
+from wikidata_discover.crawl_policy    import CrawlStats
+from wikidata_discover.llm_helpers import LLMHelper, summarize_usage, usage_scope
+from wikidata_discover.tfidf_matcher import TfidfMatcher, TFIDF_REJECT
 from wikidata_discover.config import console
+import wikidata_discover.config as config
 
 from rapidfuzz import fuzz
 import re
 
-from rich.table import Table
 from pathlib import Path
-import pandas as pd
 
 RESULTS_DIR = Path(__file__).parent / "results"
 logger = logging.getLogger(__name__)
 
-CHILDREN_SPARQL_TEMPLATE = """
-SELECT ?child ?childLabel WHERE {
-  VALUES ?univ { wd:%s }
-  ?child (wdt:P361|wdt:P355|wdt:P749) ?univ .
-  SERVICE wikibase:label { bd:serviceParam wikibase:language "en". }
-}
-"""
-
-CHILDREN_ALT_LABELS_SPARQL_TEMPLATE = """
-SELECT ?child (GROUP_CONCAT(DISTINCT ?alt; separator="|") AS ?altLabels) WHERE {
-  VALUES ?univ { wd:%s }
-  ?child (wdt:P361|wdt:P355|wdt:P749) ?univ .
-  OPTIONAL { ?child skos:altLabel ?alt . FILTER(LANG(?alt)="en") }
-}
-GROUP BY ?child
-"""
-
-UNIV_INFO_SPARQL = """
-SELECT ?label ?website WHERE {
-  wd:%s rdfs:label   ?label     . FILTER(LANG(?label)="en")
-  OPTIONAL { wd:%s wdt:P856  ?website }
-}
-"""
+# edges from the entity store that make a child "directly linked"
+DIRECT_CHILD_PROPS = {"P361", "P355", "P749"}
 
 
 class Discovery:
-    def __init__(self, university_qid: str):
+    def __init__(
+        self,
+        university_qid: str,
+        store: EntityStore | None = None,
+        hierarchy: HierarchyGraph | None = None,
+        harvest: HarvestStore | None = None,
+        preloaded: Dict[str, Any] | None = None,
+    ):
         self.university_qid = university_qid
+        self.store = store or get_store()
+        self.harvest = harvest if harvest is not None else get_harvest_store()
+        # state from prefetch_universities(): label, website and direct children
+        self._preloaded = preloaded
+        self._children: Dict[str, Dict[str, Any]] | None = (
+            preloaded["children"] if preloaded else None
+        )
+        # a batch run passes the graph from a shared crawl_many()
+        self._graph: HierarchyGraph | None = hierarchy
+        self._tfidf: TfidfMatcher | None = None
+        self.crawl_stats = CrawlStats()
         self.university_label, self.university_website = self.fetch_university_info()
 
     def fetch_university_info(self) -> tuple[str, str | None]:
         """
-        Returns (label, website) for the given QID.
+        Returns (label, website) for the given QID, from the harvest store
+        if one exists, then the entity store (a harvest may already have
+        recorded both) or wbgetentities.
         Website will be None if there's no P856 claim.
         """
-        bindings = execute_sparql_bindings(
-            UNIV_INFO_SPARQL % (self.university_qid, self.university_qid)
-        )
-        if not bindings:
+        if self._preloaded:
+            return self._preloaded["label"], self._preloaded["website"]
+        record = self.harvest.lookup(self.university_qid) if self.harvest else None
+        # legacy harvests carry the bare QID where the label was missing
+        if record and record["label"] and record["label"] != self.university_qid:
+            return record["label"], record["website"]
+        entity = self.store.lookup(self.university_qid)
+        if not entity or not entity["label"]:
+            entity = self.store.get_entities([self.university_qid]).get(self.university_qid)
+        if not entity:
             console.print(f"[red]Could not find info for {self.university_qid}[/red]")
             raise ValueError(f"Info not found for {self.university_qid}")
-
-        b = bindings[0]
-        label = b["label"]["value"]
-        website = b.get("website", {}).get("value")  # None if missing
-        return label, website
+        return entity["label"], entity["website"]
+
+    def _children_entities(self) -> Dict[str, Dict[str, Any]]:
+        """Direct children (linked via P361/P355/P749), read through the entity store."""
+        if self._children is None:
+            qids = [
+                child for child, prop in self.store.children(self.university_qid, fetch_edges)
+                if prop in DIRECT_CHILD_PROPS
+            ]
+            entities = self.store.get_entities(qids)
+            self._children = {qid: entities[qid] for qid in qids if qid in entities}
+        return self._children
 
     def get_existing_children(self) -> List[Tuple[str, str]]:
         # fetch only direct children (already-linked via P361/P355/P749)
-        return run_sparql(CHILDREN_SPARQL_TEMPLATE % self.university_qid, as_tuples=True, main_key="child", label_key="childLabel")
+        return [(qid, e["label"]) for qid, e in self._children_entities().items()]
 
     def get_children_alt_labels(self) -> Dict[str, List[str]]:
         """Return a dict mapping child QID -> list of English altLabels."""
-        bindings = execute_sparql_bindings(
-            CHILDREN_ALT_LABELS_SPARQL_TEMPLATE % self.university_qid
-        )
-        result: Dict[str, List[str]] = {}
-        for b in bindings:
-            qid = b["child"]["value"].split("/")[-1]
-            raw = b.get("altLabels", {}).get("value", "")
-            result[qid] = [a for a in raw.split("|") if a]
-        return result
+        return {qid: e["aliases"] for qid, e in self._children_entities().items()}
 
+    def get_matcher(self) -> TfidfMatcher:
+        """TF-IDF index over the direct children's labels (built once per instance)."""
+        if self._tfidf is None:
+            self._tfidf = TfidfMatcher(
+                self.get_existing_children(), self.get_children_alt_labels(), normalizer=normalize_name
+            )
+        return self._tfidf
+
+    def get_hierarchy(self) -> HierarchyGraph:
+        """Crawled descendant graph of this university (built once per instance)."""
+        if self._graph is None:
+            # reuses the saved crawl, re-expanding only nodes whose lastrevid changed
+            self._graph, diff = refresh_graph(
+                self.university_qid, store=self.store, stats=self.crawl_stats
+            )
+            if not diff["full_crawl"] and (diff["added"] or diff["removed"]):
+                write_change_report(diff)
+        return self._graph
 
     def get_all_descendants_qids(self) -> set[str]:
         # fetch every descendant (for filtering deeper nodes)
-        edges, _ = all_descendants(self.university_qid)
-        return {child for _, child, _, _ in edges}
+        return self.get_hierarchy().descendants(self.university_qid)
+
+    def descendants_among(self, qids: set[str]) -> set[str]:
+        """
+        Which of qids sit somewhere below the university. Uses the local
+        graph when one is at hand (batch crawl or offline index) and a
+        single batched ancestry query otherwise; no crawl is started.
+        """
+        if not qids:
+            return set()
+        if self._graph is not None or self.store.offline:
+            return qids & self.get_all_descendants_qids()
+        return descendants_among(self.university_qid, sorted(qids))
 
     def find_potential_orphans_for(
         self, candidate_name: str, existing_qids: set
@@ -94,31 +132,201 @@ class Discovery:
         Search Wikidata for entities whose English label matches the
         candidate division name and aren't already in existing_qids.
         """
-        hits = quick_wd_search(candidate_name)
+        hits = cached_wd_search(candidate_name)
         return [(qid, label) for qid, label in hits if qid not in existing_qids]
 
 
-    def discover_missing(self) -> List[Dict[str, Any]]:
-        console.print(
-            f"[bold blue]University:[/bold blue] {self.university_label} ({self.university_qid})"
+    def _match_local(
+        self,
+        name: str,
+        direct_children: List[Tuple[str, str]],
+        alt_labels_map: Dict[str, List[str]],
+        tfidf: TfidfMatcher,
+        match_stats: Dict[str, int],
+    ) -> Tuple[str, str] | None:
+        """Match name against the direct children without any network call."""
+        # step 1: fuzzy match against directly linked children (main label + altLabels)
+        for qid, label in direct_children:
+            all_names = [label] + alt_labels_map.get(qid, [])
+            if any(normalize_name(name) == normalize_name(n) or is_fuzzy_match(name, n) for n in all_names):
+                match_stats["fuzzy"] += 1
+                logger.debug("fuzzy match: '%s' -> %s (%s)", name, qid, label)
+                return (qid, label)
+
+        # step 2: char n-gram TF-IDF against the same names; a confident hit
+        # skips both the Wikidata search and the LLM call
+        hit = tfidf.confident_match(name)
+        if hit:
+            match_stats["tfidf_accepted"] += 1
+            logger.debug("tfidf match: '%s' -> %s (%s) %.3f", name, *hit)
+            return hit[:2]
+        return None
+
+    def _match_remote(
+        self,
+        name: str,
+        qsearch_hits: List[Tuple[str, str]],
+        direct_children: List[Tuple[str, str]],
+        alt_labels_map: Dict[str, List[str]],
+        tfidf: TfidfMatcher,
+        match_stats: Dict[str, int],
+    ) -> Tuple[str, str] | None:
+        """
+        Step 3: ask the LLM to choose among the children and Wikidata search
+        hits, unless nothing (child or search hit) is even remotely similar.
+        """
+        direct_qids = {qid for qid, _ in direct_children}
+        hit_choices = [
+            (qid, lbl) for qid, lbl in qsearch_hits if qid not in direct_qids
+        ]
+        choices = direct_children + hit_choices
+        top = tfidf.top_k(name, 1)
+        best = max(
+            [top[0][2] if top else 0.0]
+            + [tfidf.similarity(name, lbl) for _, lbl in qsearch_hits if lbl]
+        )
+        if best < TFIDF_REJECT:
+            match_stats["tfidf_rejected"] += 1
+            logger.debug("tfidf reject: '%s' (best %.3f)", name, best)
+            return None
+
+        shortlist = shortlist_choices(name, choices, alt_labels=alt_labels_map)
+        logger.debug(
+            "choose_match shortlist for '%s': %d of %d choices",
+            name, len(shortlist), len(choices),
+        )
+        match_stats["llm_calls"] += 1
+        if LLMHelper.match_prefix_cacheable(self.university_label, direct_children):
+            # a listing long enough for provider caching is cheaper read from the
+            # cache in full than a per-candidate shortlist that is never cached,
+            # so it stays the prefix and the shortlist only trims the search hits
+            shortlisted = {qid for qid, _ in shortlist}
+            return LLMHelper.choose_match(
+                name, self.university_label, direct_children,
+                extra=[c for c in hit_choices if c[0] in shortlisted],
+            )
+        if len(shortlist) < len(choices):
+            return LLMHelper.choose_match(name, self.university_label, shortlist)
+        return LLMHelper.choose_match(
+            name, self.university_label, direct_children, extra=hit_choices
         )
 
+    def match_divisions(
+        self, divisions: Iterable[Dict[str, Any]], match_stats: Dict[str, int] | None = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Match extracted units against the university's Wikidata children.
+        Returns one {"name", "division", "status", "qid", "label"} dict per
+        named unit, in extraction order, with status "linked", "orphan" or
+        "missing" (qid/label None). Tier counts are added to match_stats.
+        divisions may be a generator (streamed extraction): local matching
+        runs on each unit as soon as it arrives.
+        """
+        if match_stats is None:
+            match_stats = {}
+        for k in ("candidates", "fuzzy", "tfidf_accepted", "tfidf_rejected", "llm_calls"):
+            match_stats.setdefault(k, 0)
         direct_children = self.get_existing_children()
         direct_qids = {qid for qid, _ in direct_children}
-        descendant_qids = self.get_all_descendants_qids()
         alt_labels_map = self.get_children_alt_labels()
+        tfidf = self.get_matcher()
+
+        # pass 1: local tiers, run on each unit as soon as it is extracted. A
+        # Wikidata search is started right away for each unit that stays
+        # unresolved, so those searches overlap the rest of the extraction.
+        resolved: List[List[Any]] = []
+        with SearchPrefetcher() as prefetch:
+            for division in divisions:
+                match_stats["candidates"] += 1
+                name = division.get("name") or division.get("unit")
+                if not name:
+                    continue
+                matched = self._match_local(name, direct_children, alt_labels_map, tfidf, match_stats)
+                if matched is None:
+                    prefetch.submit(name)
+                resolved.append([division, name, matched])
+
+            # pass 2: search hits + LLM for the rest; the searches are in flight
+            for entry in resolved:
+                if entry[2] is None:
+                    entry[2] = self._match_remote(
+                        entry[1], prefetch.result(entry[1]), direct_children,
+                        alt_labels_map, tfidf, match_stats,
+                    )
+            logger.info("%s: search prefetch %s", self.university_qid, prefetch.stats)
+
+        # only matches that are not direct children need the descendant check;
+        # when every match is direct (the common case) nothing is queried
+        indirect = {
+            m[0] for _, _, m in resolved
+            if m is not None and not m[0].startswith("ORPHAN:") and m[0] not in direct_qids
+        }
+        descendant_qids = self.descendants_among(indirect)
+        logger.info(
+            "%s: %d indirect matches, %d under the university",
+            self.university_qid, len(indirect), len(descendant_qids),
+        )
+        logger.info(
+            "%s: %d direct children, %d LLM candidates",
+            self.university_qid, len(direct_children), match_stats["candidates"],
+        )
+
+        # pass 3: classify the outcomes in extraction order
+        rows = []
+        for division, name, matched in resolved:
+            row = {"name": name, "division": division, "status": "missing", "qid": None, "label": None}
+            if matched is None:
+                pass
+            elif matched[0].startswith("ORPHAN:"):
+                row.update(status="orphan", qid=matched[0].split(":", 1)[1])
+            else:
+                qid, label = matched
+                orphan = qid not in direct_qids and qid in descendant_qids
+                row.update(status="orphan" if orphan else "linked", qid=qid, label=label)
+            rows.append(row)
+        return rows
 
+    def discover_missing(self, stream: bool = False) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """
+        Extract candidate units with the LLM, match them against Wikidata and
+        write the CSV, QuickStatements and QA report for the missing ones.
+        With stream=True, local matching and the Wikidata search for each unit
+        start as soon as the model has finished generating it instead of
+        after the whole response. Returns (missing rows, QA report); the
+        report's usage and crawl counts cover this call only, even when other
+        universities are discovered concurrently.
+        """
+        with usage_scope() as usage:
+            return self._discover_missing(stream, usage)
+
+    def _discover_missing(
+        self, stream: bool, usage: List[Dict[str, Any]]
+    ) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        # a reused instance (serve) reports only the crawl done for this run
+        self.crawl_stats = CrawlStats()
+        console.print(
+            f"[bold blue]University:[/bold blue] {self.university_label} ({self.university_qid})"
+        )
+
+        extract = (
+            LLMHelper.stream_divisions_best_available if stream
+            else LLMHelper.extract_divisions_best_available
+        )
+        match_stats: Dict[str, int] = {}
         try:
-            divisions = LLMHelper.extract_divisions_best_available(
-                self.university_label, self.university_website
-            )
+            divisions = extract(self.university_label, self.university_website)
+            # a stream raises here, while it is consumed, if every provider fails
+            rows = self.match_divisions(divisions, match_stats)
         except ValueError as e:
             console.print(f"[red]Error: {e}[/red]")
             raise
-        logger.info(
-            "%s: %d direct children, %d LLM candidates",
-            self.university_qid, len(direct_children), len(divisions),
-        )
+        total_candidates = match_stats.pop("candidates")
+        # set when the streaming provider failed after some units
+        extraction_error = divisions.error if stream else None
+        if extraction_error:
+            console.print(f"[yellow]Extraction stopped early ({extraction_error}); units may be missing[/yellow]")
+
+        from rich.table import Table
 
         missing: List[Dict[str, Any]] = []
         counts = {"exists_linked": 0, "exists_orphan": 0, "missing": 0}
@@ -126,31 +334,9 @@ class Discovery:
         table.add_column("Division")
         table.add_column("Status")
 
-        for division in divisions:
-            name = division.get("name") or division.get("unit")
-            if not name:
-                continue
-
-            # step 1: fuzzy match against directly linked children (main label + altLabels)
-            matched = None
-            for qid, label in direct_children:
-                alt_labels = alt_labels_map.get(qid, [])
-                all_names = [label] + alt_labels
-                if any(normalize_name(name) == normalize_name(n) or is_fuzzy_match(name, n) for n in all_names):
-                    matched = (qid, label)
-                    logger.debug("fuzzy match: '%s' -> %s (%s)", name, qid, label)
-                    break
-
-            # step 2: if no fuzzy match, fall back to LLM with Wikidata search results
-            if not matched:
-                qsearch_hits = quick_wd_search(name)
-                choices = direct_children + [
-                    (qid, lbl) for qid, lbl in qsearch_hits if qid not in direct_qids
-                ]
-                matched = LLMHelper.choose_match(name, self.university_label, choices)
-
-            # step 3: classify the outcome
-            if matched is None:
+        for row in rows:
+            name, division, qid, label = row["name"], row["division"], row["qid"], row["label"]
+            if row["status"] == "missing":
                 status = "missing"
                 counts["missing"] += 1
                 missing.append(
@@ -167,9 +353,8 @@ class Discovery:
                     }
                 )
 
-            elif matched[0].startswith("ORPHAN:"):
-                qid = matched[0].split(":", 1)[1]
-                status = f"exists_orphan -> {qid}"
+            elif row["status"] == "orphan":
+                status = f"exists_orphan -> {qid}" + (f" ({label})" if label else "")
                 counts["exists_orphan"] += 1
                 missing.append(
                     {
@@ -182,30 +367,29 @@ class Discovery:
                 )
 
             else:
-                qid, label = matched
-                if qid not in direct_qids and qid in descendant_qids:
-                    status = f"exists_orphan -> {qid} ({label})"
-                    counts["exists_orphan"] += 1
-                    missing.append(
-                        {
-                            "name": name,
-                            "status": "orphan",
-                            "qid": qid,
-                            "university_qid": self.university_qid,
-                            "university_label": self.university_label,
-                        }
-                    )
-                else:
-                    status = f"exists_linked -> {qid} ({label})"
-                    counts["exists_linked"] += 1
+                status = f"exists_linked -> {qid} ({label})"
+                counts["exists_linked"] += 1
 
             table.add_row(name, status)
 
         console.print(table)
 
+        avoided = match_stats["tfidf_accepted"] + match_stats["tfidf_rejected"]
+        logger.info(
+            "%s: match tiers fuzzy=%d tfidf_accepted=%d tfidf_rejected=%d llm_calls=%d",
+            self.university_qid, match_stats["fuzzy"], match_stats["tfidf_accepted"],
+            match_stats["tfidf_rejected"], match_stats["llm_calls"],
+        )
+        console.print(f"[dim]TF-IDF tier avoided {avoided} LLM match calls[/dim]")
+
         if missing:
             out_file = Path(f"missing_divisions_{self.university_qid}.csv")
-            pd.DataFrame(missing).to_csv(out_file, index=False)
+            # orphan rows carry fewer columns; their missing cells stay empty
+            columns = list(dict.fromkeys(k for row in missing for k in row))
+            with open(out_file, "w", newline="", encoding="utf-8") as f:
+                writer = csv.DictWriter(f, fieldnames=columns, restval="")
+                writer.writeheader()
+                writer.writerows(missing)
             console.print(
                 f"[green]{len(missing)} missing divisions written to {out_file}.[/green]"
             )
@@ -216,7 +400,7 @@ class Discovery:
                 self.university_qid,
                 self.university_label
             )
-        else:
+        elif not extraction_error:
             console.print(
                 "[green]No missing divisions detected - Wikidata seems up to date![/green]"
             )
@@ -224,19 +408,72 @@ class Discovery:
         report = {
             "university_qid": self.university_qid,
             "university_label": self.university_label,
-            "total_candidates": len(divisions),
+            "total_candidates": total_candidates,
+            "extraction_error": extraction_error,
             "exists_linked": counts["exists_linked"],
             "exists_orphan": counts["exists_orphan"],
             "missing": counts["missing"],
+            "match_stats": {**match_stats, "llm_calls_avoided": avoided},
+            "llm_usage": summarize_usage(usage),
         }
+        if self.crawl_stats.nodes:
+            # online runs check descendants without a crawl; offline ones walk the index
+            report["crawl_stats"] = self.crawl_stats.as_dict()
         reports_dir = RESULTS_DIR / "reports"
         reports_dir.mkdir(parents=True, exist_ok=True)
         report_path = reports_dir / f"{self.university_qid}_report.json"
         report_path.write_text(json.dumps(report, indent=2))
         console.print(f"[dim]QA report written to {report_path}[/dim]")
 
-        return missing
+        return missing, report
     
+def prefetch_universities(
+    qids: List[str], store: EntityStore | None = None
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Load label/website, direct children and their altLabels for many
+    universities at once: one wbgetentities call per 50 universities, one
+    VALUES-batched SPARQL query per 100 for the edges not already in the
+    entity store, and one wbgetentities pass for all children together.
+    Returns {qid: state} to hand to Discovery(preloaded=...); unknown QIDs
+    are left out.
+    """
+    store = store or get_store()
+    qids = list(dict.fromkeys(qids))
+    universities = store.get_entities(qids)
+
+    edges: Dict[str, List[Tuple[str, str]]] = {}
+    todo = []
+    for qid in universities:
+        cached = store.cached_children(qid)
+        if cached is None:
+            todo.append(qid)
+        else:
+            edges[qid] = cached
+    if todo:
+        for parent, parent_edges in fetch_edges_batch(todo).items():
+            parent_edges = list(dict.fromkeys(parent_edges))
+            store.put_edges(parent, parent_edges)
+            edges[parent] = parent_edges
+
+    child_qids = {
+        qid: [c for c, prop in edges[qid] if prop in DIRECT_CHILD_PROPS] for qid in universities
+    }
+    children = store.get_entities(c for kids in child_qids.values() for c in kids)
+    logger.info(
+        "prefetched %d universities (%d edge lookups, %d children)",
+        len(universities), len(todo), len(children),
+    )
+    return {
+        qid: {
+            "label": ent["label"],
+            "website": ent["website"],
+            "children": {c: children[c] for c in child_qids[qid] if c in children},
+        }
+        for qid, ent in universities.items()
+    }
+
+
 #helper functions for matching logic
 def normalize_name(name: str) -> str:
     """Generic normalizer for academic division names."""
@@ -270,3 +507,37 @@ def is_fuzzy_match(a: str, b: str) -> bool:
             return True
 
     return False
+
+
+def shortlist_choices(
+    name: str,
+    choices: List[Tuple[str, str]],
+    k: int | None = None,
+    alt_labels: Dict[str, List[str]] | None = None,
+    min_score: float | None = None,
+) -> List[Tuple[str, str]]:
+    """
+    Keep the k choices most similar to name (best first), scoring each by its
+    label and altLabels with the same rapidfuzz scorers as is_fuzzy_match.
+    Returns the full list when the best score is below min_score, since the
+    right answer may then be one the scorers cannot see.
+    """
+    k = config.MATCH_SHORTLIST_K if k is None else k
+    min_score = config.MATCH_SHORTLIST_MIN_SCORE if min_score is None else min_score
+    if k <= 0 or len(choices) <= k:
+        return choices
+
+    alt_labels = alt_labels or {}
+    nn = normalize_name(name)
+    scored = []
+    for qid, label in choices:
+        best = 0.0
+        for other in [label or ""] + alt_labels.get(qid, []):
+            no = normalize_name(other)
+            best = max(best, fuzz.token_sort_ratio(nn, no), fuzz.partial_ratio(nn, no))
+        scored.append((best, qid, label))
+
+    scored.sort(key=lambda t: t[0], reverse=True)
+    if scored[0][0] < min_score:
+        return choices
+    return [(qid, label) for _, qid, label in scored[:k]]
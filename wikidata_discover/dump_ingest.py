@@ -0,0 +1,257 @@
+"""
+Build an offline org-hierarchy index from a Wikidata JSON dump.
+
+The dump (latest-all.json.bz2 / .gz, one entity per line inside a JSON
+array) is streamed, never loaded: lines are handed out in chunks to a
+process pool for decoding and only entities with a hierarchy claim
+(P361/P355/P749/P527/P199) or a university P31 type are kept. Items that
+are only named by another item's edge (e.g. a P355 subsidiary with no
+claims of its own) get a placeholder row, filled in by a second pass over
+the dump. The result is written in the EntityStore schema, so pointing
+ENTITY_INDEX_PATH at it lets hierarchy, discovery and the harvester run
+without WDQS/wbgetentities.
+"""
+
+import bz2
+import gzip
+import json
+import logging
+import multiprocessing
+import os
+import re
+import time
+from collections import deque
+from pathlib import Path
+from typing import IO, Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from wikidata_discover.entity_store import EntityStore
+from wikidata_discover.wikidata_api import compact_entity
+
+logger = logging.getLogger(__name__)
+
+# edges point parent -> child: "has part" style props on the parent...
+DOWN_PROPS = ("P527", "P355", "P199")
+# ...and "part of" style props on the child
+UP_PROPS = ("P361", "P749")
+HIERARCHY_PROPS = DOWN_PROPS + UP_PROPS
+
+# P31 values that mark a university even without hierarchy claims: Q3918
+# and its most used subclasses. ingest_dump() adds the full P279* closure
+# of Q3918 unless university_types= is given.
+UNIVERSITY_TYPES = frozenset({
+    "Q3918",       # university
+    "Q875538",     # public university
+    "Q902104",     # private university
+    "Q15936437",   # research university
+    "Q23002054",   # private not-for-profit educational institution
+    "Q62078547",   # public research university
+})
+
+DUMP_CLAIM_PROPS = ("P31", "P17", "P856") + HIERARCHY_PROPS
+
+_CHUNK_LINES = 2000
+
+# one kept entity: (compact entity, [(parent, child, prop), ...])
+Record = Tuple[Dict[str, Any], List[Tuple[str, str, str]]]
+
+
+def open_dump(path: Path | str) -> IO[str]:
+    """Open a .bz2, .gz or plain JSON dump as a text stream."""
+    path = Path(path)
+    if path.suffix == ".bz2":
+        return bz2.open(path, "rt", encoding="utf-8")
+    if path.suffix == ".gz":
+        return gzip.open(path, "rt", encoding="utf-8")
+    return open(path, "rt", encoding="utf-8")
+
+
+# item ids as they appear in a dump line (the entity's own and claim values)
+_ITEM_ID = re.compile(r'"id": ?"(Q\d+)"')
+# the entity's own id, which dumps write right after "type"
+_OWN_ID = re.compile(r'\s*\{"type": ?"item", ?"id": ?"(Q\d+)"')
+_NEEDLES = [f'"{p}"' for p in HIERARCHY_PROPS]
+
+
+def _quick_reject(line: str, university_types: frozenset) -> bool:
+    """
+    Cheap test so most lines are never JSON-decoded: no hierarchy property
+    and no item id from university_types anywhere in the line. One regex
+    scan covers the type set however many classes it holds.
+    """
+    if any(n in line for n in _NEEDLES):
+        return False
+    return university_types.isdisjoint(_ITEM_ID.findall(line))
+
+
+def entity_edges(ent: Dict[str, Any]) -> List[Tuple[str, str, str]]:
+    """Hierarchy edges of a compact entity, oriented parent -> child."""
+    qid = ent["qid"]
+    edges = []
+    for prop in DOWN_PROPS:
+        edges.extend((qid, v, prop) for v in ent["claims"].get(prop, []))
+    for prop in UP_PROPS:
+        edges.extend((v, qid, prop) for v in ent["claims"].get(prop, []))
+    return edges
+
+
+def parse_lines(lines: Sequence[str], university_types: frozenset = UNIVERSITY_TYPES) -> List[Record]:
+    """Decode dump lines and keep hierarchy-relevant items (runs in a worker)."""
+    out: List[Record] = []
+    for line in lines:
+        line = line.strip().rstrip(",")
+        if not line.startswith("{") or _quick_reject(line, university_types):
+            continue
+        try:
+            raw = json.loads(line)
+        except json.JSONDecodeError:
+            logger.warning("skipping undecodable dump line (%d chars)", len(line))
+            continue
+        if raw.get("type") != "item":
+            continue
+        ent = compact_entity(raw, claim_props=DUMP_CLAIM_PROPS)
+        edges = entity_edges(ent)
+        if edges or university_types.intersection(ent["claims"]["P31"]):
+            out.append((ent, edges))
+    return out
+
+
+def _chunks(stream: Iterable[str], size: int) -> Iterator[List[str]]:
+    chunk: List[str] = []
+    for line in stream:
+        chunk.append(line)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def iter_records(
+    stream: Iterable[str],
+    workers: int = 0,
+    chunk_lines: int = _CHUNK_LINES,
+    university_types: frozenset = UNIVERSITY_TYPES,
+) -> Iterator[Record]:
+    """
+    Yield kept records from a stream of dump lines, in dump order.
+
+    With workers > 1 decoding runs in a process pool with at most
+    2 * workers chunks in flight, so memory stays bounded however large the
+    dump is (Pool.imap would read the whole input ahead).
+    """
+    if workers <= 1:
+        for chunk in _chunks(stream, chunk_lines):
+            yield from parse_lines(chunk, university_types)
+        return
+
+    window = 2 * workers
+    with multiprocessing.get_context("spawn").Pool(workers) as pool:
+        pending: deque = deque()
+        for chunk in _chunks(stream, chunk_lines):
+            pending.append(pool.apply_async(parse_lines, (chunk, university_types)))
+            if len(pending) >= window:
+                yield from pending.popleft().get()
+        while pending:
+            yield from pending.popleft().get()
+
+
+def university_classes() -> frozenset:
+    """UNIVERSITY_TYPES plus the P279* closure of Q3918, as the online harvest uses."""
+    from wikidata_discover.crawl_policy import subclass_closure
+    from wikidata_discover.harvester import UNIVERSITY_CLASS
+
+    return frozenset(subclass_closure(UNIVERSITY_CLASS)) | UNIVERSITY_TYPES
+
+
+def _fill_placeholders(
+    store: EntityStore, dump_path: Path | str, dump_time: float, chunk_lines: int
+) -> int:
+    """
+    Second pass: decode the dump lines of items stored as placeholders and
+    replace those rows. Ids are read off the line start and checked against
+    the store a chunk at a time, so nothing but the chunk is held in memory.
+    """
+    filled = 0
+    with open_dump(dump_path) as stream:
+        for chunk in _chunks(stream, chunk_lines):
+            lines = {}
+            for line in chunk:
+                m = _OWN_ID.match(line)
+                if m:
+                    lines[m.group(1)] = line
+            wanted = store.placeholders(lines)
+            entities = []
+            for qid in wanted:
+                try:
+                    raw = json.loads(lines[qid].strip().rstrip(","))
+                except json.JSONDecodeError:
+                    continue
+                if raw.get("id") == qid:
+                    entities.append(compact_entity(raw, claim_props=DUMP_CLAIM_PROPS))
+            store.put_entities(entities, fetched_at=dump_time)
+            filled += len(entities)
+    return filled
+
+
+def ingest_dump(
+    dump_path: Path | str,
+    out_path: Path | str,
+    workers: Optional[int] = None,
+    chunk_lines: int = _CHUNK_LINES,
+    university_types: Optional[Iterable[str]] = None,
+    batch_size: int = 5000,
+) -> Dict[str, int]:
+    """
+    Stream dump_path into an EntityStore at out_path and return counts.
+
+    Every kept entity, and every parent named by an edge, is marked
+    expanded with the dump's mtime, so offline lookups treat its stored
+    edges as complete. Edge endpoints that were not kept are resolved by a
+    second read of the dump ("referenced" in the counts). The university
+    classes used are recorded in the index for the offline harvest.
+    """
+    if workers is None:
+        workers = max(1, (os.cpu_count() or 2) - 1)
+    types = university_classes() if university_types is None else frozenset(university_types)
+    dump_time = Path(dump_path).stat().st_mtime
+    store = EntityStore(out_path)
+    store.set_meta("university_types", sorted(types))
+    stats = {"entities": 0, "edges": 0, "referenced": 0}
+    started = time.monotonic()
+
+    entities: List[Dict[str, Any]] = []
+    edges: List[Tuple[str, str, str]] = []
+    placeholders = 0
+
+    def flush() -> None:
+        nonlocal placeholders
+        store.put_entities(entities, fetched_at=dump_time)
+        store.add_edges(edges)
+        placeholders += store.put_placeholders(
+            {q for p, c, _ in edges for q in (p, c)}, fetched_at=dump_time
+        )
+        # parents only referenced from a child's P361/P749 are complete too
+        store.mark_expanded(
+            {e["qid"] for e in entities} | {p for p, _, _ in edges}, fetched_at=dump_time
+        )
+        entities.clear()
+        edges.clear()
+
+    with open_dump(dump_path) as stream:
+        for ent, ent_edges in iter_records(stream, workers, chunk_lines, types):
+            entities.append(ent)
+            edges.extend(ent_edges)
+            stats["entities"] += 1
+            stats["edges"] += len(ent_edges)
+            if len(entities) >= batch_size:
+                flush()
+                logger.info(
+                    "ingest-dump: %d entities, %d edges (%.0fs)",
+                    stats["entities"], stats["edges"], time.monotonic() - started,
+                )
+    flush()
+    if placeholders:
+        stats["referenced"] = _fill_placeholders(store, dump_path, dump_time, chunk_lines)
+        logger.info("ingest-dump: resolved %d referenced items", stats["referenced"])
+    store.close()
+    return stats
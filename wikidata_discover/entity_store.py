@@ -0,0 +1,347 @@
+"""
+Local SQLite store of Wikidata entities and hierarchy edges.
+
+Shared by harvester, hierarchy and discovery so that labels, aliases, P31
+types, websites and parent/child edges fetched once are reused across
+modules, universities and runs. Reads go through the store: anything
+missing or older than max_age is fetched (wbgetentities for entities, a
+caller-supplied SPARQL fetcher for edges) and written back.
+"""
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+import wikidata_discover.config as config
+from wikidata_discover.wikidata_api import get_entities as fetch_entities
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STORE_PATH = Path(__file__).parent / "results" / "cache" / "entities.sqlite"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entities (
+    qid        TEXT PRIMARY KEY,
+    label      TEXT,
+    aliases    TEXT,     -- JSON list of English aliases
+    types      TEXT,     -- JSON list of P31 QIDs
+    website    TEXT,
+    country    TEXT,     -- first P17 value
+    lastrevid  INTEGER,
+    fetched_at REAL      -- NULL for partial rows (e.g. label/website from a harvest)
+);
+CREATE TABLE IF NOT EXISTS edges (
+    parent TEXT NOT NULL,
+    child  TEXT NOT NULL,
+    prop   TEXT NOT NULL,
+    PRIMARY KEY (parent, child, prop)
+);
+CREATE INDEX IF NOT EXISTS edges_by_child ON edges (child);
+CREATE TABLE IF NOT EXISTS expanded (
+    qid        TEXT PRIMARY KEY,
+    fetched_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT     -- JSON
+);
+"""
+
+# (child, prop) pairs under one parent
+Edge = Tuple[str, str]
+
+
+# claims kept per entity; P17 fills the country column
+STORE_CLAIM_PROPS = ("P31", "P17", "P361", "P749", "P856")
+
+
+class EntityStore:
+    """Read-through cache of entities and (parent, child, prop) edges.
+
+    With offline=True (e.g. an index built by dump_ingest) nothing is ever
+    fetched: stored rows are served regardless of age and anything absent
+    is treated as unknown / childless.
+    """
+
+    def __init__(
+        self,
+        path: Path | str = DEFAULT_STORE_PATH,
+        max_age: float | None = None,
+        offline: bool = False,
+    ):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.offline = offline
+        self.max_age = (
+            config.ENTITY_STORE_MAX_AGE_DAYS * 86400 if max_age is None else max_age
+        )
+        # several worker processes may share the store; WAL lets them read
+        # while one writes, and NORMAL skips the fsync on every commit
+        self._conn = sqlite3.connect(str(self.path), timeout=60, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.RLock()
+        if not offline:
+            self._conn.execute(f"PRAGMA journal_mode={config.ENTITY_STORE_JOURNAL}")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._lock, self._conn:
+            self._conn.executescript(_SCHEMA)
+            columns = {r["name"] for r in self._conn.execute("PRAGMA table_info(entities)")}
+            if "country" not in columns:  # stores created before the column existed
+                self._conn.execute("ALTER TABLE entities ADD COLUMN country TEXT")
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def _fresh_after(self) -> float:
+        return time.time() - self.max_age
+
+    # ─────────────────────────  entities  ─────────────────────────
+
+    @staticmethod
+    def _row_to_entity(row: sqlite3.Row) -> Dict[str, Any]:
+        return {
+            "qid": row["qid"],
+            "label": row["label"],
+            "aliases": json.loads(row["aliases"] or "[]"),
+            "types": json.loads(row["types"] or "[]"),
+            "website": row["website"],
+            "country": row["country"],
+            "lastrevid": row["lastrevid"],
+        }
+
+    def lookup(self, qid: str) -> Optional[Dict[str, Any]]:
+        """Return whatever is stored for qid (possibly partial), without any network call."""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM entities WHERE qid = ?", (qid,)).fetchone()
+        return self._row_to_entity(row) if row else None
+
+    def get_entities(self, qids: Iterable[str], refresh: bool = False) -> Dict[str, Dict[str, Any]]:
+        """
+        Return {qid: entity} for the given QIDs, fetching the missing, partial
+        or stale ones with wbgetentities. Unknown QIDs are left out.
+        """
+        wanted = list(dict.fromkeys(q for q in qids if q))
+        result: Dict[str, Dict[str, Any]] = {}
+        if not refresh or self.offline:
+            # offline indexes have no freshness: any stored row will do
+            fresh_after = None if self.offline else self._fresh_after()
+            with self._lock:
+                for i in range(0, len(wanted), 500):
+                    chunk = wanted[i:i + 500]
+                    rows = self._conn.execute(
+                        f"SELECT * FROM entities WHERE (? IS NULL OR fetched_at >= ?) "
+                        f"AND qid IN ({','.join('?' * len(chunk))})",
+                        [fresh_after, fresh_after, *chunk],
+                    ).fetchall()
+                    for row in rows:
+                        result[row["qid"]] = self._row_to_entity(row)
+
+        todo = [q for q in wanted if q not in result]
+        if todo and not self.offline:
+            fetched = fetch_entities(
+                todo, props=("info", "labels", "aliases", "claims"), claim_props=STORE_CLAIM_PROPS
+            )
+            self.put_entities(fetched.values())
+            for qid, ent in fetched.items():
+                result[qid] = self._from_compact(ent)
+        logger.debug("entity store: %d cached, %d fetched", len(wanted) - len(todo), len(todo))
+        return result
+
+    @staticmethod
+    def _from_compact(ent: Dict[str, Any]) -> Dict[str, Any]:
+        websites = ent["claims"].get("P856", [])
+        countries = ent["claims"].get("P17", [])
+        return {
+            "qid": ent["qid"],
+            "label": ent["label"],
+            "aliases": ent["aliases"],
+            "types": ent["claims"].get("P31", []),
+            "website": websites[0] if websites else None,
+            "country": countries[0] if countries else None,
+            "lastrevid": ent.get("lastrevid"),
+        }
+
+    def put_entities(self, compact_entities: Iterable[Dict[str, Any]], fetched_at: float | None = None) -> None:
+        """Upsert entities as returned by wikidata_api.get_entities()."""
+        now = time.time() if fetched_at is None else fetched_at
+        rows = []
+        for ent in compact_entities:
+            e = self._from_compact(ent)
+            rows.append((
+                e["qid"], e["label"], json.dumps(e["aliases"]), json.dumps(e["types"]),
+                e["website"], e["country"], e["lastrevid"], now,
+            ))
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO entities "
+                "(qid, label, aliases, types, website, country, lastrevid, fetched_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+
+    def put_basic(self, rows: Iterable[Tuple[str, str, Optional[str]]]) -> None:
+        """Record (qid, label, website) without overwriting fully fetched entities."""
+        with self._lock, self._conn:
+            self._conn.executemany(
+                """
+                INSERT INTO entities (qid, label, website) VALUES (?, ?, ?)
+                ON CONFLICT(qid) DO UPDATE SET
+                    label = excluded.label,
+                    website = COALESCE(excluded.website, entities.website)
+                WHERE entities.fetched_at IS NULL
+                """,
+                list(rows),
+            )
+
+    def put_placeholders(self, qids: Iterable[str], fetched_at: float | None = None) -> int:
+        """
+        Record bare rows (label = QID, no lastrevid) for QIDs not stored yet,
+        so an offline index knows every edge endpoint. Returns rows added.
+        """
+        now = time.time() if fetched_at is None else fetched_at
+        with self._lock, self._conn:
+            cur = self._conn.executemany(
+                "INSERT OR IGNORE INTO entities (qid, label, aliases, types, fetched_at) "
+                "VALUES (?, ?, '[]', '[]', ?)",
+                [(q, q, now) for q in qids],
+            )
+            return cur.rowcount
+
+    def placeholders(self, qids: Iterable[str]) -> Set[str]:
+        """Which of qids are stored only as placeholder rows."""
+        wanted = list(qids)
+        found: Set[str] = set()
+        with self._lock:
+            for i in range(0, len(wanted), 500):
+                chunk = wanted[i:i + 500]
+                found.update(
+                    r["qid"] for r in self._conn.execute(
+                        "SELECT qid FROM entities WHERE lastrevid IS NULL AND fetched_at IS NOT NULL "
+                        f"AND qid IN ({','.join('?' * len(chunk))})",
+                        chunk,
+                    )
+                )
+        return found
+
+    # ─────────────────────────  edges  ─────────────────────────
+
+    def children(self, parent: str, fetch: Callable[[str], List[Edge]], refresh: bool = False) -> List[Edge]:
+        """
+        Return the (child, prop) edges under parent. If parent has not been
+        expanded within max_age, fetch(parent) is called and its result
+        replaces the stored edges.
+        """
+        if not refresh or self.offline:
+            cached = self.cached_children(parent)
+            if cached is not None:
+                return cached
+
+        edges = list(dict.fromkeys(fetch(parent)))
+        self.put_edges(parent, edges)
+        return edges
+
+    def cached_children(self, parent: str) -> Optional[List[Edge]]:
+        """Stored (child, prop) edges under parent, or None if it needs expanding."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT fetched_at FROM expanded WHERE qid = ?", (parent,)
+            ).fetchone()
+            if not self.offline and not (row and row["fetched_at"] >= self._fresh_after()):
+                return None
+            return [
+                (r["child"], r["prop"])
+                for r in self._conn.execute(
+                    "SELECT child, prop FROM edges WHERE parent = ? ORDER BY rowid", (parent,)
+                )
+            ]
+
+    def put_edges(self, parent: str, edges: List[Edge], fetched_at: float | None = None) -> None:
+        """Replace the stored edges under parent and mark it expanded."""
+        self.put_edges_many({parent: edges}, fetched_at)
+
+    def put_edges_many(self, edges: Dict[str, List[Edge]], fetched_at: float | None = None) -> None:
+        """put_edges for many parents ({parent: edges}) in one transaction."""
+        now = time.time() if fetched_at is None else fetched_at
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM edges WHERE parent = ?", [(p,) for p in edges])
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO edges VALUES (?, ?, ?)",
+                [(parent, child, prop) for parent, kids in edges.items() for child, prop in kids],
+            )
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO expanded VALUES (?, ?)", [(p, now) for p in edges]
+            )
+
+    def add_edges(self, edges: Iterable[Tuple[str, str, str]]) -> None:
+        """Bulk-insert (parent, child, prop) edges without touching existing ones."""
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR IGNORE INTO edges VALUES (?, ?, ?)", edges)
+
+    def mark_expanded(self, qids: Iterable[str], fetched_at: float | None = None) -> None:
+        """Record that the stored edges under these QIDs are complete."""
+        now = time.time() if fetched_at is None else fetched_at
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO expanded VALUES (?, ?)", ((q, now) for q in qids)
+            )
+
+    def find_by_type(self, types: Iterable[str], country: str | None = None) -> Iterator[Dict[str, Any]]:
+        """Stream stored entities with any of the given P31 types (optionally in a P17 country)."""
+        types = list(types)
+        query = (
+            "SELECT DISTINCT e.* FROM entities e, json_each(e.types) t "
+            f"WHERE t.value IN ({','.join('?' * len(types))})"
+        )
+        params: List[Any] = list(types)
+        if country:
+            query += " AND e.country = ?"
+            params.append(country)
+        with self._lock:
+            rows = self._conn.execute(query + " ORDER BY e.label", params).fetchall()
+        for row in rows:
+            yield self._row_to_entity(row)
+
+    def get_meta(self, key: str) -> Any:
+        """A JSON value recorded with set_meta(), or None."""
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return json.loads(row["value"]) if row else None
+
+    def set_meta(self, key: str, value: Any) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, json.dumps(value)))
+
+    def parents(self, child: str) -> List[Edge]:
+        """Return stored (parent, prop) edges above child (no network)."""
+        with self._lock:
+            return [
+                (r["parent"], r["prop"])
+                for r in self._conn.execute(
+                    "SELECT parent, prop FROM edges WHERE child = ?", (child,)
+                )
+            ]
+
+
+_store: EntityStore | None = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> EntityStore:
+    """
+    Process-wide store: the offline index at ENTITY_INDEX_PATH if one is
+    configured, otherwise the read-through cache at ENTITY_STORE_PATH
+    (default results/cache/entities.sqlite).
+    """
+    global _store
+    with _store_lock:
+        if _store is None:
+            if config.ENTITY_INDEX_PATH:
+                _store = EntityStore(config.ENTITY_INDEX_PATH, offline=True)
+            else:
+                _store = EntityStore(config.ENTITY_STORE_PATH or DEFAULT_STORE_PATH)
+        return _store
@@ -0,0 +1,265 @@
+"""
+Compact, array-backed view of a crawled org hierarchy.
+
+Node QIDs are interned to int32 IDs; adjacency is kept as one CSR pair
+(indptr, indices) per predicate in both directions, and labels / child
+type labels live in string tables. Descendant and ancestor queries run a
+level-synchronous BFS over the arrays, and a graph can be saved to a
+directory of .npy files and loaded back memory-mapped.
+"""
+
+import json
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+_META_FILE = "graph.json"
+
+# (parent, child, predicate_id, childTypeLabel), as returned by all_descendants
+EdgeTuple = Tuple[str, str, str, str]
+
+
+def _csr(src: np.ndarray, dst: np.ndarray, n: int) -> Tuple[np.ndarray, np.ndarray]:
+    """CSR arrays for edges src -> dst over n nodes (insertion order kept per row)."""
+    order = np.argsort(src, kind="stable")
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=n), out=indptr[1:])
+    return indptr, dst[order].astype(np.int32)
+
+
+def _expand(indptr: np.ndarray, indices: np.ndarray, frontier: np.ndarray) -> np.ndarray:
+    """All neighbours of the frontier nodes, gathered without a Python loop."""
+    starts = indptr[frontier]
+    lens = indptr[frontier + 1] - starts
+    total = int(lens.sum())
+    if total == 0:
+        return np.empty(0, dtype=np.int32)
+    # position k of the output reads indices[starts[row(k)] + (k - first_k_of_row)]
+    offsets = np.repeat(starts - (np.cumsum(lens) - lens), lens) + np.arange(total)
+    return indices[offsets]
+
+
+class HierarchyGraph:
+    """Interned, per-predicate CSR hierarchy with label and type string tables."""
+
+    def __init__(
+        self,
+        nodes: List[str],
+        labels: List[str],
+        predicates: List[str],
+        down: Dict[str, Tuple[np.ndarray, np.ndarray]],
+        up: Dict[str, Tuple[np.ndarray, np.ndarray]],
+        type_names: List[str],
+        node_types: Tuple[np.ndarray, np.ndarray],
+        root: Optional[str] = None,
+    ):
+        self.nodes = nodes
+        self.labels = labels
+        self.predicates = predicates
+        self.down = down
+        self.up = up
+        self.type_names = type_names
+        self.node_types = node_types
+        self.root = root
+        self.index: Dict[str, int] = {q: i for i, q in enumerate(nodes)}
+
+    # ─────────────────────────  construction  ─────────────────────────
+
+    @classmethod
+    def from_edges(
+        cls,
+        edges: Iterable[Tuple[str, str, str]],
+        labels: Optional[Dict[str, str]] = None,
+        types: Optional[Dict[str, Sequence[str]]] = None,
+        root: Optional[str] = None,
+    ) -> "HierarchyGraph":
+        """
+        Build from (parent, child, predicate_id) edges. labels maps QID to
+        label (default: the QID) and types maps QID to its P31 type labels.
+        """
+        labels = labels or {}
+        types = types or {}
+        index: Dict[str, int] = {}
+        if root is not None:
+            index[root] = 0
+
+        def intern(q: str) -> int:
+            i = index.get(q)
+            if i is None:
+                i = index[q] = len(index)
+            return i
+
+        by_prop: Dict[str, Tuple[List[int], List[int]]] = {}
+        for parent, child, prop in edges:
+            src, dst = by_prop.setdefault(prop, ([], []))
+            src.append(intern(parent))
+            dst.append(intern(child))
+        for q in labels:
+            intern(q)
+
+        nodes = list(index)
+        n = len(nodes)
+        predicates = sorted(by_prop)
+        down, up = {}, {}
+        for prop in predicates:
+            src = np.asarray(by_prop[prop][0], dtype=np.int32)
+            dst = np.asarray(by_prop[prop][1], dtype=np.int32)
+            down[prop] = _csr(src, dst, n)
+            up[prop] = _csr(dst, src, n)
+
+        type_names: List[str] = []
+        type_index: Dict[str, int] = {}
+        type_ptr = np.zeros(n + 1, dtype=np.int64)
+        type_ids: List[int] = []
+        for i, q in enumerate(nodes):
+            for t in types.get(q, ()):
+                if t not in type_index:
+                    type_index[t] = len(type_names)
+                    type_names.append(t)
+                type_ids.append(type_index[t])
+            type_ptr[i + 1] = len(type_ids)
+
+        return cls(
+            nodes=nodes,
+            labels=[labels.get(q, q) for q in nodes],
+            predicates=predicates,
+            down=down,
+            up=up,
+            type_names=type_names,
+            node_types=(type_ptr, np.asarray(type_ids, dtype=np.int32)),
+            root=root,
+        )
+
+    # ─────────────────────────  queries  ─────────────────────────
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    def __contains__(self, qid: str) -> bool:
+        return qid in self.index
+
+    @property
+    def n_edges(self) -> int:
+        return sum(len(indices) for _, indices in self.down.values())
+
+    def label(self, qid: str) -> str:
+        i = self.index.get(qid)
+        return self.labels[i] if i is not None else qid
+
+    def types_of(self, qid: str) -> List[str]:
+        i = self.index.get(qid)
+        if i is None:
+            return []
+        ptr, ids = self.node_types
+        return [self.type_names[t] for t in ids[ptr[i]:ptr[i + 1]]]
+
+    def _bfs(
+        self,
+        adjacency: Dict[str, Tuple[np.ndarray, np.ndarray]],
+        start: str,
+        max_depth: Optional[int],
+        predicates: Optional[Iterable[str]],
+    ) -> Set[str]:
+        if start not in self.index:
+            return set()
+        csrs = [adjacency[p] for p in (predicates or self.predicates) if p in adjacency]
+        seen = np.zeros(len(self.nodes), dtype=bool)
+        seen[self.index[start]] = True
+        frontier = np.asarray([self.index[start]], dtype=np.int32)
+        depth = 0
+        while frontier.size and (max_depth is None or depth < max_depth):
+            reached = [_expand(indptr, indices, frontier) for indptr, indices in csrs]
+            nxt = np.unique(np.concatenate(reached)) if reached else frontier[:0]
+            nxt = nxt[~seen[nxt]]
+            seen[nxt] = True
+            frontier = nxt
+            depth += 1
+        seen[self.index[start]] = False
+        return {self.nodes[i] for i in np.flatnonzero(seen)}
+
+    def descendants(
+        self, qid: str, max_depth: Optional[int] = None, predicates: Optional[Iterable[str]] = None
+    ) -> Set[str]:
+        """QIDs reachable below qid (excluding qid), optionally depth- or predicate-limited."""
+        return self._bfs(self.down, qid, max_depth, predicates)
+
+    def ancestors(
+        self, qid: str, max_depth: Optional[int] = None, predicates: Optional[Iterable[str]] = None
+    ) -> Set[str]:
+        """QIDs above qid (excluding qid)."""
+        return self._bfs(self.up, qid, max_depth, predicates)
+
+    def children(self, qid: str) -> List[Tuple[str, str]]:
+        """Direct (child, predicate_id) edges under qid."""
+        i = self.index.get(qid)
+        if i is None:
+            return []
+        out = []
+        for prop in self.predicates:
+            indptr, indices = self.down[prop]
+            out.extend((self.nodes[c], prop) for c in indices[indptr[i]:indptr[i + 1]])
+        return out
+
+    # ─────────────────────────  compatibility views  ─────────────────────────
+
+    def edge_tuples(self) -> Iterator[EdgeTuple]:
+        """
+        Yield (parent, child, predicate_id, childTypeLabel) like the old
+        all_descendants list: one tuple per child type, "—" if untyped.
+        """
+        for prop in self.predicates:
+            indptr, indices = self.down[prop]
+            for p in np.flatnonzero(np.diff(indptr)):
+                parent = self.nodes[p]
+                for c in indices[indptr[p]:indptr[p + 1]]:
+                    child = self.nodes[c]
+                    for ctype in self.types_of(child) or ["—"]:
+                        yield parent, child, prop, ctype
+
+    def labels_dict(self) -> Dict[str, str]:
+        return dict(zip(self.nodes, self.labels))
+
+    # ─────────────────────────  (de)serialization  ─────────────────────────
+
+    def save(self, directory: Path | str) -> None:
+        """Write string tables to graph.json and every array to its own .npy file."""
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        meta = {
+            "root": self.root,
+            "nodes": self.nodes,
+            "labels": self.labels,
+            "predicates": self.predicates,
+            "type_names": self.type_names,
+        }
+        arrays = {"types_indptr": self.node_types[0], "types_indices": self.node_types[1]}
+        for prop in self.predicates:
+            arrays[f"{prop}_down_indptr"], arrays[f"{prop}_down_indices"] = self.down[prop]
+            arrays[f"{prop}_up_indptr"], arrays[f"{prop}_up_indices"] = self.up[prop]
+        for name, arr in arrays.items():
+            np.save(directory / f"{name}.npy", np.ascontiguousarray(arr))
+        (directory / _META_FILE).write_text(json.dumps(meta))
+
+    @classmethod
+    def load(cls, directory: Path | str, mmap: bool = True) -> "HierarchyGraph":
+        """Load a saved graph; with mmap=True the arrays stay on disk (read-only)."""
+        directory = Path(directory)
+        meta = json.loads((directory / _META_FILE).read_text())
+        mode = "r" if mmap else None
+
+        def arr(name: str) -> np.ndarray:
+            return np.load(directory / f"{name}.npy", mmap_mode=mode)
+
+        down = {p: (arr(f"{p}_down_indptr"), arr(f"{p}_down_indices")) for p in meta["predicates"]}
+        up = {p: (arr(f"{p}_up_indptr"), arr(f"{p}_up_indices")) for p in meta["predicates"]}
+        return cls(
+            nodes=meta["nodes"],
+            labels=meta["labels"],
+            predicates=meta["predicates"],
+            down=down,
+            up=up,
+            type_names=meta["type_names"],
+            node_types=(arr("types_indptr"), arr("types_indices")),
+            root=meta["root"],
+        )
@@ -0,0 +1,150 @@
+"""
+Indexed SQLite form of a university harvest.
+
+The NDJSON / legacy JSON harvest files have to be read front to back to
+find anything; this store keeps one row per university keyed by QID, with
+a lower-cased label index for prefix search, so lookups are a single
+B-tree probe and iteration streams from a cursor.
+"""
+
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+import wikidata_discover.config as config
+
+DEFAULT_HARVEST_STORE = Path(__file__).parent / "results" / "cache" / "universities.sqlite"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS universities (
+    qid      TEXT PRIMARY KEY,
+    label    TEXT NOT NULL,
+    label_lc TEXT NOT NULL,
+    website  TEXT,
+    country  TEXT
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS universities_by_label ON universities (label_lc);
+"""
+
+_COLUMNS = ("qid", "label", "website", "country")
+
+
+class HarvestStore:
+    """University records by QID, with label prefix / substring search."""
+
+    def __init__(self, path: Path | str = DEFAULT_HARVEST_STORE):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.RLock()
+        with self._lock, self._conn:
+            self._conn.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    @staticmethod
+    def _record(row: sqlite3.Row) -> Dict[str, Any]:
+        return {k: row[k] for k in _COLUMNS}
+
+    def add(self, records: Iterable[Dict[str, Any]], batch_size: int = 5000) -> int:
+        """Upsert {"qid", "label", "website"[, "country"]} records; returns how many."""
+        count = 0
+        batch: List[tuple] = []
+
+        def flush() -> None:
+            with self._lock, self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO universities VALUES (?, ?, ?, ?, ?)", batch
+                )
+            batch.clear()
+
+        for rec in records:
+            label = rec.get("label") or rec["qid"]
+            batch.append((rec["qid"], label, label.lower(), rec.get("website"), rec.get("country")))
+            count += 1
+            if len(batch) >= batch_size:
+                flush()
+        if batch:
+            flush()
+        return count
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM universities").fetchone()[0]
+
+    def __contains__(self, qid: str) -> bool:
+        return self.lookup(qid) is not None
+
+    def lookup(self, qid: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM universities WHERE qid = ?", (qid,)).fetchone()
+        return self._record(row) if row else None
+
+    def by_prefix(self, prefix: str, limit: int = 20) -> List[Dict[str, Any]]:
+        """Universities whose label starts with prefix (case-insensitive), via the label index."""
+        lo = prefix.lower()
+        hi = lo + "\U0010ffff"
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM universities WHERE label_lc >= ? AND label_lc < ? "
+                "ORDER BY label_lc LIMIT ?",
+                (lo, hi, limit),
+            ).fetchall()
+        return [self._record(r) for r in rows]
+
+    def search(self, text: str, limit: int = 20) -> List[Dict[str, Any]]:
+        """Universities whose label contains text (case-insensitive); prefix hits first."""
+        needle = text.lower()
+        escaped = needle.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM universities WHERE label_lc LIKE ? ESCAPE '\\' "
+                "ORDER BY instr(label_lc, ?) > 1, label_lc LIMIT ?",
+                (f"%{escaped}%", needle, limit),
+            ).fetchall()
+        return [self._record(r) for r in rows]
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        """Stream every record in QID order without loading the table."""
+        last = ""
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT * FROM universities WHERE qid > ? ORDER BY qid LIMIT 1000", (last,)
+                ).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield self._record(row)
+            last = rows[-1]["qid"]
+
+
+_harvest_store: HarvestStore | None = None
+_harvest_store_lock = threading.Lock()
+
+
+def get_harvest_store() -> Optional[HarvestStore]:
+    """Process-wide store at HARVEST_STORE_PATH (default results/cache/universities.sqlite), if it exists."""
+    global _harvest_store
+    with _harvest_store_lock:
+        if _harvest_store is None:
+            path = Path(config.HARVEST_STORE_PATH or DEFAULT_HARVEST_STORE)
+            if not path.exists():
+                return None
+            _harvest_store = HarvestStore(path)
+        return _harvest_store
+
+
+def convert_harvest(src: Path | str, dest: Path | str = DEFAULT_HARVEST_STORE) -> int:
+    """Load a harvest file (NDJSON or either legacy JSON format) into a HarvestStore."""
+    from wikidata_discover.harvester import iter_universities
+
+    store = HarvestStore(dest)
+    try:
+        return store.add(iter_universities(src))
+    finally:
+        store.close()
@@ -1,38 +1,382 @@
 import json
+import logging
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from pathlib import Path
-from rich.console import Console
-from wikidata_discover.sparql_helpers import run_sparql
-from wikidata_discover.config import USER_AGENT
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+import wikidata_discover.config as config
+from wikidata_discover.sparql_helpers import QueryTimeout, stream_sparql_rows
+from wikidata_discover.wikidata_api import get_entities
+from wikidata_discover.entity_store import EntityStore, get_store
 
-console = Console()
+logger = logging.getLogger(__name__)
 
-# SPARQL to fetch all U.S. universities
+# SPARQL to fetch all U.S. universities (IDs and websites only; labels are
+# resolved in bulk with wbgetentities instead of the WDQS label service)
 _US_UNIV_SPARQL = """
-SELECT DISTINCT ?univ ?univLabel ?website WHERE {
+SELECT DISTINCT ?univ ?website WHERE {
   ?univ wdt:P31/wdt:P279* wd:Q3918 ;
          wdt:P17            wd:Q30 .
   OPTIONAL { ?univ wdt:P856 ?website }
-  SERVICE wikibase:label { bd:serviceParam wikibase:language "en". }
 }
-ORDER BY ?univLabel
 """
 
+UNIVERSITY_CLASS = "Q3918"
+DEFAULT_OUT = Path("universities_us.ndjson")
+# QIDs per label lookup (the wbgetentities maximum) and lookups kept in flight
+_LABEL_BATCH = 50
+_LABEL_IN_FLIGHT = 4
+_TABLE_ROWS = 20
 
-def fetch_us_universities() -> None:
-    console.print("[bold]Querying Wikidata for U.S. universities...[/bold]")
-    rows = run_sparql(_US_UNIV_SPARQL)
-    rows_tuples = run_sparql(_US_UNIV_SPARQL, as_tuples=True)
-    out_path = Path("universities_us.json")
-    out_path.write_text(json.dumps(rows_tuples, indent=2))
-    console.print(f"[green]Wrote {len(rows)} entries to {out_path}[/green]")
-
-    # also print a summary table
-    from rich.table import Table
-
-    table = Table("QID", "Name", "Website", header_style="magenta")
-    for b in rows:
-        qid = b["univ"]["value"].rsplit("/", 1)[-1]
-        name = b["univLabel"]["value"]
-        site = b.get("website", {}).get("value", "—")
-        table.add_row(qid, name, site)
-    console.print(table)
+# one harvested university: {"qid", "label", "website"}
+Record = Dict[str, Any]
+
+
+def _sparql_records(query: str = _US_UNIV_SPARQL) -> Iterator[Record]:
+    """Stream (qid, website) rows, one record per QID (first website wins)."""
+    seen = set()
+    for row in stream_sparql_rows(query):
+        qid = row["univ"].rsplit("/", 1)[-1]
+        if qid in seen:
+            continue
+        seen.add(qid)
+        yield {"qid": qid, "label": None, "website": row.get("website") or None}
+
+
+def _university_types(store: EntityStore) -> List[str]:
+    """
+    P31 classes that make an item a university: the P279* closure of
+    Q3918, or for an offline index the classes it was built with, so the
+    online and offline harvests select the same items.
+    """
+    from wikidata_discover.crawl_policy import subclass_closure
+
+    if not store.offline:
+        return sorted(subclass_closure(UNIVERSITY_CLASS))
+    types = store.get_meta("university_types")
+    if types:
+        return types
+    from wikidata_discover.dump_ingest import UNIVERSITY_TYPES
+
+    # indexes built before the classes were recorded
+    return sorted(subclass_closure(UNIVERSITY_CLASS, fetch=False) | UNIVERSITY_TYPES)
+
+
+def _index_records(store: EntityStore) -> Iterator[Record]:
+    """The harvest query answered from an offline dump index."""
+    for ent in store.find_by_type(_university_types(store), country="Q30"):
+        yield {"qid": ent["qid"], "label": ent["label"], "website": ent["website"]}
+
+
+def _batches(records: Iterable[Record], size: int) -> Iterator[List[Record]]:
+    batch: List[Record] = []
+    for rec in records:
+        batch.append(rec)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _with_labels(records: Iterable[Record]) -> Iterator[List[Record]]:
+    """
+    Fill in missing labels 50 QIDs at a time while the query result is
+    still streaming; a few lookups run ahead of the writer. Yields batches
+    in input order.
+    """
+
+    def resolve(batch: List[Record]) -> List[Record]:
+        todo = [r["qid"] for r in batch if not r["label"]]
+        entities = get_entities(todo, props=("labels",)) if todo else {}
+        for r in batch:
+            if not r["label"]:
+                r["label"] = entities[r["qid"]]["label"] if r["qid"] in entities else r["qid"]
+        return batch
+
+    with ThreadPoolExecutor(max_workers=_LABEL_IN_FLIGHT) as pool:
+        pending: deque = deque()
+        for batch in _batches(records, _LABEL_BATCH):
+            pending.append(pool.submit(resolve, batch))
+            if len(pending) >= _LABEL_IN_FLIGHT:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def fetch_us_universities(out_path: Path | str = DEFAULT_OUT, show_table: bool = False) -> Dict[str, int]:
+    """
+    Harvest U.S. universities in one streamed pass: rows are labelled in
+    batches and appended to out_path as NDJSON ({"qid", "label", "website"}
+    per line) as they arrive, so memory stays flat however large the
+    result. Returns counts; show_table prints a short sample.
+    """
+    store = get_store()
+    if store.offline:
+        # ENTITY_INDEX_PATH points at a dump index: no WDQS or API calls
+        config.console.print(f"[bold]Reading U.S. universities from {store.path}...[/bold]")
+        records = _index_records(store)
+    else:
+        config.console.print("[bold]Querying Wikidata for U.S. universities...[/bold]")
+        records = _sparql_records()
+
+    out_path = Path(out_path)
+    tmp_path = out_path.with_name(out_path.name + ".part")
+    stats = {"universities": 0, "with_website": 0}
+    sample: List[Record] = []
+    with tmp_path.open("w", encoding="utf-8") as out:
+        for batch in _with_labels(records):
+            for rec in batch:
+                out.write(json.dumps(rec, ensure_ascii=False) + "\n")
+            if not store.offline:
+                # label + website let Discovery skip its own lookup for these QIDs
+                store.put_basic((r["qid"], r["label"], r["website"]) for r in batch)
+            stats["universities"] += len(batch)
+            stats["with_website"] += sum(1 for r in batch if r["website"])
+            sample.extend(batch[: _TABLE_ROWS - len(sample)])
+    tmp_path.replace(out_path)
+    config.console.print(
+        f"[green]Wrote {stats['universities']} entries to {out_path} "
+        f"({stats['with_website']} with a website)[/green]"
+    )
+
+    if show_table and sample:
+        from rich.table import Table
+
+        table = Table(
+            "QID", "Name", "Website", header_style="magenta",
+            caption=f"first {len(sample)} of {stats['universities']}",
+        )
+        for rec in sample:
+            table.add_row(rec["qid"], rec["label"], rec["website"] or "—")
+        config.console.print(table)
+    return stats
+
+
+# ─────────────────────────  sharded global harvest  ─────────────────────────
+
+# one country and a slice of the P279* closure of Q3918 per query; the
+# closure is computed once and passed in as VALUES instead of a property
+# path, so a smaller slice is a smaller join for WDQS, not just a filter
+# applied after it
+_SHARD_SPARQL = """
+SELECT DISTINCT ?univ ?website WHERE {{
+  VALUES ?type {{ {types} }}
+  ?univ wdt:P31 ?type ;
+        wdt:P17 wd:{country} .
+  OPTIONAL {{ ?univ wdt:P856 ?website }}
+}}
+"""
+_COUNTRIES_SPARQL = """
+SELECT DISTINCT ?country WHERE {
+  VALUES ?kind { wd:Q6256 wd:Q3624078 }
+  ?country wdt:P31 ?kind .
+}
+"""
+
+# (country QID, lo, hi): the country's universities typed with types[lo:hi]
+# of the harvest's sorted class list
+Shard = Tuple[str, int, int]
+
+
+def _shard_key(shard: Shard) -> str:
+    return f"{shard[0]}:{shard[1]}-{shard[2]}"
+
+
+def list_countries() -> List[str]:
+    """QIDs of all countries / sovereign states (for --all)."""
+    return sorted({
+        row["country"].rsplit("/", 1)[-1] for row in stream_sparql_rows(_COUNTRIES_SPARQL)
+    })
+
+
+def _shard_query(shard: Shard, types: Sequence[str]) -> str:
+    country, lo, hi = shard
+    return _SHARD_SPARQL.format(types=" ".join(f"wd:{t}" for t in types[lo:hi]), country=country)
+
+
+def _run_shard(shard: Shard, types: Sequence[str]) -> Tuple[Optional[List[Record]], List[Shard]]:
+    """
+    Fetch and label one shard. Returns (records, []) or, if WDQS timed out,
+    (None, two shards with half of the classes each).
+    """
+    country, lo, hi = shard
+    try:
+        records = list(_sparql_records(_shard_query(shard, types)))
+    except QueryTimeout:
+        if hi - lo <= 1:
+            raise
+        mid = (lo + hi) // 2
+        logger.info("shard %s timed out; splitting its classes", _shard_key(shard))
+        return None, [(country, lo, mid), (country, mid, hi)]
+    labelled = [rec for batch in _with_labels(records) for rec in batch]
+    for rec in labelled:
+        rec["country"] = country
+    return labelled, []
+
+
+class _Progress:
+    """
+    Shards done / known too large / failed, persisted next to the output for
+    resume, with the class list the shards index into.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        data = json.loads(path.read_text()) if path.exists() else {}
+        self.types: Optional[List[str]] = data.get("types")
+        self.done = set(data.get("done", []))
+        self.split = set(data.get("split", []))
+        self.failed = set(data.get("failed", []))
+
+    def save(self) -> None:
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        tmp.write_text(json.dumps({
+            "types": self.types, "done": sorted(self.done), "split": sorted(self.split),
+            "failed": sorted(self.failed),
+        }))
+        tmp.replace(self.path)
+
+
+def harvest_countries(
+    countries: Optional[Sequence[str]] = None,
+    out_path: Path | str = "universities.ndjson",
+    workers: Optional[int] = None,
+) -> Dict[str, int]:
+    """
+    Harvest universities of the given countries (all countries if None)
+    into one NDJSON file with a country column.
+
+    Each country is one shard, queried against the subclass closure of
+    Q3918; a shard that times out is split into two halves of its class
+    list. Shards run concurrently under the shared SPARQL rate limiter and
+    are appended as they finish. A shard that still fails (a single class
+    timing out, an HTTP error after retries) is logged and skipped. Finished,
+    known-too-large and failed shards are recorded in <out>.progress.json,
+    so a rerun picks up where it stopped and retries the failed ones, and
+    QIDs already in the output are never written twice.
+    """
+    workers = workers or config.HARVEST_WORKERS
+    store = get_store()
+    out_path = Path(out_path)
+    progress = _Progress(out_path.with_name(out_path.name + ".progress.json"))
+    # shards index into the class list, so a resumed run keeps the one it started with
+    types = progress.types or _university_types(store)
+    progress.types = types
+    if countries is None:
+        countries = list_countries()
+    config.console.print(
+        f"[bold]Harvesting {len(countries)} countries ({len(types)} university classes)...[/bold]"
+    )
+
+    seen = {rec["qid"] for rec in iter_universities(out_path)} if out_path.exists() else set()
+    stats = {"universities": len(seen), "shards": 0, "splits": 0, "duplicates": 0, "failed": 0}
+
+    def write(records: List[Record]) -> None:
+        with out_path.open("a", encoding="utf-8") as out:
+            for rec in records:
+                if rec["qid"] in seen:
+                    stats["duplicates"] += 1  # e.g. several P17 values
+                    continue
+                seen.add(rec["qid"])
+                out.write(json.dumps(rec, ensure_ascii=False) + "\n")
+                stats["universities"] += 1
+        if not store.offline:
+            store.put_basic((r["qid"], r["label"], r["website"]) for r in records)
+
+    if store.offline:
+        for country in countries:
+            key = _shard_key((country, 0, len(types)))
+            if key in progress.done:
+                continue
+            write([
+                {"qid": e["qid"], "label": e["label"], "website": e["website"], "country": country}
+                for e in store.find_by_type(types, country=country)
+            ])
+            progress.done.add(key)
+            progress.save()
+        return stats
+
+    def expand(shard: Shard) -> List[Shard]:
+        """Replace shards known to time out by their halves (of the classes)."""
+        if _shard_key(shard) not in progress.split:
+            return [shard]
+        country, lo, hi = shard
+        mid = (lo + hi) // 2
+        return expand((country, lo, mid)) + expand((country, mid, hi))
+
+    queue = [s for c in countries for s in expand((c, 0, len(types)))]
+    queue = [s for s in queue if _shard_key(s) not in progress.done]
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="harvest") as pool:
+        running = {pool.submit(_run_shard, s, types): s for s in queue}
+        while running:
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                shard = running.pop(fut)
+                try:
+                    records, halves = fut.result()
+                except Exception as e:
+                    logger.error("shard %s failed: %s", _shard_key(shard), e)
+                    stats["failed"] += 1
+                    progress.failed.add(_shard_key(shard))
+                    progress.save()
+                    continue
+                progress.failed.discard(_shard_key(shard))
+                if records is None:
+                    stats["splits"] += 1
+                    progress.split.add(_shard_key(shard))
+                    for half in halves:
+                        if _shard_key(half) not in progress.done:
+                            running[pool.submit(_run_shard, half, types)] = half
+                else:
+                    write(records)
+                    stats["shards"] += 1
+                    progress.done.add(_shard_key(shard))
+                progress.save()
+                config.console.print(
+                    f"[dim]{_shard_key(shard)}: "
+                    f"{'split' if records is None else len(records)} "
+                    f"({stats['universities']} total)[/dim]"
+                )
+
+    config.console.print(
+        f"[green]Wrote {stats['universities']} universities to {out_path} "
+        f"({stats['shards']} shards, {stats['splits']} splits)[/green]"
+    )
+    if stats["failed"]:
+        config.console.print(
+            f"[yellow]{stats['failed']} shards failed; run again to retry them[/yellow]"
+        )
+    return stats
+
+
+def iter_universities(path: Path | str) -> Iterator[Record]:
+    """
+    Stream {"qid", "label", "website"} records back from a harvest file.
+
+    Reads NDJSON line by line; the older JSON array formats ([qid, label]
+    pairs, or raw SPARQL bindings with university/universityLabel keys) are
+    still accepted but have to be loaded whole.
+    """
+    path = Path(path)
+    with path.open(encoding="utf-8") as f:
+        first = f.read(1)
+        while first.isspace():
+            first = f.read(1)
+        f.seek(0)
+        if first != "[":
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+            return
+        rows = json.load(f)
+
+    for row in rows:
+        if isinstance(row, (list, tuple)):
+            yield {"qid": row[0], "label": row[1], "website": None}
+            continue
+        uri = (row.get("university") or row.get("univ") or {}).get("value", "")
+        label = (row.get("universityLabel") or row.get("univLabel") or {}).get("value")
+        website = (row.get("website") or {}).get("value")
+        qid = uri.rsplit("/", 1)[-1]
+        yield {"qid": qid, "label": label or qid, "website": website}
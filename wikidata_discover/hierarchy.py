@@ -1,63 +1,506 @@
-from collections import deque, defaultdict
+import json
+import logging
+import time
+from pathlib import Path
 from time import sleep
-from typing import Dict, List, Tuple
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
 
 from .sparql_helpers import execute_sparql_bindings
+from .entity_store import EntityStore, get_store
+from .graph import HierarchyGraph
+from .crawl_policy import CrawlPolicy, CrawlStats
+from .wikidata_api import get_revisions
 from .config import USER_AGENT  
 
-# SPARQL template for crawling hierarchy
+logger = logging.getLogger(__name__)
+
+# predicates for downward/upward traversal
+PREDICATES_DOWN = ["P527", "P355", "P199"]  # has part, subsidiary, division
+PREDICATES_UP = ["P361", "P749"]  # part of, parent org
+
+# SPARQL template for the edges under one node; IDs only, labels and types
+# come from the entity store (wbgetentities)
 SPARQL_TEMPLATE = """
-SELECT DISTINCT ?child ?childLabel ?propLabel ?childTypeLabel WHERE {{
+SELECT DISTINCT ?child ?prop WHERE {{
   VALUES ?parent {{ wd:{parent} }}
-  {{ ?parent wdt:{down} ?child . BIND(wdt:{down} AS ?prop) }}
+  {{ VALUES ?prop {{ {down} }} ?parent ?prop ?child . }}
   UNION
-  {{ ?child wdt:{up} ?parent . BIND(wdt:{up} AS ?prop) }}
-  OPTIONAL {{ ?child wdt:P31 ?childType . }}
-  SERVICE wikibase:label {{ bd:serviceParam wikibase:language "en". }}
+  {{ VALUES ?prop {{ {up} }} ?child ?prop ?parent . }}
 }}
 """
 
-# predicates for downward/upward traversal
-PREDICATES_DOWN = ["P527", "P355", "P199"]  # has part, subsidiary, division
-PREDICATES_UP = ["P361", "P749"]  # part of, parent org
+# "part of" edges pointing at any of a batch of nodes; used on refresh to
+# notice new children, which do not change the parent's own revision
+INCOMING_TEMPLATE = """
+SELECT DISTINCT ?parent ?child ?prop WHERE {{
+  VALUES ?parent {{ {parents} }}
+  VALUES ?prop {{ {up} }}
+  ?child ?prop ?parent .
+}}
+"""
+_INCOMING_BATCH = 200
+
+# edges under a batch of nodes, for the level-synchronous multi-root crawl
+BATCH_TEMPLATE = """
+SELECT DISTINCT ?parent ?child ?prop WHERE {{
+  VALUES ?parent {{ {parents} }}
+  {{ VALUES ?prop {{ {down} }} ?parent ?prop ?child . }}
+  UNION
+  {{ VALUES ?prop {{ {up} }} ?child ?prop ?parent . }}
+}}
+"""
+_EDGE_BATCH = 100
+
+# which of a batch of items sit anywhere below root, following the same
+# edges as the crawl (up via P361/P749, down via P527/P355/P199)
+ANCESTRY_TEMPLATE = """
+SELECT DISTINCT ?x WHERE {{
+  VALUES ?x {{ {items} }}
+  ?x ({path})+ wd:{root} .
+}}
+"""
+
+# persisted crawls: one HierarchyGraph directory + revisions.json per root
+SNAPSHOT_DIR = Path(__file__).parent / "results" / "cache" / "hierarchies"
+CHANGE_REPORT_DIR = Path(__file__).parent / "results" / "reports"
 
 # polite pause between SPARQL requests
 time_sleep = 0.3
 
 
+def fetch_edges(parent: str) -> List[Tuple[str, str]]:
+    """Query WDQS for the (child, predicate_id) edges directly under parent."""
+    query = SPARQL_TEMPLATE.format(
+        parent=parent,
+        down=" ".join(f"wdt:{p}" for p in PREDICATES_DOWN),
+        up=" ".join(f"wdt:{p}" for p in PREDICATES_UP),
+    )
+    rows = execute_sparql_bindings(query)
+    sleep(time_sleep)
+    return [
+        (b["child"]["value"].rsplit("/", 1)[-1], b["prop"]["value"].rsplit("/", 1)[-1])
+        for b in rows
+    ]
+
+
+def fetch_edges_batch(parents: Sequence[str]) -> Dict[str, List[Tuple[str, str]]]:
+    """fetch_edges for many parents, _EDGE_BATCH per query; every parent gets a key."""
+    out: Dict[str, List[Tuple[str, str]]] = {p: [] for p in parents}
+    parents = list(parents)
+    for i in range(0, len(parents), _EDGE_BATCH):
+        query = BATCH_TEMPLATE.format(
+            parents=" ".join(f"wd:{q}" for q in parents[i:i + _EDGE_BATCH]),
+            down=" ".join(f"wdt:{p}" for p in PREDICATES_DOWN),
+            up=" ".join(f"wdt:{p}" for p in PREDICATES_UP),
+        )
+        for b in execute_sparql_bindings(query):
+            parent, child, prop = (b[k]["value"].rsplit("/", 1)[-1] for k in ("parent", "child", "prop"))
+            out[parent].append((child, prop))
+        sleep(time_sleep)
+    return out
+
+
+# expand(nodes) -> {node: [(child, prop)]}; nodes left out were not expanded
+Expander = Callable[[List[str]], Dict[str, List[Tuple[str, str]]]]
+
+
+def _crawl(
+    roots: Sequence[str],
+    expand: Expander,
+    policy: CrawlPolicy | None = None,
+    stats: CrawlStats | None = None,
+    types_of: Callable[[List[str]], Dict[str, List[str]]] | None = None,
+) -> Tuple[Set[str], List[Tuple[str, str, str]]]:
+    """
+    Level-synchronous BFS from roots; returns (nodes, (parent, child, prop) edges).
+
+    Depth, node count and deadline come from policy; nodes below the roots
+    whose P31 types (via types_of) the policy blocks are kept but not
+    expanded. The query budget is enforced by expand itself.
+    """
+    policy = policy or CrawlPolicy()
+    stats = stats if stats is not None else CrawlStats()
+    roots = list(dict.fromkeys(roots))
+    seen = set(roots)
+    dropped: Set[str] = set()
+    raw_edges: List[Tuple[str, str, str]] = []
+    frontier = roots
+    depth = 0
+    while frontier:
+        if policy.max_depth is not None and depth >= policy.max_depth:
+            stats.prune("max_depth", frontier)
+            break
+        if policy.out_of_time():
+            stats.prune("deadline", frontier)
+            break
+        if depth > 0 and policy.filters_types and types_of is not None:
+            types = types_of(frontier)
+            keep, blocked = [], []
+            for node in frontier:
+                blocker = policy.blocking_type(types.get(node, []))
+                if blocker:
+                    stats.pruned_types[blocker] += 1
+                    blocked.append(node)
+                else:
+                    keep.append(node)
+            stats.prune("type", blocked)
+            frontier = keep
+
+        expanded = expand(frontier)
+        next_frontier = []
+        for parent in frontier:
+            for child, prop in expanded.get(parent, ()):
+                if child not in seen:
+                    if policy.max_nodes is not None and len(seen) >= policy.max_nodes:
+                        if child not in dropped:
+                            dropped.add(child)
+                            stats.prune("max_nodes", [child])
+                        continue
+                    seen.add(child)
+                    next_frontier.append(child)
+                raw_edges.append((parent, child, prop))
+        frontier = next_frontier
+        depth += 1
+
+    stats.nodes = len(seen)
+    stats.depth = max(stats.depth, depth)
+    stats.seconds = policy.elapsed()
+    return seen, raw_edges
+
+
+def _store_expander(
+    store: EntityStore, policy: CrawlPolicy, stats: CrawlStats, refresh: Set[str] | bool = frozenset()
+) -> Expander:
+    """
+    Expand a BFS level through the entity store: stored edges are reused and
+    the rest are fetched with VALUES-batched queries, each charged to the
+    query budget, then written back in one transaction. Nodes in refresh
+    (all nodes if True) skip the stored edges.
+    """
+
+    def expand(nodes: List[str]) -> Dict[str, List[Tuple[str, str]]]:
+        out, todo = {}, []
+        for node in nodes:
+            fresh = not store.offline and (refresh is True or node in refresh)
+            cached = None if fresh else store.cached_children(node)
+            if cached is None:
+                todo.append(node)
+            else:
+                out[node] = cached
+        if todo and policy.out_of_time():
+            stats.prune("deadline", todo)
+            todo = []
+        if todo and policy.max_queries is not None:
+            allowed = max(0, policy.max_queries - stats.queries) * _EDGE_BATCH
+            stats.prune("max_queries", todo[allowed:])
+            todo = todo[:allowed]
+        if todo:
+            stats.queries += -(-len(todo) // _EDGE_BATCH)
+            fetched = {p: list(dict.fromkeys(e)) for p, e in fetch_edges_batch(todo).items()}
+            store.put_edges_many(fetched)
+            out.update(fetched)
+        return out
+
+    return expand
+
+
+def _store_types(store: EntityStore) -> Callable[[List[str]], Dict[str, List[str]]]:
+    return lambda nodes: {q: e["types"] for q, e in store.get_entities(nodes).items()}
+
+
+def _policy_for(store: EntityStore, policy: CrawlPolicy | None) -> CrawlPolicy:
+    policy = policy or CrawlPolicy.from_config()
+    if store.offline:
+        policy.fetch_closures = False
+    policy.start()
+    return policy
+
+
+def _resolve(
+    nodes: Set[str],
+    store: EntityStore,
+    known: HierarchyGraph | None = None,
+    refresh: Set[str] = frozenset(),
+) -> Tuple[Dict[str, str], Dict[str, List[str]], Dict[str, Dict]]:
+    """
+    Labels and child type labels of nodes. Nodes in `known` that are not in
+    `refresh` are reused without a lookup. Returns (labels, types, entities
+    looked up).
+    """
+    reuse = {q for q in nodes if known is not None and q in known and q not in refresh}
+    entities = store.get_entities(nodes & refresh, refresh=True) if refresh else {}
+    entities.update(store.get_entities(nodes - reuse - set(entities)))
+    type_qids = {t for e in entities.values() for t in e["types"]}
+    type_entities = store.get_entities(type_qids)
+
+    labels = {q: known.label(q) for q in reuse}
+    types = {q: known.types_of(q) for q in reuse}
+    for qid in nodes - reuse:
+        ent = entities.get(qid)
+        labels[qid] = ent["label"] if ent else qid
+        types[qid] = [
+            type_entities[t]["label"] if t in type_entities else t for t in (ent or {}).get("types", [])
+        ]
+    return labels, types, entities
+
+
+def _build_graph(
+    root_qid: str,
+    seen: Set[str],
+    raw_edges: List[Tuple[str, str, str]],
+    store: EntityStore,
+    known: HierarchyGraph | None = None,
+    refresh: Set[str] = frozenset(),
+) -> Tuple[HierarchyGraph, Dict[str, Dict]]:
+    """Resolve labels/types (see _resolve) and build the graph."""
+    labels, types, entities = _resolve(seen, store, known, refresh)
+    return HierarchyGraph.from_edges(raw_edges, labels, types, root=root_qid), entities
+
+
+def crawl_graph(
+    root_qid: str,
+    store: EntityStore | None = None,
+    policy: CrawlPolicy | None = None,
+    stats: CrawlStats | None = None,
+) -> HierarchyGraph:
+    """
+    Crawl all parts and parent relations under a root entity via BFS and
+    return them as a HierarchyGraph. Edges, labels and types are read
+    through the entity store, so nodes expanded recently (by any module or
+    run) are not queried again. policy (default: CrawlPolicy.from_config())
+    bounds the crawl; pass stats to see what it pruned.
+    """
+    store = store or get_store()
+    policy = _policy_for(store, policy)
+    stats = stats if stats is not None else CrawlStats()
+    seen, raw_edges = _crawl(
+        [root_qid], _store_expander(store, policy, stats), policy, stats, _store_types(store)
+    )
+    return _build_graph(root_qid, seen, raw_edges, store)[0]
+
+
+def crawl_many(
+    roots: Sequence[str],
+    store: EntityStore | None = None,
+    policy: CrawlPolicy | None = None,
+    stats: CrawlStats | None = None,
+) -> Dict[str, HierarchyGraph]:
+    """
+    Crawl several roots together and return one HierarchyGraph per root.
+
+    All roots share one visited set and edge cache, and each BFS level is
+    fetched with VALUES-batched queries (nodes already expanded in the
+    entity store are skipped), so subtrees shared by a university system
+    and its campuses are fetched exactly once per run. The policy budgets
+    apply to the shared crawl as a whole.
+    """
+    store = store or get_store()
+    policy = _policy_for(store, policy)
+    stats = stats if stats is not None else CrawlStats()
+    adjacency: Dict[str, List[Tuple[str, str]]] = {}
+    via_store = _store_expander(store, policy, stats)
+
+    def expand(nodes: List[str]) -> Dict[str, List[Tuple[str, str]]]:
+        out = via_store(nodes)
+        adjacency.update(out)
+        return out
+
+    _crawl(roots, expand, policy, stats, _store_types(store))
+    logger.info("crawl_many: %d roots, %s", len(roots), stats.as_dict())
+
+    nodes = set(adjacency) | {c for edges in adjacency.values() for c, _ in edges}
+    labels, types, _ = _resolve(nodes, store)
+    views = {}
+    for root in dict.fromkeys(roots):
+        seen, raw_edges = _crawl(
+            [root], lambda frontier: {n: adjacency[n] for n in frontier if n in adjacency}
+        )
+        views[root] = HierarchyGraph.from_edges(
+            raw_edges, {q: labels[q] for q in seen}, {q: types[q] for q in seen}, root=root
+        )
+    return views
+
+
+def descendants_among(root_qid: str, qids: Sequence[str]) -> Set[str]:
+    """
+    The subset of qids that are (transitive) descendants of root_qid,
+    answered with one VALUES-batched property-path query per _INCOMING_BATCH
+    items instead of a crawl.
+    """
+    path = "|".join([f"wdt:{p}" for p in PREDICATES_UP] + [f"^wdt:{p}" for p in PREDICATES_DOWN])
+    qids = list(dict.fromkeys(qids))
+    found: Set[str] = set()
+    for i in range(0, len(qids), _INCOMING_BATCH):
+        query = ANCESTRY_TEMPLATE.format(
+            items=" ".join(f"wd:{q}" for q in qids[i:i + _INCOMING_BATCH]), path=path, root=root_qid
+        )
+        found.update(b["x"]["value"].rsplit("/", 1)[-1] for b in execute_sparql_bindings(query))
+    return found
+
+
 def all_descendants(
     root_qid: str,
+    store: EntityStore | None = None,
 ) -> Tuple[List[Tuple[str, str, str, str]], Dict[str, str]]:
     """
-    Crawl all parts and parent relations under a root entity via BFS.
+    Edge-list view of crawl_graph(), kept for existing callers.
     Returns:
-      - edges: list of (parent_qid, child_qid, predicateLabel, childTypeLabel)
+      - edges: list of (parent_qid, child_qid, predicate_id, childTypeLabel)
       - labels: map from qid to English label
     """
-    queue = deque([root_qid])
-    seen = {root_qid}
-    edges: List[Tuple[str, str, str, str]] = []
-    labels: Dict[str, str] = {}
-
-    # fetch root label
-    label_q = f"SELECT ?l WHERE {{ wd:{root_qid} rdfs:label ?l FILTER(lang(?l)='en') }}"
-    binding = execute_sparql_bindings(label_q)[0]
-    labels[root_qid] = binding["l"]["value"]
-
-    while queue:
-        parent = queue.popleft()
-        for down, up in zip(PREDICATES_DOWN, PREDICATES_UP):
-            query = SPARQL_TEMPLATE.format(parent=parent, down=down, up=up)
-            rows = execute_sparql_bindings(query)
-            for b in rows:
-                child = b["child"]["value"].rsplit("/", 1)[-1]
-                prop = b["propLabel"]["value"]
-                ctype = b.get("childTypeLabel", {}).get("value", "—")
-                if child not in seen:
-                    seen.add(child)
-                    queue.append(child)
-                edges.append((parent, child, prop, ctype))
-                labels.setdefault(child, b["childLabel"]["value"])
-            sleep(time_sleep)
+    graph = crawl_graph(root_qid, store)
+    return list(graph.edge_tuples()), graph.labels_dict()
+
+
+# ─────────────────────────  incremental refresh  ─────────────────────────
+
+
+def fetch_incoming_edges(nodes: Sequence[str]) -> Set[Tuple[str, str, str]]:
+    """(parent, child, prop) for every P361/P749 claim pointing at one of nodes."""
+    out: Set[Tuple[str, str, str]] = set()
+    nodes = list(nodes)
+    for i in range(0, len(nodes), _INCOMING_BATCH):
+        query = INCOMING_TEMPLATE.format(
+            parents=" ".join(f"wd:{q}" for q in nodes[i:i + _INCOMING_BATCH]),
+            up=" ".join(f"wdt:{p}" for p in PREDICATES_UP),
+        )
+        for b in execute_sparql_bindings(query):
+            out.add(tuple(b[k]["value"].rsplit("/", 1)[-1] for k in ("parent", "child", "prop")))
+        sleep(time_sleep)
+    return out
+
+
+def save_snapshot(
+    graph: HierarchyGraph,
+    revisions: Dict[str, int],
+    directory: Path | None = None,
+    expanded: Iterable[str] | None = None,
+) -> None:
+    """expanded: nodes whose children were fetched (default: nodes with children)."""
+    directory = directory or SNAPSHOT_DIR / graph.root
+    graph.save(directory)
+    if expanded is None:
+        expanded = [q for q in graph.nodes if graph.children(q)]
+    (directory / "revisions.json").write_text(
+        json.dumps({"crawled_at": time.time(), "revisions": revisions, "expanded": sorted(expanded)})
+    )
+
+
+def load_snapshot(
+    root_qid: str, directory: Path | None = None
+) -> Optional[Tuple[HierarchyGraph, Dict[str, int], Set[str]]]:
+    """(graph, revisions, expanded nodes) of the saved crawl, or None."""
+    directory = directory or SNAPSHOT_DIR / root_qid
+    try:
+        data = json.loads((directory / "revisions.json").read_text())
+        graph = HierarchyGraph.load(directory, mmap=False)
+        revisions = data["revisions"]
+    except (OSError, ValueError, KeyError):
+        return None
+    if "expanded" in data:
+        expanded = set(data["expanded"])
+    else:
+        # snapshots from before this was recorded: leaves may just be unexpanded
+        expanded = {q for q in graph.nodes if graph.children(q)}
+    return graph, revisions, expanded
+
+
+def _recording(expand: Expander, into: Set[str]) -> Expander:
+    """expand, adding every node it returns children for to into."""
+
+    def run(nodes: List[str]) -> Dict[str, List[Tuple[str, str]]]:
+        out = expand(nodes)
+        into.update(out)
+        return out
+
+    return run
+
+
+def refresh_graph(
+    root_qid: str,
+    store: EntityStore | None = None,
+    directory: Path | None = None,
+    policy: CrawlPolicy | None = None,
+    stats: CrawlStats | None = None,
+) -> Tuple[HierarchyGraph, Dict[str, Any]]:
+    """
+    Return the current hierarchy under root_qid, re-expanding only what changed.
+
+    With no saved snapshot this is a full crawl that fetches every node's
+    edges afresh rather than from the entity store. Otherwise the lastrevid of
+    every known node is checked in bulk, incoming P361/P749 edges are
+    fetched with a few VALUES-batched queries, and only nodes whose revision
+    or incoming edges changed (plus nodes new to the tree or left unexpanded
+    by a bounded crawl) are expanded again; everything else is reused from
+    the snapshot. The returned diff lists added/removed (parent, child,
+    prop) edges and what was checked.
+    """
+    store = store or get_store()
+    policy = _policy_for(store, policy)
+    stats = stats if stats is not None else CrawlStats()
+    expanded: Set[str] = set()
+    snapshot = None if store.offline else load_snapshot(root_qid, directory)
+    # the snapshot pairs each node's edges with its current lastrevid, so
+    # edges it records are fetched now, never read from an older store row
+    via_store = _store_expander(store, policy, stats, refresh=not store.offline)
+    if snapshot is None:
+        seen, raw_edges = _crawl(
+            [root_qid], _recording(via_store, expanded),
+            policy, stats, _store_types(store),
+        )
+        graph = _build_graph(root_qid, seen, raw_edges, store)[0]
+        diff = {
+            "root": root_qid, "full_crawl": True, "checked": 0, "changed": [],
+            "added": sorted(set((p, c, r) for p, c, r, _ in graph.edge_tuples())), "removed": [],
+        }
+        if not store.offline:
+            save_snapshot(graph, get_revisions(graph.nodes), directory, expanded)
+        return graph, diff
+
+    old, old_revs, old_expanded = snapshot
+    current = get_revisions(old.nodes)
+    changed = {q for q in old.nodes if current.get(q) != old_revs.get(q)}
+
+    old_edges = {(p, c, r) for p, c, r, _ in old.edge_tuples()}
+    incoming = fetch_incoming_edges(old.nodes)
+    old_incoming = {e for e in old_edges if e[2] in PREDICATES_UP}
+    changed |= {p for p, _, _ in incoming ^ old_incoming}
+
+    def expand(nodes: List[str]) -> Dict[str, List[Tuple[str, str]]]:
+        # nodes a bounded earlier crawl never expanded have no children to reuse
+        out = {n: old.children(n) for n in nodes if n in old_expanded and n not in changed}
+        out.update(via_store([n for n in nodes if n not in out]))
+        return out
+
+    seen, raw_edges = _crawl([root_qid], _recording(expand, expanded), policy, stats, _store_types(store))
+    added_nodes = seen - set(old.nodes)
+    graph, entities = _build_graph(
+        root_qid, seen, raw_edges, store, known=old, refresh=changed | added_nodes
+    )
+
+    revisions = {q: current[q] for q in seen if q in current}
+    revisions.update({q: e["lastrevid"] for q, e in entities.items() if e.get("lastrevid")})
+    save_snapshot(graph, revisions, directory, expanded)
+
+    new_edges = set(raw_edges)
+    diff = {
+        "root": root_qid,
+        "full_crawl": False,
+        "checked": len(old.nodes),
+        "changed": sorted(changed),
+        "added": sorted(new_edges - old_edges),
+        "removed": sorted(old_edges - new_edges),
+    }
+    logger.info(
+        "%s: refreshed hierarchy, %d of %d nodes changed, +%d/-%d edges",
+        root_qid, len(changed), len(old.nodes), len(diff["added"]), len(diff["removed"]),
+    )
+    return graph, diff
+
 
-    return edges, labels
+def write_change_report(diff: Dict[str, Any], directory: Path = CHANGE_REPORT_DIR) -> Path:
+    """Write a refresh diff to results/reports/{root}_hierarchy_changes.json."""
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f"{diff['root']}_hierarchy_changes.json"
+    path.write_text(json.dumps(diff, indent=2))
+    return path
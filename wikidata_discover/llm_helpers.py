@@ -1,7 +1,12 @@
 import json
 import logging
 import re
-from typing import List, Dict, Any, Optional, Tuple
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Dict, Any, Deque, Iterable, Iterator, Optional, Tuple
 from rich.console import Console
 import hashlib
 from pathlib import Path
@@ -9,8 +14,10 @@ from pathlib import Path
 from wikidata_discover.config import (
     OPENAI_API_KEY, ANTHROPIC_API_KEY, GOOGLE_API_KEY,
     LLM_MODEL, ANTHROPIC_MODEL, GEMINI_MODEL,
+    OPENAI_BASE_URL, ANTHROPIC_BASE_URL, GEMINI_BASE_URL,
     require_key,
 )
+from wikidata_discover.replay import recorded_client
 
 console = Console()
 logger = logging.getLogger(__name__)
@@ -26,10 +33,30 @@ SYSTEM_EXTRACT = (
     "You should double check that reference URL exists and contains the supporting information for the existence of the units."
 )
 
-MATCH_TEMPLATE = (
-    "You are assisting with entity alignment to Wikidata. Below is the name of a "
-    "candidate academic unit *CANDIDATE* from UNIVERSITY, followed by a numbered "
-    "list of existing descendant units from Wikidata, each labelled `[n] QID -- LABEL`.\n\n"
+# Same contract one level down: the input names a unit (school, department,
+# ...) and the chain of units above it, and the model lists its sub-units.
+SYSTEM_EXTRACT_SUBUNITS = (
+    "You are an education data analyst. Given the name of an academic or administrative unit, "
+    "the units it belongs to (outermost first) and (optionally) its website URL, return a JSON "
+    "key `units` whose value is an *array* of objects, each describing an *immediate* sub-unit "
+    "of that unit (department, program, institute, lab, center, or similar). "
+    "Each object *must* include: name, unit_type, city, state, website. Use null if a "
+    "value is unknown. Do not list units nested inside another listed unit, and do not "
+    "list the parent units themselves."
+    "Provide also a URL as a reference so that someone can validate the information. The key for the reference URL should be 'reference'."
+    "You should double check that reference URL exists and contains the supporting information for the existence of the units."
+)
+
+# Static instructions come first and the per-university listing second, so
+# every choose_match call for one university shares a prefix; the candidate
+# (the only part that changes per call) goes last. Providers only cache
+# prefixes of about _CACHE_MIN_TOKENS or more, so the listing is marked for
+# caching only when it is that long (see match_prefix_cacheable).
+MATCH_INSTRUCTIONS = (
+    "You are assisting with entity alignment to Wikidata. You will be given the name "
+    "of a UNIVERSITY and a numbered list of existing descendant units from Wikidata, "
+    "each labelled `[n] QID -- LABEL`, followed by the name of a CANDIDATE academic "
+    "unit from that university.\n\n"
     "If the candidate is equivalent to a listed unit **that already has** a parent-"
     "link to UNIVERSITY, reply with that QID.\n"
     "If it matches a listed unit but that unit is **missing** the parent link, "
@@ -38,12 +65,17 @@ MATCH_TEMPLATE = (
     "*Return that single token only -- no explanation.*"
 )
 
-JUDGE_PROMPT_TEMPLATE = (
-    "You are evaluating academic units for a university. Given the name of UNIVERSITY and a union of school/college/division names "
-    "proposed by multiple automated extraction systems, filter to only those that are real, top-level academic units of UNIVERSITY.\n\n"
-    "Proposed units:\nUNITS_LIST\n\n"
-    "Return a JSON object with a 'keep' key containing an array of unit names you confirm as real top-level units. "
-    "Do not invent or add units not in the list above."
+# OpenAI and Anthropic cache nothing shorter than this (some models need
+# more); shorter prefixes are billed in full whatever the cache marks say
+_CACHE_MIN_TOKENS = 1024
+
+JUDGE_INSTRUCTIONS = (
+    "You are evaluating academic units for a university. You will be given the name of a "
+    "UNIVERSITY and a union of school/college/division names proposed by multiple automated "
+    "extraction systems. Filter them to only those that are real, top-level academic units "
+    "of UNIVERSITY.\n\n"
+    "Return a JSON object with a 'keep' key containing an array of unit names you confirm as "
+    "real top-level units. Do not invent or add units not in the list."
 )
 
 UNIVERSITY_UNITS_SCHEMA = {
@@ -92,34 +124,149 @@ _anthropic_client = None
 _gemini_client = None
 
 
+@recorded_client("openai")
 def _get_openai_client():
     global _openai_client
     if _openai_client is None:
         from openai import OpenAI
-        _openai_client = OpenAI(api_key=require_key("OPENAI_API_KEY", OPENAI_API_KEY))
+        _openai_client = OpenAI(
+            api_key=require_key("OPENAI_API_KEY", OPENAI_API_KEY), base_url=OPENAI_BASE_URL
+        )
     return _openai_client
 
 
+@recorded_client("anthropic")
 def _get_anthropic_client():
     global _anthropic_client
     if _anthropic_client is None:
         import anthropic
         _anthropic_client = anthropic.Anthropic(
-            api_key=require_key("ANTHROPIC_API_KEY", ANTHROPIC_API_KEY)
+            api_key=require_key("ANTHROPIC_API_KEY", ANTHROPIC_API_KEY), base_url=ANTHROPIC_BASE_URL
         )
     return _anthropic_client
 
 
+@recorded_client("gemini")
 def _get_gemini_client():
     global _gemini_client
     if _gemini_client is None:
         from google import genai
-        _gemini_client = genai.Client(api_key=require_key("GOOGLE_API_KEY", GOOGLE_API_KEY))
+        _gemini_client = genai.Client(
+            api_key=require_key("GOOGLE_API_KEY", GOOGLE_API_KEY),
+            http_options={"base_url": GEMINI_BASE_URL} if GEMINI_BASE_URL else None,
+        )
     return _gemini_client
 
+# ─────────────────────────  USAGE ACCOUNTING  ─────────────────────────
+
+# One record per provider response: token counts, prompt-cache reads/writes
+# and latency. LLM_USAGE keeps the most recent ones of the process; a run
+# accounts for its own calls with usage_scope(), which calls made by
+# concurrent runs on other threads do not reach.
+_USAGE_KEEP = 10_000
+LLM_USAGE: Deque[Dict[str, Any]] = deque(maxlen=_USAGE_KEEP)
+_usage_lock = threading.Lock()
+_usage_scopes: ContextVar[Tuple[List[Dict[str, Any]], ...]] = ContextVar("llm_usage_scopes", default=())
+
+
+@contextmanager
+def usage_scope() -> Iterator[List[Dict[str, Any]]]:
+    """
+    Collect the usage records of calls made inside the block: on this
+    thread and on threads running a copy of its context
+    (contextvars.copy_context().run). Scopes nest; an outer scope also
+    gets the records of inner ones.
+    """
+    records: List[Dict[str, Any]] = []
+    token = _usage_scopes.set(_usage_scopes.get() + (records,))
+    try:
+        yield records
+    finally:
+        _usage_scopes.reset(token)
+
+
+def _add_usage(record: Dict[str, Any]) -> None:
+    with _usage_lock:
+        LLM_USAGE.append(record)
+    for records in _usage_scopes.get():
+        records.append(record)
+
+
+def _record_usage(call: str, provider: str, model: str, resp: Any, started: float) -> Dict[str, Any]:
+    """Record token and cache counts of one provider response (LLM_USAGE and open scopes)."""
+    if provider == "openai":
+        usage = getattr(resp, "usage", None)
+        details = getattr(usage, "input_tokens_details", None)
+        counts = (
+            getattr(usage, "input_tokens", 0),
+            getattr(usage, "output_tokens", 0),
+            getattr(details, "cached_tokens", 0),
+            0,  # OpenAI caches automatically and does not bill writes
+        )
+    elif provider == "anthropic":
+        usage = getattr(resp, "usage", None)
+        counts = (
+            getattr(usage, "input_tokens", 0),
+            getattr(usage, "output_tokens", 0),
+            getattr(usage, "cache_read_input_tokens", 0),
+            getattr(usage, "cache_creation_input_tokens", 0),
+        )
+    else:
+        usage = getattr(resp, "usage_metadata", None)
+        counts = (
+            getattr(usage, "prompt_token_count", 0),
+            getattr(usage, "candidates_token_count", 0),
+            getattr(usage, "cached_content_token_count", 0),
+            0,
+        )
+
+    input_tokens, output_tokens, cache_read, cache_write = (c or 0 for c in counts)
+    record = {
+        "call": call,
+        "provider": provider,
+        "model": model,
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+        "cache_read_tokens": cache_read,
+        "cache_write_tokens": cache_write,
+        "latency_s": round(time.monotonic() - started, 3),
+    }
+    _add_usage(record)
+    logger.debug(
+        "%s (%s): in=%d out=%d cache_read=%d cache_write=%d %.2fs",
+        call, provider, input_tokens, output_tokens, cache_read, cache_write, record["latency_s"],
+    )
+    return record
+
+
+def summarize_usage(records: Iterable[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """Aggregate usage records per call type (choose_match, extract, ...)."""
+    summary: Dict[str, Dict[str, Any]] = {}
+    for r in records:
+        s = summary.setdefault(r["call"], {
+            "calls": 0, "input_tokens": 0, "output_tokens": 0,
+            "cache_read_tokens": 0, "cache_write_tokens": 0, "latency_s": 0.0,
+        })
+        s["calls"] += 1
+        for k in ("input_tokens", "output_tokens", "cache_read_tokens", "cache_write_tokens"):
+            s[k] += r[k]
+        s["latency_s"] = round(s["latency_s"] + r["latency_s"], 3)
+    return summary
+
 # ─────────────────────────  NAME MATCHING  ─────────────────────────
 
 
+def _estimate_tokens(text: str) -> int:
+    """Rough token count (about 4 characters per token in English)."""
+    return len(text) // 4
+
+
+def _match_prefix(univ_label: str, children: List[Tuple[str, str]]) -> str:
+    """The per-university part of a choose_match prompt: the numbered children."""
+    listing = "\n".join(f"[{i+1}] {qid} -- {label}" for i, (qid, label) in enumerate(children))
+    return f"UNIVERSITY: {univ_label}\n\nExisting units:\n{listing}"
+
+
 def _names_match(a: str, b: str) -> bool:
     """Lightweight fuzzy name match for deduplicating ensemble outputs."""
     from rapidfuzz import fuzz
@@ -128,11 +275,20 @@ def _names_match(a: str, b: str) -> bool:
     return na == nb or fuzz.token_sort_ratio(na, nb) >= 88
 
 
-def _cache_key(univ_label: str, provider: str, model: str) -> str:
+def _cache_key(univ_label: str, provider: str, model: str, parent: Optional[str] = None) -> str:
     """Cache key includes provider to avoid collisions between providers."""
+    if parent:
+        univ_label = f"{parent} > {univ_label}"
     return hashlib.sha256(f"{provider}|{univ_label}|{model}".encode()).hexdigest()
 
 
+def _extract_prompt(univ_label: str, website: str, parent: Optional[str] = None) -> Tuple[str, str]:
+    """(system, user) prompts; with a parent chain, ask for sub-units of univ_label."""
+    if not parent:
+        return SYSTEM_EXTRACT, f"{univ_label} -- {website}"
+    return SYSTEM_EXTRACT_SUBUNITS, f"{univ_label} (part of {parent}) -- {website}"
+
+
 def _load_cache(key: str) -> Optional[List[Dict[str, Any]]]:
     path = _CACHE_DIR / f"{key}.json"
     if path.exists():
@@ -180,6 +336,226 @@ def _normalize_units(payload: Any) -> List[Dict[str, Any]]:
     return result
 
 
+# ─────────────────────────  STREAMING  ─────────────────────────
+
+_UNITS_KEY_RE = re.compile(r'"units"\s*:\s*\[')
+
+
+def _scan_json_value(buf: str, start: int) -> Optional[int]:
+    """Return the end index of the JSON value starting at buf[start], or None if incomplete."""
+    opener = buf[start]
+    if opener in "{[":
+        depth, in_str, escaped = 0, False, False
+        for i in range(start, len(buf)):
+            ch = buf[i]
+            if in_str:
+                if escaped:
+                    escaped = False
+                elif ch == "\\":
+                    escaped = True
+                elif ch == '"':
+                    in_str = False
+            elif ch == '"':
+                in_str = True
+            elif ch in "{[":
+                depth += 1
+            elif ch in "}]":
+                depth -= 1
+                if depth == 0:
+                    return i + 1
+        return None
+    if opener == '"':
+        escaped = False
+        for i in range(start + 1, len(buf)):
+            ch = buf[i]
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                return i + 1
+        return None
+    # bare literal (null, number, true/false): complete once a delimiter follows
+    for i in range(start, len(buf)):
+        if buf[i] in ",]} \t\r\n":
+            return i
+    return None
+
+
+class _UnitsStreamParser:
+    """Incrementally pull complete items out of the `units` array of a streamed JSON reply.
+
+    Text before the array (markdown fences, other keys) is skipped; everything
+    after its closing bracket is ignored.
+    """
+
+    def __init__(self):
+        self._buf = ""
+        self._pos = 0
+        self._in_array = False
+        self.done = False
+
+    def feed(self, chunk: str) -> List[Any]:
+        self._buf += chunk
+        items: List[Any] = []
+        if not self._in_array:
+            m = _UNITS_KEY_RE.search(self._buf)
+            if not m:
+                return items
+            self._pos = m.end()
+            self._in_array = True
+
+        while not self.done:
+            i = self._pos
+            while i < len(self._buf) and self._buf[i] in " \t\r\n,":
+                i += 1
+            self._pos = i
+            if i >= len(self._buf):
+                break
+            if self._buf[i] == "]":
+                self.done = True
+                break
+            end = _scan_json_value(self._buf, i)
+            if end is None:
+                break
+            try:
+                items.append(json.loads(self._buf[i:end]))
+            except json.JSONDecodeError as exc:
+                logger.warning("streamed unit is not valid JSON, skipping: %s", exc)
+            self._pos = end
+        return items
+
+
+def _stream_units(
+    provider: str, univ_label: str, chunks: Iterable[str], cache_key: str
+) -> Iterator[Dict[str, Any]]:
+    """Yield normalized units as soon as each one is complete in the text stream.
+
+    Once the stream ends the full text is parsed and validated as in the
+    non-streaming extractors and only then written to the cache.
+    """
+    parser = _UnitsStreamParser()
+    parts: List[str] = []
+    for chunk in chunks:
+        parts.append(chunk)
+        for itm in parser.feed(chunk):
+            try:
+                yield from _normalize_units({"units": [itm]})
+            except ValueError as exc:
+                logger.warning("stream_divisions_%s: skipping unit for %s: %s", provider, univ_label, exc)
+
+    raw_text = "".join(parts)
+    match = re.search(r'\{[\s\S]*\}', raw_text)
+    json_text = match.group(0) if match else raw_text
+    try:
+        result = _normalize_units(_parse_json_text(json_text))
+    except ValueError as exc:  # includes json.JSONDecodeError
+        logger.error(
+            "stream_divisions_%s: final response invalid for %s, not cached: %s\nRaw response: %s",
+            provider, univ_label, exc, raw_text[:500],
+        )
+        return
+    _save_cache(cache_key, result)
+
+
+def _openai_text_stream(model: str, univ_label: str, website: str) -> Iterator[str]:
+    client = _get_openai_client()
+    started = time.monotonic()
+    events = client.responses.create(
+        model=model,
+        input=[
+            {"role": "system", "content": SYSTEM_EXTRACT},
+            {"role": "user", "content": f"{univ_label} -- {website}"}
+        ],
+        tools=[{"type": "web_search_preview"}],
+        text={"format": {"type": "json_schema", "name": "university_units", "schema": UNIVERSITY_UNITS_SCHEMA}},
+        store=False,
+        stream=True,
+    )
+    for event in events:
+        if event.type == "response.output_text.delta":
+            yield event.delta
+        elif event.type == "response.completed":
+            _record_usage("extract", "openai", model, event.response, started)
+
+
+def _anthropic_text_stream(model: str, univ_label: str, website: str) -> Iterator[str]:
+    client = _get_anthropic_client()
+    started = time.monotonic()
+    with client.messages.stream(
+        model=model,
+        max_tokens=2048,
+        system=SYSTEM_EXTRACT,
+        messages=[{"role": "user", "content": f"{univ_label} -- {website}"}],
+    ) as stream:
+        yield from stream.text_stream
+        _record_usage("extract", "anthropic", model, stream.get_final_message(), started)
+
+
+def _gemini_text_stream(model: str, univ_label: str, website: str) -> Iterator[str]:
+    client = _get_gemini_client()
+    from google.genai import types as genai_types
+    started = time.monotonic()
+    last = None
+    for chunk in client.models.generate_content_stream(
+        model=model,
+        contents=f"System: {SYSTEM_EXTRACT}\n\nInput: {univ_label} -- {website}",
+        config=genai_types.GenerateContentConfig(temperature=0.7, max_output_tokens=2048),
+    ):
+        last = chunk
+        if chunk.text:
+            yield chunk.text
+    if last is not None:
+        _record_usage("extract", "gemini", model, last, started)
+
+
+_TEXT_STREAMS = {
+    "openai": (_openai_text_stream, lambda: LLM_MODEL, lambda: OPENAI_API_KEY),
+    "anthropic": (_anthropic_text_stream, lambda: ANTHROPIC_MODEL, lambda: ANTHROPIC_API_KEY),
+    "gemini": (_gemini_text_stream, lambda: GEMINI_MODEL, lambda: GOOGLE_API_KEY),
+}
+
+
+class UnitStream:
+    """
+    Units from stream_divisions_best_available(), as an iterator. The next
+    provider is tried only if one yields nothing; once consumed, provider
+    names the one whose units came through and error is set if it failed
+    partway, so the list may be incomplete.
+    """
+
+    def __init__(self, providers: List[str], univ_label: str, website: str):
+        self.provider: Optional[str] = None
+        self.error: Optional[str] = None
+        self._units = self._stream(providers, univ_label, website)
+
+    def __iter__(self) -> "UnitStream":
+        return self
+
+    def __next__(self) -> Dict[str, Any]:
+        return next(self._units)
+
+    def _stream(self, providers: List[str], univ_label: str, website: str) -> Iterator[Dict[str, Any]]:
+        for provider_name in providers:
+            yielded = 0
+            try:
+                for unit in LLMHelper.stream_divisions(provider_name, univ_label, website):
+                    yielded += 1
+                    self.provider = provider_name
+                    yield unit
+            except Exception as e:
+                logger.warning("stream_divisions_best_available: %s raised error (%s)", provider_name, e)
+                if yielded:
+                    self.error = f"{provider_name} failed after {yielded} units: {e}"
+            if yielded:
+                logger.info("stream_divisions_best_available: %s streamed %d units", provider_name, yielded)
+                return
+        logger.error("stream_divisions_best_available: all providers failed for %s", univ_label)
+        raise ValueError(
+            f"All LLM providers ({', '.join(providers)}) failed to extract units. University: {univ_label}"
+        )
+
+
 class LLMHelper:
     """Multi-provider LLM extraction and matching helper."""
 
@@ -197,10 +573,13 @@ class LLMHelper:
             return []
 
     @staticmethod
-    def extract_divisions_openai(univ_label: str, website: str) -> List[Dict[str, Any]]:
+    def extract_divisions_openai(
+        univ_label: str, website: str, parent: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
         """Extract divisions using OpenAI API."""
         model = LLM_MODEL
-        key = _cache_key(univ_label, "openai", model)
+        key = _cache_key(univ_label, "openai", model, parent)
+        system, user = _extract_prompt(univ_label, website, parent)
         cached = _load_cache(key)
         if cached is not None:
             logger.info("extract_divisions_openai: cache hit for %s", univ_label)
@@ -210,16 +589,18 @@ class LLMHelper:
 
         for attempt in range(1, _EXTRACT_MAX_RETRIES + 1):
             try:
+                started = time.monotonic()
                 resp = client.responses.create(
                     model=model,
                     input=[
-                        {"role": "system", "content": SYSTEM_EXTRACT},
-                        {"role": "user", "content": f"{univ_label} -- {website}"}
+                        {"role": "system", "content": system},
+                        {"role": "user", "content": user}
                     ],
                     tools=[{"type": "web_search_preview"}],
                     text={"format": {"type": "json_schema", "name": "university_units", "schema": UNIVERSITY_UNITS_SCHEMA}},
                     store=False
                 )
+                _record_usage("extract", "openai", model, resp, started)
 
                 raw_text = resp.output_text if resp.output else None
                 if not raw_text:
@@ -261,10 +642,13 @@ class LLMHelper:
         return []
 
     @staticmethod
-    def extract_divisions_anthropic(univ_label: str, website: str) -> List[Dict[str, Any]]:
+    def extract_divisions_anthropic(
+        univ_label: str, website: str, parent: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
         """Extract divisions using Anthropic Claude API."""
         model = ANTHROPIC_MODEL
-        key = _cache_key(univ_label, "anthropic", model)
+        key = _cache_key(univ_label, "anthropic", model, parent)
+        system, user = _extract_prompt(univ_label, website, parent)
         cached = _load_cache(key)
         if cached is not None:
             logger.info("extract_divisions_anthropic: cache hit for %s", univ_label)
@@ -274,14 +658,16 @@ class LLMHelper:
 
         for attempt in range(1, _EXTRACT_MAX_RETRIES + 1):
             try:
+                started = time.monotonic()
                 resp = client.messages.create(
                     model=model,
                     max_tokens=2048,
-                    system=SYSTEM_EXTRACT,
+                    system=system,
                     messages=[
-                        {"role": "user", "content": f"{univ_label} -- {website}"}
+                        {"role": "user", "content": user}
                     ]
                 )
+                _record_usage("extract", "anthropic", model, resp, started)
 
                 raw_text = resp.content[0].text if resp.content else None
                 if not raw_text:
@@ -327,10 +713,13 @@ class LLMHelper:
         return []
 
     @staticmethod
-    def extract_divisions_gemini(univ_label: str, website: str) -> List[Dict[str, Any]]:
+    def extract_divisions_gemini(
+        univ_label: str, website: str, parent: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
         """Extract divisions using Google Gemini API."""
         model = GEMINI_MODEL
-        key = _cache_key(univ_label, "gemini", model)
+        key = _cache_key(univ_label, "gemini", model, parent)
+        system, user = _extract_prompt(univ_label, website, parent)
         cached = _load_cache(key)
         if cached is not None:
             logger.info("extract_divisions_gemini: cache hit for %s", univ_label)
@@ -342,20 +731,22 @@ class LLMHelper:
             try:
                 from google.genai import types as genai_types
 
+                started = time.monotonic()
                 resp = client.models.generate_content(
                     model=model,
                     contents=[
                         genai_types.Content(
                             parts=[
-                                genai_types.Part.from_text(f"System: {SYSTEM_EXTRACT}\n\nInput: {univ_label} -- {website}")
+                                genai_types.Part.from_text(text=f"System: {system}\n\nInput: {user}")
                             ]
                         )
                     ],
-                    generation_config=genai_types.GenerationConfig(
+                    config=genai_types.GenerateContentConfig(
                         temperature=0.7,
                         max_output_tokens=2048,
                     ),
                 )
+                _record_usage("extract", "gemini", model, resp, started)
 
                 raw_text = resp.text if resp.text else None
                 if not raw_text:
@@ -401,12 +792,16 @@ class LLMHelper:
         return []
 
     @staticmethod
-    def extract_divisions_best_available(univ_label: str, website: str) -> List[Dict[str, Any]]:
+    def extract_divisions_best_available(
+        univ_label: str, website: str, parent: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
         """Extract divisions using the best available provider.
 
         Tries providers in order: OpenAI, Anthropic, Gemini.
         Falls back to next provider if current one fails or is not configured.
-        Raises ValueError if no providers are available.
+        Raises ValueError if no providers are available. With parent (the
+        labels of the enclosing units, e.g. "New York University"), univ_label
+        is treated as a sub-unit and its own sub-units are extracted.
         """
         providers = [
             ("openai", LLMHelper.extract_divisions_openai),
@@ -417,7 +812,7 @@ class LLMHelper:
         for provider_name, extractor in providers:
             try:
                 logger.debug("Trying %s for extraction...", provider_name)
-                result = extractor(univ_label, website)
+                result = extractor(univ_label, website, parent)
                 if result:  # Successfully extracted non-empty list
                     logger.info("extract_divisions_best_available: %s returned %d units", provider_name, len(result))
                     return result
@@ -438,6 +833,64 @@ class LLMHelper:
             f"University: {univ_label}"
         )
 
+    @staticmethod
+    def stream_divisions(provider: str, univ_label: str, website: str) -> Iterator[Dict[str, Any]]:
+        """Stream divisions from one provider, yielding each unit as soon as it is parsed.
+
+        Cache hits are replayed from the cache. The attempt is retried only if
+        it failed before yielding anything; a failure mid-stream ends it.
+        """
+        text_stream, model_of, _ = _TEXT_STREAMS[provider]
+        model = model_of()
+        key = _cache_key(univ_label, provider, model)
+        cached = _load_cache(key)
+        if cached is not None:
+            logger.info("stream_divisions_%s: cache hit for %s", provider, univ_label)
+            yield from cached
+            return
+
+        for attempt in range(1, _EXTRACT_MAX_RETRIES + 1):
+            yielded = 0
+            try:
+                for unit in _stream_units(provider, univ_label, text_stream(model, univ_label, website), key):
+                    yielded += 1
+                    yield unit
+            except ValueError:
+                raise  # provider not configured
+            except Exception as e:
+                logger.error(
+                    "stream_divisions_%s attempt %d/%d: API error for %s after %d units: %s",
+                    provider, attempt, _EXTRACT_MAX_RETRIES, univ_label, yielded, e,
+                )
+                if yielded:
+                    return
+                continue
+            if yielded:
+                return
+            logger.warning(
+                "stream_divisions_%s attempt %d/%d: no units for %s",
+                provider, attempt, _EXTRACT_MAX_RETRIES, univ_label,
+            )
+
+        logger.error("stream_divisions_%s failed for %s after %d attempts", provider, univ_label, _EXTRACT_MAX_RETRIES)
+
+    @staticmethod
+    def stream_divisions_best_available(univ_label: str, website: str) -> UnitStream:
+        """Streaming counterpart of extract_divisions_best_available().
+
+        Raises ValueError right away if no provider is configured, and from
+        the iteration if every provider fails or returns no units. See
+        UnitStream for a provider that fails partway.
+        """
+        configured = [name for name, (_, _, key_of) in _TEXT_STREAMS.items() if key_of()]
+        if not configured:
+            raise ValueError(
+                f"No LLM providers available for extraction. "
+                f"Please configure at least one of: OPENAI_API_KEY, ANTHROPIC_API_KEY, or GOOGLE_API_KEY. "
+                f"University: {univ_label}"
+            )
+        return UnitStream(configured, univ_label, website)
+
     @staticmethod
     def extract_divisions_ensemble(univ_label: str, website: str) -> List[Dict[str, Any]]:
         """Extract divisions using ensemble: generate from OpenAI + Anthropic, judge with Gemini.
@@ -495,18 +948,23 @@ class LLMHelper:
             return []
 
         candidates_list = "\n".join(f"- {c}" for c in candidates)
-        prompt = JUDGE_PROMPT_TEMPLATE.replace("UNIVERSITY", univ_label).replace("UNITS_LIST", candidates_list)
+        units_block = f"UNIVERSITY: {univ_label}\n\nProposed units:\n{candidates_list}"
 
         if judge_provider == "openai":
             try:
                 client = _get_openai_client()
+                started = time.monotonic()
                 resp = client.responses.create(
                     model=LLM_MODEL,
-                    input=[{"role": "user", "content": prompt}],
+                    input=[
+                        {"role": "system", "content": JUDGE_INSTRUCTIONS},
+                        {"role": "user", "content": units_block},
+                    ],
                     text={"format": {"type": "json_schema", "name": "judge_keep", "schema": JUDGE_KEEP_SCHEMA}},
                     max_output_tokens=1024,
                     store=False
                 )
+                _record_usage("judge_union", "openai", LLM_MODEL, resp, started)
                 raw_text = resp.output_text if resp.output else None
             except Exception as e:
                 logger.error("judge_union (OpenAI) failed: %s", e)
@@ -515,11 +973,14 @@ class LLMHelper:
         elif judge_provider == "anthropic":
             try:
                 client = _get_anthropic_client()
+                started = time.monotonic()
                 resp = client.messages.create(
                     model=ANTHROPIC_MODEL,
                     max_tokens=1024,
-                    messages=[{"role": "user", "content": prompt}]
+                    system=JUDGE_INSTRUCTIONS,
+                    messages=[{"role": "user", "content": units_block}]
                 )
+                _record_usage("judge_union", "anthropic", ANTHROPIC_MODEL, resp, started)
                 raw_text = resp.content[0].text if resp.content else None
                 # Extract JSON if wrapped in markdown
                 match = re.search(r'\{[\s\S]*\}', raw_text) if raw_text else None
@@ -532,11 +993,16 @@ class LLMHelper:
             try:
                 client = _get_gemini_client()
                 from google.genai import types as genai_types
+                started = time.monotonic()
                 resp = client.models.generate_content(
                     model=GEMINI_MODEL,
-                    contents=[genai_types.Content(parts=[genai_types.Part.from_text(prompt)])],
-                    generation_config=genai_types.GenerationConfig(max_output_tokens=1024),
+                    contents=[genai_types.Content(parts=[
+                        genai_types.Part.from_text(text=JUDGE_INSTRUCTIONS),
+                        genai_types.Part.from_text(text=units_block),
+                    ])],
+                    config=genai_types.GenerateContentConfig(max_output_tokens=1024),
                 )
+                _record_usage("judge_union", "gemini", GEMINI_MODEL, resp, started)
                 raw_text = resp.text if resp.text else None
                 # Extract JSON if wrapped in markdown
                 match = re.search(r'\{[\s\S]*\}', raw_text) if raw_text else None
@@ -562,27 +1028,36 @@ class LLMHelper:
             raise
 
     @staticmethod
-    def choose_match(candidate: str, univ_label: str, children: List[Tuple[str, str]]) -> Optional[Tuple[str, str]]:
-        """Return (qid,label) if LLM says the candidate matches one of the children, else None.
+    def match_prefix_cacheable(univ_label: str, children: List[Tuple[str, str]]) -> bool:
+        """Whether a choose_match prefix listing children is long enough to be cached."""
+        return _estimate_tokens(MATCH_INSTRUCTIONS + _match_prefix(univ_label, children)) >= _CACHE_MIN_TOKENS
 
+    @staticmethod
+    def choose_match(
+        candidate: str,
+        univ_label: str,
+        children: List[Tuple[str, str]],
+        extra: Optional[List[Tuple[str, str]]] = None,
+    ) -> Optional[Tuple[str, str]]:
+        """Return (qid,label) if LLM says the candidate matches one of the choices, else None.
+
+        ``children`` should be the same list for every call about one university
+        (it forms the prompt prefix, marked for caching once it is long enough);
+        per-candidate choices such as search hits go in ``extra`` and are listed
+        after it, numbering continued.
         Uses best available provider for matching.
         """
-        if not children:
+        choices = list(children) + list(extra or [])
+        if not choices:
             return None
 
-        # Compose numbered list for prompt
-        listing_lines = [
-            f"[{i+1}] {qid} -- {label}" for i, (qid, label) in enumerate(children)
-        ]
-        listing = "\n".join(listing_lines)
-
-        prompt = (
-            MATCH_TEMPLATE.replace("CANDIDATE", candidate).replace(
-                "UNIVERSITY", univ_label
-            )
-            + "\n\nExisting units:\n"
-            + listing
+        prefix = _match_prefix(univ_label, children)
+        cacheable = _estimate_tokens(MATCH_INSTRUCTIONS + prefix) >= _CACHE_MIN_TOKENS
+        suffix = "\n".join(
+            f"[{i+1}] {qid} -- {label}"
+            for i, (qid, label) in enumerate(choices) if i >= len(children)
         )
+        suffix = (suffix + "\n\n" if suffix else "") + f"CANDIDATE: {candidate}"
 
         # Try providers in order
         providers = [
@@ -595,29 +1070,52 @@ class LLMHelper:
             try:
                 if provider_name == "openai":
                     client = get_client()
+                    started = time.monotonic()
+                    # OpenAI caches identical prefixes automatically; the key
+                    # routes one university's calls to the same cache
                     resp = client.responses.create(
                         model=model,
-                        input=[{"role": "user", "content": [{"type": "input_text", "text": prompt}]}],
+                        input=[
+                            {"role": "system", "content": MATCH_INSTRUCTIONS},
+                            {"role": "user", "content": [
+                                {"type": "input_text", "text": prefix},
+                                {"type": "input_text", "text": suffix},
+                            ]},
+                        ],
                         max_output_tokens=16,
+                        **({"prompt_cache_key": f"choose_match:{univ_label}"} if cacheable else {}),
                     )
+                    _record_usage("choose_match", provider_name, model, resp, started)
                     answer = (resp.output_text or "").strip()
 
                 elif provider_name == "anthropic":
                     client = get_client()
+                    started = time.monotonic()
                     resp = client.messages.create(
                         model=model,
                         max_tokens=16,
-                        messages=[{"role": "user", "content": prompt}]
+                        system=MATCH_INSTRUCTIONS,
+                        messages=[{"role": "user", "content": [
+                            {"type": "text", "text": prefix,
+                             **({"cache_control": {"type": "ephemeral"}} if cacheable else {})},
+                            {"type": "text", "text": suffix},
+                        ]}]
                     )
+                    _record_usage("choose_match", provider_name, model, resp, started)
                     answer = (resp.content[0].text if resp.content else "").strip()
 
                 elif provider_name == "gemini":
                     client = get_client()
                     from google.genai import types as genai_types
+                    started = time.monotonic()
                     resp = client.models.generate_content(
                         model=model,
-                        contents=[genai_types.Content(parts=[genai_types.Part.from_text(prompt)])],
+                        contents=[genai_types.Content(parts=[
+                            genai_types.Part.from_text(text=MATCH_INSTRUCTIONS + "\n\n" + prefix),
+                            genai_types.Part.from_text(text=suffix),
+                        ])],
                     )
+                    _record_usage("choose_match", provider_name, model, resp, started)
                     answer = (resp.text or "").strip()
 
                 if not answer:
@@ -630,7 +1128,7 @@ class LLMHelper:
 
                 # Parse answer (may be QID or ORPHAN:QID)
                 token = answer.split()[0]
-                for qid, label in children:
+                for qid, label in choices:
                     if qid == token:
                         return (qid, label)
 
@@ -0,0 +1,155 @@
+"""
+Yield-aware ordering of universities for batch discover.
+
+Every university costs about the same extraction, but what it finds
+varies: one with a complete list of linked schools yields little, one
+with no linked children at all yields a full list. rank_universities()
+scores each QID by its expected number of missing units so a batch run
+under a budget processes the most productive ones first.
+
+The estimate combines:
+  * the direct-child count, from the entity store where it is cached and
+    otherwise from one VALUES-batched COUNT query per _COUNT_BATCH QIDs;
+  * harvest metadata: a known website makes extraction more reliable, a
+    missing label less so;
+  * past QA reports in results/reports/: their mean candidate count is the
+    expected size of a university, and a university that already has a
+    report can only gain what changed since.
+"""
+
+import json
+import logging
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+from wikidata_discover.discovery import DIRECT_CHILD_PROPS, RESULTS_DIR
+from wikidata_discover.entity_store import EntityStore, get_store
+from wikidata_discover.harvest_store import HarvestStore, get_harvest_store
+from wikidata_discover.sparql_helpers import execute_sparql_bindings
+
+logger = logging.getLogger(__name__)
+
+REPORTS_DIR = RESULTS_DIR / "reports"
+
+# direct children (the same edges Discovery counts as linked) per university
+CHILD_COUNT_TEMPLATE = """
+SELECT ?u (COUNT(DISTINCT ?child) AS ?n) WHERE {{
+  VALUES ?u {{ {qids} }}
+  OPTIONAL {{
+    {{ ?child wdt:P361|wdt:P749 ?u . }}
+    UNION
+    {{ ?u wdt:P355 ?child . }}
+  }}
+}} GROUP BY ?u
+"""
+_COUNT_BATCH = 200
+
+# used until there are reports to learn the typical unit count from
+_DEFAULT_EXPECTED_UNITS = 10.0
+_WEBSITE_FACTOR = 1.2
+_NO_WEBSITE_FACTOR = 0.8
+_NO_LABEL_FACTOR = 0.5
+_REPORTED_FACTOR = 0.1
+
+
+def count_children(qids: Iterable[str], store: EntityStore | None = None) -> Dict[str, int]:
+    """Number of directly linked children per QID; cached edges are used where fresh."""
+    store = store or get_store()
+    counts: Dict[str, int] = {}
+    todo: List[str] = []
+    for qid in dict.fromkeys(qids):
+        cached = store.cached_children(qid)
+        if cached is None:
+            todo.append(qid)
+        else:
+            counts[qid] = len({c for c, prop in cached if prop in DIRECT_CHILD_PROPS})
+
+    cached_count = len(counts)
+    if todo and not store.offline:
+        for i in range(0, len(todo), _COUNT_BATCH):
+            query = CHILD_COUNT_TEMPLATE.format(
+                qids=" ".join(f"wd:{q}" for q in todo[i:i + _COUNT_BATCH])
+            )
+            for b in execute_sparql_bindings(query):
+                counts[b["u"]["value"].rsplit("/", 1)[-1]] = int(b["n"]["value"])
+    logger.info("child counts: %d cached, %d queried", cached_count, len(todo))
+    for qid in todo:
+        counts.setdefault(qid, 0)
+    return counts
+
+
+def load_reports(reports_dir: Path | None = None) -> Dict[str, Dict[str, Any]]:
+    """QA reports written by discover_missing, keyed by university QID."""
+    reports: Dict[str, Dict[str, Any]] = {}
+    for path in (reports_dir or REPORTS_DIR).glob("*_report.json"):
+        try:
+            report = json.loads(path.read_text())
+        except ValueError:
+            logger.warning("skipping unreadable report %s", path)
+            continue
+        if "university_qid" in report:
+            reports[report["university_qid"]] = report
+    return reports
+
+
+def expected_units(reports: Dict[str, Dict[str, Any]]) -> float:
+    """Mean number of units the LLM proposed per university in past runs."""
+    sizes = [r["total_candidates"] for r in reports.values() if r.get("total_candidates")]
+    return sum(sizes) / len(sizes) if sizes else _DEFAULT_EXPECTED_UNITS
+
+
+def yield_score(
+    children: int,
+    expected: float,
+    record: Optional[Dict[str, Any]] = None,
+    report: Optional[Dict[str, Any]] = None,
+) -> float:
+    """Estimated missing units for one university (higher is better)."""
+    # +1: even a complete list can surface orphans and renamed units
+    score = max(expected - children, 0.0) + 1.0
+    if record is not None:
+        score *= _WEBSITE_FACTOR if record.get("website") else _NO_WEBSITE_FACTOR
+        if not record.get("label") or record["label"] == record["qid"]:
+            score *= _NO_LABEL_FACTOR
+    if report is not None:
+        score *= _REPORTED_FACTOR
+    return score
+
+
+def rank_universities(
+    qids: Iterable[str],
+    records: Optional[Dict[str, Dict[str, Any]]] = None,
+    store: EntityStore | None = None,
+    harvest: HarvestStore | None = None,
+    reports_dir: Path | None = None,
+) -> List[Dict[str, Any]]:
+    """
+    Score qids and return them best first as {"qid", "score", "children",
+    "website", "reported"} dicts. records are harvest rows by QID (e.g.
+    from a harvest file); otherwise the harvest store is consulted if it
+    exists. Ties keep the input order.
+    """
+    qids = list(dict.fromkeys(qids))
+    records = records or {}
+    harvest = harvest if harvest is not None else get_harvest_store()
+    reports = load_reports(reports_dir)
+    expected = expected_units(reports)
+    counts = count_children(qids, store)
+
+    ranked = []
+    for qid in qids:
+        record = records.get(qid) or (harvest.lookup(qid) if harvest else None)
+        report = reports.get(qid)
+        ranked.append({
+            "qid": qid,
+            "score": round(yield_score(counts[qid], expected, record, report), 3),
+            "children": counts[qid],
+            "website": record.get("website") if record else None,
+            "reported": report is not None,
+        })
+    ranked.sort(key=lambda r: -r["score"])
+    logger.info(
+        "ranked %d universities (expected %.1f units each, %d already reported)",
+        len(ranked), expected, sum(r["reported"] for r in ranked),
+    )
+    return ranked
@@ -0,0 +1,399 @@
+"""
+Recursive discovery: university -> schools -> departments -> programs.
+
+Every unit still to expand is a node on a priority frontier, shallowest
+first and units that exist in Wikidata before newly found ones. A pool of
+workers expands nodes -- one extraction for the unit's sub-units, then the
+usual matching against its Wikidata children -- under one budget for the
+whole run: depth, LLM calls, tokens and wall time.
+
+When a node is popped, the Wikidata state (label, website, direct children
+and their aliases) of every queued node that lacks one is loaded with
+prefetch_universities(), so each level costs a few batched calls and the
+children found at one level become the matching context of the next.
+
+The tree is checkpointed to results/recursive/<QID>.json after every
+expansion. A rerun with the same root picks up pending and failed nodes,
+and a larger depth continues from the leaves of the previous run.
+"""
+
+import contextvars
+import csv
+import heapq
+import json
+import logging
+import time
+from contextlib import contextmanager
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import wikidata_discover.config as config
+from wikidata_discover.config import console
+from wikidata_discover.discovery import RESULTS_DIR, Discovery, prefetch_universities
+from wikidata_discover.entity_store import EntityStore, get_store
+from wikidata_discover.llm_helpers import LLMHelper, summarize_usage, usage_scope
+
+logger = logging.getLogger(__name__)
+
+STATE_DIR = RESULTS_DIR / "recursive"
+
+# node states; only "pending" nodes are on the frontier
+PENDING, DONE, LEAF, DUPLICATE, FAILED = "pending", "done", "leaf", "duplicate", "failed"
+
+
+@dataclass
+class RecursionBudget:
+    """Limits for one discover run (recursive, or a batch of QIDs); None means unlimited."""
+
+    max_depth: int = 1
+    max_llm_calls: Optional[int] = None
+    max_tokens: Optional[int] = None  # input + output, all providers
+    deadline: Optional[float] = None  # seconds of wall time
+
+    _started: float = field(default=0.0, init=False, repr=False)
+    _usage: List[Dict[str, Any]] = field(default_factory=list, init=False, repr=False)
+
+    @classmethod
+    def from_config(cls, **overrides) -> "RecursionBudget":
+        settings = dict(
+            max_llm_calls=config.RECURSIVE_MAX_LLM_CALLS,
+            max_tokens=config.RECURSIVE_MAX_TOKENS,
+            deadline=config.RECURSIVE_DEADLINE,
+        )
+        settings.update({k: v for k, v in overrides.items() if v is not None})
+        return cls(**settings)
+
+    @contextmanager
+    def running(self) -> Iterator["RecursionBudget"]:
+        """Start the clock and count the LLM calls made inside the block."""
+        self._started = time.monotonic()
+        with usage_scope() as self._usage:
+            yield self
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self._started
+
+    def usage(self) -> Dict[str, int]:
+        """Provider calls and tokens inside running() (cache hits cost nothing)."""
+        records = self._usage
+        return {
+            "llm_calls": len(records),
+            "tokens": sum(r["input_tokens"] + r["output_tokens"] for r in records),
+        }
+
+    def exhausted(self) -> Optional[str]:
+        """Name of the first limit reached, or None."""
+        if self.deadline is not None and self.elapsed() >= self.deadline:
+            return "deadline"
+        used = self.usage()
+        if self.max_llm_calls is not None and used["llm_calls"] >= self.max_llm_calls:
+            return "llm_calls"
+        if self.max_tokens is not None and used["tokens"] >= self.max_tokens:
+            return "tokens"
+        return None
+
+
+class RecursiveDiscovery:
+    """
+    Expand a university's unit tree level by level. Limits are checked
+    before each expansion is started, so a run may overshoot the LLM and
+    token limits by the expansions already in flight (at most `workers`).
+    """
+
+    def __init__(
+        self,
+        root_qid: str,
+        budget: RecursionBudget | None = None,
+        workers: Optional[int] = None,
+        store: EntityStore | None = None,
+        state_path: Path | str | None = None,
+    ):
+        self.root_qid = root_qid
+        self.budget = budget or RecursionBudget.from_config()
+        self.workers = workers or config.RECURSIVE_WORKERS
+        self.store = store or get_store()
+        self.state_path = Path(state_path) if state_path else STATE_DIR / f"{root_qid}.json"
+        self.nodes: Dict[str, Dict[str, Any]] = {}
+        self.match_stats: Dict[str, int] = {}
+        self.stopped: Optional[str] = None
+        self._frontier: List[Tuple[Tuple[int, int, int], str]] = []
+        self._states: Dict[str, Optional[Dict[str, Any]]] = {}
+        self._seen_qids: set[str] = set()
+        self._load()
+
+    # ── tree state ──
+
+    def _load(self) -> None:
+        data = json.loads(self.state_path.read_text()) if self.state_path.exists() else {}
+        if data.get("root") != self.root_qid:
+            self.nodes = {}
+            self._add(None, {"name": self.root_qid, "qid": self.root_qid, "status": "root"})
+            return
+        self.nodes = data["nodes"]
+        self.match_stats = data.get("match_stats", {})
+        for node in self.nodes.values():
+            if node["qid"] and node["state"] != DUPLICATE:
+                self._seen_qids.add(node["qid"])
+            if node["state"] in (FAILED, LEAF, PENDING):
+                node["state"] = PENDING if node["depth"] < self.budget.max_depth else LEAF
+            if node["state"] == PENDING:
+                self._push(node)
+        logger.info(
+            "%s: resuming %d nodes, %d pending", self.root_qid, len(self.nodes), len(self._frontier)
+        )
+
+    def _save(self) -> None:
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.state_path.with_name(self.state_path.name + ".tmp")
+        tmp.write_text(json.dumps({
+            "root": self.root_qid,
+            "max_depth": self.budget.max_depth,
+            "match_stats": self.match_stats,
+            "nodes": self.nodes,
+        }))
+        tmp.replace(self.state_path)
+
+    def _push(self, node: Dict[str, Any]) -> None:
+        # shallow levels first, then units that already exist in Wikidata
+        key = (node["depth"], 0 if node["qid"] else 1, node["seq"])
+        heapq.heappush(self._frontier, (key, node["id"]))
+
+    def _add(self, parent: Optional[Dict[str, Any]], unit: Dict[str, Any]) -> Dict[str, Any]:
+        depth = parent["depth"] + 1 if parent else 0
+        qid = unit.get("qid")
+        node_id = f"{parent['id']}/{qid or unit['name']}" if parent else self.root_qid
+        while node_id in self.nodes:  # the same name extracted twice
+            node_id += "'"
+        node = {
+            "id": node_id,
+            "seq": len(self.nodes),
+            "parent": parent["id"] if parent else None,
+            "depth": depth,
+            "name": unit["name"],
+            "qid": qid,
+            "label": unit.get("label"),
+            "status": unit["status"],
+            "unit_type": unit.get("unit_type"),
+            "website": unit.get("website"),
+            "children": [],
+        }
+        if qid and qid in self._seen_qids:
+            node["state"] = DUPLICATE  # cross-listed: expanded under another parent
+        elif depth >= self.budget.max_depth:
+            node["state"] = LEAF
+        else:
+            node["state"] = PENDING
+        if qid:
+            self._seen_qids.add(qid)
+        self.nodes[node_id] = node
+        if parent:
+            parent["children"].append(node_id)
+        if node["state"] == PENDING:
+            self._push(node)
+        return node
+
+    def _path(self, node: Dict[str, Any]) -> List[str]:
+        """Labels of the units above node, outermost first."""
+        labels = []
+        while node["parent"]:
+            node = self.nodes[node["parent"]]
+            labels.append(node["label"] or node["name"])
+        return labels[::-1]
+
+    # ── expansion ──
+
+    def _load_level(self, node: Dict[str, Any]) -> None:
+        """Prefetch Wikidata state for node and every queued node still missing one."""
+        qids = [node["qid"]] + [
+            self.nodes[i]["qid"] for _, i in self._frontier
+            if self.nodes[i]["qid"] and self.nodes[i]["qid"] not in self._states
+        ]
+        states = prefetch_universities(qids, self.store)
+        for qid in qids:
+            self._states[qid] = states.get(qid)
+
+    def _expand(
+        self, node: Dict[str, Any], state: Optional[Dict[str, Any]], parent_path: List[str]
+    ) -> Tuple[List[Dict[str, Any]], Dict[str, int]]:
+        """Extract node's sub-units and match them; runs on a worker thread."""
+        stats: Dict[str, int] = {}
+        if node["qid"] and state is None:
+            raise ValueError(f"Info not found for {node['qid']}")
+        label = state["label"] if state else node["name"]
+        website = (state["website"] if state else None) or node["website"]
+        units = LLMHelper.extract_divisions_best_available(
+            label, website, " > ".join(parent_path) or None
+        )
+        if not node["qid"]:
+            # a unit missing from Wikidata has nothing to match against yet
+            rows = [
+                {"name": u.get("name") or u.get("unit"), "division": u,
+                 "status": "missing", "qid": None, "label": None}
+                for u in units if u.get("name") or u.get("unit")
+            ]
+            return rows, {"candidates": len(units)}
+        disc = Discovery(node["qid"], store=self.store, preloaded=state)
+        return disc.match_divisions(units, stats), stats
+
+    def _record(self, node: Dict[str, Any], rows: List[Dict[str, Any]], stats: Dict[str, int]) -> None:
+        for row in rows:
+            division = row["division"]
+            self._add(node, {
+                "name": row["name"],
+                "qid": row["qid"],
+                "label": row["label"],
+                "status": row["status"],
+                "unit_type": division.get("unit_type"),
+                "website": division.get("website"),
+            })
+        for k, v in stats.items():
+            self.match_stats[k] = self.match_stats.get(k, 0) + v
+        node["state"] = DONE
+
+    def run(self) -> Dict[str, Any]:
+        """Expand pending nodes until the frontier is empty or a limit is hit."""
+        with self.budget.running():
+            self._run()
+        self._save()
+        return self.summary()
+
+    def _run(self) -> None:
+        inflight = {}
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="recurse") as pool:
+            while True:
+                while self._frontier and len(inflight) < self.workers:
+                    self.stopped = self.budget.exhausted()
+                    if self.stopped:
+                        break
+                    _, node_id = heapq.heappop(self._frontier)
+                    node = self.nodes[node_id]
+                    if node["qid"] and node["qid"] not in self._states:
+                        self._load_level(node)
+                    state = self._states.get(node["qid"]) if node["qid"] else None
+                    if state and not node["label"]:
+                        node["label"] = state["label"]
+                    # a copy of the context, so the budget sees the worker's LLM calls
+                    inflight[pool.submit(
+                        contextvars.copy_context().run, self._expand, node, state, self._path(node)
+                    )] = node
+                if not inflight:
+                    break
+                done, _ = wait(inflight, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    node = inflight.pop(fut)
+                    try:
+                        rows, stats = fut.result()
+                    except Exception as e:
+                        logger.error("expanding %s (%s) failed: %s", node["name"], node["id"], e)
+                        node["state"] = FAILED
+                        continue
+                    self._record(node, rows, stats)
+                self._save()
+
+    # ── output ──
+
+    def summary(self) -> Dict[str, Any]:
+        by_depth: Dict[int, Dict[str, int]] = {}
+        for node in self.nodes.values():
+            if node["depth"]:
+                row = by_depth.setdefault(node["depth"], {"linked": 0, "orphan": 0, "missing": 0})
+                row[node["status"]] += 1
+        states: Dict[str, int] = {}
+        for node in self.nodes.values():
+            states[node["state"]] = states.get(node["state"], 0) + 1
+        return {
+            "root": self.root_qid,
+            "max_depth": self.budget.max_depth,
+            "nodes": len(self.nodes),
+            "states": states,
+            "by_depth": {str(d): by_depth[d] for d in sorted(by_depth)},
+            "stopped": self.stopped,
+            "seconds": round(self.budget.elapsed(), 2),
+            "usage": self.budget.usage(),
+            "llm_usage": summarize_usage(self.budget._usage),
+            "match_stats": self.match_stats,
+        }
+
+    def tree(self, node_id: Optional[str] = None) -> Dict[str, Any]:
+        """Nested {name, qid, status, unit_type, children} view of the tree."""
+        node = self.nodes[node_id or self.root_qid]
+        return {
+            "name": node["label"] or node["name"],
+            "qid": node["qid"],
+            "status": node["status"],
+            "unit_type": node["unit_type"],
+            "children": [self.tree(c) for c in node["children"]],
+        }
+
+    def missing_rows(self) -> List[Dict[str, Any]]:
+        """Missing and orphaned units with their parent, shallowest first."""
+        rows = []
+        for node in sorted(self.nodes.values(), key=lambda n: (n["depth"], n["seq"])):
+            if node["status"] not in ("missing", "orphan"):
+                continue
+            parent = self.nodes[node["parent"]]
+            rows.append({
+                "name": node["name"],
+                "status": node["status"],
+                "qid": node["qid"] or "",
+                "unit_type": node["unit_type"] or "",
+                "url": node["website"] or "",
+                "depth": node["depth"],
+                "parent_qid": parent["qid"] or "",
+                "parent_name": parent["label"] or parent["name"],
+                "path": " > ".join(self._path(node)),
+            })
+        return rows
+
+    def write_outputs(self) -> Tuple[Path, Optional[Path]]:
+        """Write the tree report and, if anything is missing, a CSV of it."""
+        reports_dir = RESULTS_DIR / "reports"
+        reports_dir.mkdir(parents=True, exist_ok=True)
+        report_path = reports_dir / f"{self.root_qid}_tree.json"
+        report_path.write_text(json.dumps({**self.summary(), "tree": self.tree()}, indent=2))
+
+        rows = self.missing_rows()
+        if not rows:
+            return report_path, None
+        csv_path = Path(f"missing_divisions_{self.root_qid}_tree.csv")
+        with open(csv_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
+        return report_path, csv_path
+
+
+def discover_recursive(
+    root_qid: str,
+    budget: RecursionBudget | None = None,
+    workers: Optional[int] = None,
+) -> Dict[str, Any]:
+    """Run (or resume) a recursive discovery for one university and write its outputs."""
+    from rich.table import Table
+
+    run = RecursiveDiscovery(root_qid, budget=budget, workers=workers)
+    summary = run.run()
+    report_path, csv_path = run.write_outputs()
+
+    root = run.nodes[root_qid]
+    console.print(
+        f"[bold blue]University:[/bold blue] {root['label'] or root_qid} ({root_qid})"
+    )
+    table = Table(show_header=True, header_style="bold magenta")
+    for col in ("Depth", "Linked", "Orphan", "Missing"):
+        table.add_column(col)
+    for depth, row in summary["by_depth"].items():
+        table.add_row(depth, str(row["linked"]), str(row["orphan"]), str(row["missing"]))
+    console.print(table)
+    pending = summary["states"].get(PENDING, 0)
+    if summary["stopped"]:
+        console.print(
+            f"[yellow]Stopped at the {summary['stopped']} limit with {pending} units "
+            f"left to expand; rerun to resume from {run.state_path}[/yellow]"
+        )
+    if csv_path:
+        console.print(f"[green]Missing and orphaned units written to {csv_path}.[/green]")
+    console.print(f"[dim]Tree report written to {report_path}[/dim]")
+    return summary
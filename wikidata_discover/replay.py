@@ -0,0 +1,441 @@
+"""
+Record and replay every external response of a discover run.
+
+    discover Q49210 --record snapshots/nyu    # live run, responses saved
+    discover Q49210 --replay snapshots/nyu    # same run offline, in seconds
+
+While recording, each Wikidata search, wbgetentities batch, SPARQL query
+and LLM call is saved under the directory as <kind>/<sha256>.json, keyed
+on the exact request (query text, IDs, prompt, model, ...). Replay serves
+those responses without touching the network or needing API keys, so a
+change to matching or reporting can be re-run against the same inputs.
+
+A request that was not recorded raises ReplayMissError instead of
+silently going live: a changed prompt or query shows up as a miss.
+
+The on-disk caches (entity store, search, LLM extraction, subclass
+closures, hierarchy snapshots) are moved to a fresh temporary directory
+for both modes, so a recording holds every request the run makes and a
+replay does not depend on the state of results/cache.
+"""
+
+import atexit
+import functools
+import hashlib
+import inspect
+import json
+import logging
+import shutil
+import tempfile
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import wikidata_discover.config as config
+
+logger = logging.getLogger(__name__)
+
+MANIFEST = "manifest.json"
+
+# provider -> (key setting, model setting) in config and llm_helpers
+_PROVIDERS = {
+    "openai": ("OPENAI_API_KEY", "LLM_MODEL"),
+    "anthropic": ("ANTHROPIC_API_KEY", "ANTHROPIC_MODEL"),
+    "gemini": ("GOOGLE_API_KEY", "GEMINI_MODEL"),
+}
+
+
+class ReplayMissError(BaseException):
+    """
+    A request was not in the recording. A BaseException, so that the
+    per-provider and per-attempt `except Exception` fallbacks of the
+    pipeline cannot turn a miss into an empty result.
+    """
+
+
+_active: Optional["Recorder"] = None
+
+
+def active() -> Optional["Recorder"]:
+    return _active
+
+
+def _canonical(value: Any) -> Any:
+    """JSON-able form of request arguments, including SDK objects such as genai Content."""
+    if hasattr(value, "model_dump"):
+        return value.model_dump(mode="json", exclude_none=True)
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    return repr(value)
+
+
+def _namespace(value: Any) -> Any:
+    if isinstance(value, dict):
+        return SimpleNamespace(**{k: _namespace(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return [_namespace(v) for v in value]
+    return value
+
+
+class Recorder:
+    """Saves responses to (record) or serves them from (replay) a directory."""
+
+    def __init__(self, directory: Path | str, replaying: bool = False):
+        self.directory = Path(directory)
+        self.replaying = replaying
+        self.stats: Counter = Counter()
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._served: Counter = Counter()
+        if replaying:
+            path = self.directory / MANIFEST
+            if not path.exists():
+                raise ValueError(f"{self.directory} is not a recording (no {MANIFEST})")
+            self.manifest = json.loads(path.read_text())
+        else:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self.manifest = {
+                "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "providers": {
+                    name: {
+                        "configured": bool(getattr(config, key)),
+                        "model": getattr(config, model),
+                    }
+                    for name, (key, model) in _PROVIDERS.items()
+                },
+            }
+            self._write_manifest()
+
+    def _write_manifest(self) -> None:
+        self.manifest["requests"] = dict(self.stats)
+        tmp = self.directory / f"{MANIFEST}.tmp"
+        tmp.write_text(json.dumps(self.manifest, indent=2))
+        tmp.replace(self.directory / MANIFEST)
+
+    @staticmethod
+    def _key(kind: str, request: Dict[str, Any]) -> str:
+        body = json.dumps(request, sort_keys=True, default=_canonical)
+        return hashlib.sha256(f"{kind}\n{body}".encode()).hexdigest()
+
+    def _path(self, kind: str, key: str) -> Path:
+        return self.directory / kind / f"{key}.json"
+
+    def _save(self, kind: str, request: Dict[str, Any], response: Any) -> None:
+        key = self._key(kind, request)
+        with self._lock:
+            entry = self._entries.setdefault(key, {"kind": kind, "request": request, "responses": []})
+            entry["responses"].append(response)
+            self.stats[kind] += 1
+            path = self._path(kind, key)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix(".tmp")
+            tmp.write_text(json.dumps(entry, default=_canonical))
+            tmp.replace(path)
+
+    def _load(self, kind: str, request: Dict[str, Any]) -> Any:
+        """The next recorded response to request; repeats of a request get later responses."""
+        key = self._key(kind, request)
+        path = self._path(kind, key)
+        if not path.exists():
+            raise ReplayMissError(
+                f"no recorded {kind} response in {self.directory} for "
+                f"{json.dumps(request, sort_keys=True, default=_canonical)[:300]}"
+            )
+        with self._lock:
+            responses = json.loads(path.read_text())["responses"]
+            index = min(self._served[key], len(responses) - 1)
+            self._served[key] += 1
+            self.stats[kind] += 1
+        return responses[index]
+
+    def call(
+        self, kind: str, request: Dict[str, Any], fetch: Callable[[], Any],
+        decode: Optional[Callable[[Any], Any]] = None,
+    ) -> Any:
+        if self.replaying:
+            response = self._load(kind, request)
+            return decode(response) if decode else response
+        response = fetch()
+        self._save(kind, request, response)
+        return response
+
+    def stream(
+        self, kind: str, request: Dict[str, Any], fetch: Callable[[], Iterator[Any]],
+        snapshot: Callable[[Any], Any] = lambda item: item,
+        decode: Callable[[Any], Any] = lambda item: item,
+    ) -> Iterator[Any]:
+        """Like call() for iterators. A stream is saved once the caller has read it to the end."""
+        if self.replaying:
+            for item in self._load(kind, request):
+                yield decode(item)
+            return
+        items: List[Any] = []
+        for item in fetch():
+            items.append(snapshot(item))
+            yield item
+        self._save(kind, request, items)
+
+    def client(self, provider: str, factory: Callable[[], Any]) -> "_ClientProxy":
+        if self.replaying and not self.manifest["providers"].get(provider, {}).get("configured"):
+            key = _PROVIDERS[provider][0]
+            raise ValueError(f"{key} was not set when {self.directory} was recorded")
+        return _ClientProxy(self, provider, factory)
+
+    def close(self) -> None:
+        if not self.replaying:
+            self._write_manifest()
+
+
+# ─────────────────────────  HOOKS  ─────────────────────────
+
+
+def recorded(kind: str, decode: Optional[Callable[[Any], Any]] = None):
+    """
+    Decorator for a function that talks to an external service. The
+    request key is the function's bound arguments. Put it above @retry so
+    a replay miss is not retried.
+    """
+    def wrap(fn):
+        signature = inspect.signature(fn)
+
+        def request_of(args, kwargs) -> Dict[str, Any]:
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            return dict(bound.arguments)
+
+        if inspect.isgeneratorfunction(fn):
+            @functools.wraps(fn)
+            def stream(*args, **kwargs):
+                if _active is None:
+                    yield from fn(*args, **kwargs)
+                    return
+                yield from _active.stream(kind, request_of(args, kwargs), lambda: fn(*args, **kwargs))
+            return stream
+
+        @functools.wraps(fn)
+        def call(*args, **kwargs):
+            if _active is None:
+                return fn(*args, **kwargs)
+            return _active.call(kind, request_of(args, kwargs), lambda: fn(*args, **kwargs), decode)
+        return call
+    return wrap
+
+
+def recorded_client(provider: str):
+    """Decorator for the LLM client getters: return a recording or replaying proxy when active."""
+    def wrap(getter):
+        @functools.wraps(getter)
+        def get():
+            if _active is None:
+                return getter()
+            return _active.client(provider, getter)
+        return get
+    return wrap
+
+
+# ─────────────────────────  LLM RESPONSES  ─────────────────────────
+# Only the fields the pipeline reads are kept: the text and the usage counts.
+
+
+def _fields(obj: Any, *names: str) -> Dict[str, Any]:
+    return {name: getattr(obj, name, None) for name in names}
+
+
+def _openai_response(resp: Any) -> Dict[str, Any]:
+    usage = getattr(resp, "usage", None)
+    return {
+        "output_text": getattr(resp, "output_text", None),
+        "output": [{}] if getattr(resp, "output", None) else [],
+        "usage": {
+            **_fields(usage, "input_tokens", "output_tokens"),
+            "input_tokens_details": _fields(getattr(usage, "input_tokens_details", None), "cached_tokens"),
+        },
+    }
+
+
+def _openai_event(event: Any) -> Dict[str, Any]:
+    snap = {"type": event.type, "delta": getattr(event, "delta", None)}
+    if event.type == "response.completed":
+        snap["response"] = _openai_response(event.response)
+    return snap
+
+
+def _anthropic_message(resp: Any) -> Dict[str, Any]:
+    return {
+        "content": [_fields(block, "type", "text") for block in getattr(resp, "content", None) or []],
+        "usage": _fields(
+            getattr(resp, "usage", None), "input_tokens", "output_tokens",
+            "cache_read_input_tokens", "cache_creation_input_tokens",
+        ),
+    }
+
+
+def _gemini_response(resp: Any) -> Dict[str, Any]:
+    return {
+        "text": getattr(resp, "text", None),
+        "usage_metadata": _fields(
+            getattr(resp, "usage_metadata", None), "prompt_token_count",
+            "candidates_token_count", "cached_content_token_count",
+        ),
+    }
+
+
+# method path -> snapshot of its response
+_RESPONSES = {
+    "responses.create": _openai_response,
+    "messages.create": _anthropic_message,
+    "models.generate_content": _gemini_response,
+}
+
+
+class _ClientProxy:
+    """Stands in for an SDK client; the real one is only built when recording."""
+
+    def __init__(self, recorder: Recorder, provider: str, factory: Callable[[], Any], path: tuple = ()):
+        self._recorder = recorder
+        self._provider = provider
+        self._factory = factory
+        self._path = path
+
+    def __getattr__(self, name: str) -> "_ClientProxy":
+        return _ClientProxy(self._recorder, self._provider, self._factory, self._path + (name,))
+
+    def __call__(self, **kwargs: Any) -> Any:
+        method = ".".join(self._path)
+        kind = f"llm_{self._provider}"
+        request = {"method": method, "kwargs": kwargs}
+
+        def real():
+            return functools.reduce(getattr, self._path, self._factory())
+
+        if method == "responses.create" and kwargs.get("stream"):
+            return self._recorder.stream(
+                kind, request, lambda: real()(**kwargs), _openai_event, _namespace
+            )
+        if method == "models.generate_content_stream":
+            return self._recorder.stream(
+                kind, request, lambda: real()(**kwargs), _gemini_response, _namespace
+            )
+        if method == "messages.stream":
+            return _AnthropicStream(self._recorder, kind, request, lambda: real()(**kwargs))
+        if method not in _RESPONSES:
+            raise NotImplementedError(f"{self._provider} {method} cannot be recorded")
+        snapshot = _RESPONSES[method]
+        if self._recorder.replaying:
+            return _namespace(self._recorder.call(kind, request, None))
+        resp = real()(**kwargs)
+        self._recorder._save(kind, request, snapshot(resp))
+        return resp
+
+
+class _AnthropicStream:
+    """messages.stream(...) context manager: text_stream and get_final_message()."""
+
+    def __init__(self, recorder: Recorder, kind: str, request: Dict[str, Any], open_stream):
+        self._recorder = recorder
+        self._kind = kind
+        self._request = request
+        self._open = open_stream
+        self._manager = None
+        self._stream = None
+        self._recorded: Optional[Dict[str, Any]] = None
+        self._chunks: List[str] = []
+        self._final: Optional[Dict[str, Any]] = None
+
+    def __enter__(self) -> "_AnthropicStream":
+        if self._recorder.replaying:
+            self._recorded = self._recorder.call(self._kind, self._request, None)
+        else:
+            self._manager = self._open()
+            self._stream = self._manager.__enter__()
+        return self
+
+    @property
+    def text_stream(self) -> Iterator[str]:
+        if self._recorded is not None:
+            yield from self._recorded["text"]
+            return
+        for text in self._stream.text_stream:
+            self._chunks.append(text)
+            yield text
+
+    def get_final_message(self) -> Any:
+        if self._recorded is not None:
+            return _namespace(self._recorded["final"])
+        message = self._stream.get_final_message()
+        self._final = _anthropic_message(message)
+        return message
+
+    def __exit__(self, *exc: Any) -> Any:
+        if self._manager is None:
+            return False
+        if exc[0] is None and self._final is not None:
+            self._recorder._save(self._kind, self._request, {"text": self._chunks, "final": self._final})
+        return self._manager.__exit__(*exc)
+
+
+# ─────────────────────────  ACTIVATION  ─────────────────────────
+
+
+def _isolate_caches(workdir: Path) -> Dict[tuple, Any]:
+    from wikidata_discover import crawl_policy, hierarchy, llm_helpers, wikidata_api
+
+    return {
+        (config, "ENTITY_STORE_PATH"): str(workdir / "entities.sqlite"),
+        (config, "HARVEST_STORE_PATH"): str(workdir / "universities.sqlite"),  # never created
+        (llm_helpers, "_CACHE_DIR"): workdir / "llm",
+        (wikidata_api, "_SEARCH_CACHE_DIR"): workdir / "wd_search",
+        (crawl_policy, "_CLOSURE_CACHE_DIR"): workdir / "subclass_closure",
+        (hierarchy, "SNAPSHOT_DIR"): workdir / "hierarchies",
+    }
+
+
+def _recorded_providers(manifest: Dict[str, Any]) -> Dict[tuple, Any]:
+    """The recorded providers look configured, with the recorded models, and no others."""
+    from wikidata_discover import hierarchy, llm_helpers
+
+    settings: Dict[tuple, Any] = {(hierarchy, "time_sleep"): 0}  # politeness delay between live queries
+    for name, (key, model) in _PROVIDERS.items():
+        recorded = manifest["providers"].get(name, {})
+        for module in (config, llm_helpers):
+            settings[(module, key)] = "replay" if recorded.get("configured") else None
+            if recorded.get("model"):
+                settings[(module, model)] = recorded["model"]
+    return settings
+
+
+_restore: Dict[tuple, Any] = {}
+
+
+def start(directory: Path | str, replaying: bool = False) -> Recorder:
+    """Record to, or replay from, directory until stop()."""
+    global _active
+    if _active is not None:
+        raise RuntimeError(f"already {'replaying' if _active.replaying else 'recording'} {_active.directory}")
+    recorder = Recorder(directory, replaying)
+    workdir = Path(tempfile.mkdtemp(prefix="wikidata-discover-replay-"))
+    atexit.register(shutil.rmtree, workdir, True)
+    settings = _isolate_caches(workdir)
+    if replaying:
+        settings.update(_recorded_providers(recorder.manifest))
+    for (module, name), value in settings.items():
+        _restore[(module, name)] = getattr(module, name)
+        setattr(module, name, value)
+    _active = recorder
+    logger.info("%s %s", "replaying" if replaying else "recording", recorder.directory)
+    return recorder
+
+
+def stop() -> Optional[Recorder]:
+    """End recording or replay and put the caches and provider settings back."""
+    global _active
+    recorder, _active = _active, None
+    for (module, name), value in _restore.items():
+        setattr(module, name, value)
+    _restore.clear()
+    if recorder is not None:
+        recorder.close()
+    return recorder
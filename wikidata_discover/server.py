@@ -0,0 +1,267 @@
+"""
+Long-lived discover service (`serve`).
+
+A CLI run pays for imports, LLM client construction and cold caches
+every time. The service does that once and then answers JSON requests
+over HTTP on localhost, or on a Unix socket:
+
+    GET  /health                                   -> uptime and request counts
+    POST /discover {"qid": "Q49210", "stream": false} -> missing units and QA report
+    POST /match    {"qid": "Q49210", "names": [...]}  -> match names against the children
+    POST /harvest  {"countries": ["Q30"] | null, "all": false, "out": "..."}  (out under results/)
+
+Each request runs on its own thread. Discovery objects, with their
+children, altLabels and TF-IDF index, are kept in an LRU for
+SERVE_CACHE_TTL seconds, so repeated lookups for one university never
+leave memory. Requests for the same university are serialized, since
+discover writes per-QID output files; each report counts only the LLM
+calls and crawl of its own request. Harvests run one at a time.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter, OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from socketserver import ThreadingMixIn, UnixStreamServer
+from typing import Any, Dict, Optional, Tuple
+
+import wikidata_discover.config as config
+from wikidata_discover.discovery import RESULTS_DIR, Discovery
+from wikidata_discover.entity_store import get_store
+from wikidata_discover.harvest_store import get_harvest_store
+
+logger = logging.getLogger(__name__)
+
+_MAX_BODY = 1 << 20  # bytes
+# per-university request locks, striped so their number stays fixed however
+# many QIDs a long-lived server sees; two QIDs on one stripe just take turns
+_QID_LOCK_STRIPES = 64
+
+
+class BadRequest(ValueError):
+    """The request body is not what the endpoint expects (HTTP 400)."""
+
+
+class DiscoverService:
+    """Warm state shared by all request threads."""
+
+    def __init__(self, max_cached: int = 256, ttl: Optional[float] = None):
+        self.max_cached = max_cached
+        self.ttl = config.SERVE_CACHE_TTL if ttl is None else ttl
+        self.started = time.time()
+        self.requests: Counter = Counter()
+        self._discoveries: "OrderedDict[str, Tuple[float, Discovery]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._qid_locks = [threading.Lock() for _ in range(_QID_LOCK_STRIPES)]
+        self._harvest_lock = threading.Lock()
+
+    def warm_up(self) -> None:
+        """Open the stores and create the LLM clients of every configured provider."""
+        from wikidata_discover import llm_helpers
+
+        get_store()
+        get_harvest_store()
+        for key, factory in (
+            (config.OPENAI_API_KEY, llm_helpers._get_openai_client),
+            (config.ANTHROPIC_API_KEY, llm_helpers._get_anthropic_client),
+            (config.GOOGLE_API_KEY, llm_helpers._get_gemini_client),
+        ):
+            if key:
+                try:
+                    factory()
+                except Exception as e:  # a missing SDK only disables that provider
+                    logger.warning("could not create %s: %s", factory.__name__, e)
+
+    def count(self, key: str) -> None:
+        with self._lock:
+            self.requests[key] += 1
+
+    def _qid_lock(self, qid: str) -> threading.Lock:
+        return self._qid_locks[hash(qid) % len(self._qid_locks)]
+
+    def discovery(self, qid: str) -> Discovery:
+        """Cached Discovery for qid, rebuilt after ttl seconds."""
+        now = time.time()
+        with self._lock:
+            hit = self._discoveries.get(qid)
+            if hit and now - hit[0] < self.ttl:
+                self._discoveries.move_to_end(qid)
+                self.requests["cache_hits"] += 1
+                return hit[1]
+        # built outside the lock: the first lookup may query Wikidata
+        disc = Discovery(qid)
+        with self._lock:
+            self._discoveries[qid] = (now, disc)
+            self._discoveries.move_to_end(qid)
+            while len(self._discoveries) > self.max_cached:
+                self._discoveries.popitem(last=False)
+        return disc
+
+    @staticmethod
+    def _qid(body: Dict[str, Any]) -> str:
+        qid = body.get("qid")
+        if not isinstance(qid, str) or not qid.startswith("Q"):
+            raise BadRequest("expected a 'qid' such as \"Q49210\"")
+        return qid
+
+    def health(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "status": "ok",
+                "uptime_s": round(time.time() - self.started, 1),
+                "requests": dict(self.requests),
+                "cached_universities": len(self._discoveries),
+            }
+
+    def discover(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        qid = self._qid(body)
+        with self._qid_lock(qid):
+            disc = self.discovery(qid)
+            missing, report = disc.discover_missing(stream=bool(body.get("stream")))
+        return {"qid": qid, "label": disc.university_label, "missing": missing, "report": report}
+
+    def match(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        qid = self._qid(body)
+        names = body.get("names")
+        if not isinstance(names, list) or not all(isinstance(n, str) for n in names):
+            raise BadRequest("expected 'names' to be a list of strings")
+        stats: Dict[str, int] = {}
+        with self._qid_lock(qid):
+            rows = self.discovery(qid).match_divisions([{"name": n} for n in names], stats)
+        return {
+            "qid": qid,
+            "matches": [{k: r[k] for k in ("name", "status", "qid", "label")} for r in rows],
+            "match_stats": stats,
+        }
+
+    def harvest(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        from wikidata_discover.harvester import fetch_us_universities, harvest_countries
+
+        countries = body.get("countries")
+        everything = bool(countries or body.get("all"))
+        default = "universities.ndjson" if everything else "universities_us.ndjson"
+        out = self._harvest_path(body.get("out") or default)
+        with self._harvest_lock:
+            if everything:
+                stats = harvest_countries(None if body.get("all") else countries, out)
+            else:
+                stats = fetch_us_universities(out)
+        return {"out": str(out), **stats}
+
+    @staticmethod
+    def _harvest_path(out: Any) -> Path:
+        """out resolved inside RESULTS_DIR; clients cannot write anywhere else."""
+        if not isinstance(out, str):
+            raise BadRequest("expected 'out' to be a file name")
+        root = RESULTS_DIR.resolve()
+        path = (root / out).resolve()
+        if not path.is_relative_to(root) or path == root:
+            raise BadRequest(f"'out' must be a file under {root}")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        return path
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive for scripted clients
+    server_version = "wikidata-discover"
+
+    @property
+    def service(self) -> DiscoverService:
+        return self.server.service
+
+    def address_string(self) -> str:
+        return str(self.client_address[0]) if self.client_address else "unix"
+
+    def log_message(self, format: str, *args: Any) -> None:
+        logger.info("%s %s", self.address_string(), format % args)
+
+    def _send(self, status: int, payload: Dict[str, Any]) -> None:
+        data = json.dumps(payload, default=str).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self) -> None:
+        if self.path == "/health":
+            self._send(200, self.service.health())
+        else:
+            self._send(404, {"error": f"unknown endpoint {self.path}"})
+
+    def do_POST(self) -> None:
+        routes = {
+            "/discover": self.service.discover,
+            "/match": self.service.match,
+            "/harvest": self.service.harvest,
+        }
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > _MAX_BODY:
+            self.close_connection = True
+            self._send(413, {"error": "request body too large"})
+            return
+        raw = self.rfile.read(length)
+        handler = routes.get(self.path)
+        if handler is None:
+            self._send(404, {"error": f"unknown endpoint {self.path}"})
+            return
+        self.service.count(self.path.lstrip("/"))
+        try:
+            body = json.loads(raw or b"{}")
+            if not isinstance(body, dict):
+                raise BadRequest("expected a JSON object")
+            self._send(200, handler(body))
+        except (json.JSONDecodeError, BadRequest) as e:
+            self._send(400, {"error": str(e)})
+        except ValueError as e:  # unknown QID, no LLM provider configured, ...
+            self._send(422, {"error": str(e)})
+        except Exception as e:
+            logger.exception("%s failed", self.path)
+            self._send(500, {"error": f"{type(e).__name__}: {e}"})
+
+
+class _ThreadingUnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+    def get_request(self):
+        conn, _ = super().get_request()
+        return conn, ("unix", 0)
+
+
+def make_server(
+    service: DiscoverService,
+    host: str = "127.0.0.1",
+    port: int = 8765,
+    socket_path: Optional[str] = None,
+):
+    """HTTP server bound to host:port, or to a Unix socket if socket_path is given."""
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)  # left behind by a previous run
+        server = _ThreadingUnixHTTPServer(socket_path, _Handler)
+    else:
+        server = ThreadingHTTPServer((host, port), _Handler)
+        server.daemon_threads = True
+    server.service = service
+    return server
+
+
+def serve(host: str = "127.0.0.1", port: int = 8765, socket_path: Optional[str] = None) -> None:
+    """Warm up, then answer requests until interrupted."""
+    service = DiscoverService()
+    service.warm_up()
+    server = make_server(service, host, port, socket_path)
+    where = socket_path or "http://%s:%d" % server.server_address[:2]
+    print(f"Serving discover on {where} (Ctrl-C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if socket_path and os.path.exists(socket_path):
+            os.unlink(socket_path)
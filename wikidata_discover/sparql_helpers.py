@@ -1,19 +1,34 @@
+import csv
 import logging
-from SPARQLWrapper import SPARQLWrapper, JSON, SPARQLExceptions
+from typing import Dict, Iterator
+
+import requests
 from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
 from wikidata_discover.config import SPARQL_ENDPOINT, USER_AGENT
+from wikidata_discover.replay import recorded
+from wikidata_discover.wikidata_api import RateLimiter
 
 logger = logging.getLogger(__name__)
 
+# every WDQS query (hierarchy edges, ancestry checks, streamed harvest
+# shards) takes a token from one budget; WDQS allows a handful of parallel
+# queries per client. share_rate_limits() swaps in a cross-worker bucket.
+_SPARQL_RATE = 2.0   # queries per second
+_SPARQL_BURST = 5
+sparql_limiter = RateLimiter(_SPARQL_RATE, _SPARQL_BURST)
+_session = requests.Session()  # keep-alive for streamed queries
+
+
+class QueryTimeout(Exception):
+    """WDQS gave up on a query (its 60 s limit); callers may split it."""
 
+
+@recorded("sparql")
 @retry(
     stop=stop_after_attempt(3),
     wait=wait_exponential(multiplier=1, min=2, max=30),
-    retry=retry_if_exception_type((
-        SPARQLExceptions.EndPointInternalError,
-        SPARQLExceptions.EndPointNotFound,
-        Exception,
-    )),
+    # any failure, including SPARQLWrapper's EndPointInternalError / EndPointNotFound
+    retry=retry_if_exception_type(Exception),
     before_sleep=lambda rs: logger.warning(
         "SPARQL retry #%d after %s", rs.attempt_number, rs.outcome.exception()
     ),
@@ -23,6 +38,9 @@ def execute_sparql_bindings(query: str) -> list[dict]:
     Run any SPARQL query and return the full list of result bindings
     (the raw JSON objects) so callers can pull out whatever fields they need.
     """
+    from SPARQLWrapper import JSON, SPARQLWrapper
+
+    sparql_limiter.acquire()
     wrapper = SPARQLWrapper(SPARQL_ENDPOINT, agent=USER_AGENT)
     wrapper.setQuery(query)
     wrapper.setReturnFormat(JSON)
@@ -30,6 +48,59 @@ def execute_sparql_bindings(query: str) -> list[dict]:
     return resp["results"]["bindings"]
 
 
+def _is_timeout(resp: requests.Response) -> bool:
+    """
+    WDQS reports its query timeout as a 500 with a Java TimeoutException,
+    but the proxy in front of it answers 504 (or another 5xx page that
+    mentions a timeout) when it gives up first.
+    """
+    if resp.status_code == 504:
+        return True
+    return resp.status_code >= 500 and "timeout" in resp.text.lower()
+
+
+@retry(
+    stop=stop_after_attempt(3),
+    wait=wait_exponential(multiplier=1, min=2, max=30),
+    retry=retry_if_exception_type((requests.RequestException,)),
+    before_sleep=lambda rs: logger.warning(
+        "SPARQL stream retry #%d after %s", rs.attempt_number, rs.outcome.exception()
+    ),
+)
+def _open_sparql_stream(query: str) -> requests.Response:
+    sparql_limiter.acquire()
+    resp = _session.post(
+        SPARQL_ENDPOINT,
+        data={"query": query},
+        headers={"Accept": "text/csv", "User-Agent": USER_AGENT},
+        stream=True,
+        timeout=(30, 300),
+    )
+    if _is_timeout(resp):
+        raise QueryTimeout(f"query timed out ({resp.status_code})")
+    resp.raise_for_status()
+    return resp
+
+
+@recorded("sparql_stream")
+def stream_sparql_rows(query: str) -> Iterator[Dict[str, str]]:
+    """
+    Run a SELECT query and yield one {variable: value} dict per result row
+    while the CSV response is still arriving, instead of parsing a full JSON
+    document in memory. Unbound variables come back as "". Only opening the
+    request is retried; a connection dropped mid-stream raises.
+    """
+    resp = _open_sparql_stream(query)
+    resp.encoding = "utf-8"
+    with resp:
+        reader = csv.reader(resp.iter_lines(decode_unicode=True))
+        header = next(reader, None)
+        if header is None:
+            return
+        for values in reader:
+            yield dict(zip(header, values))
+
+
 def run_sparql(query: str, as_tuples: bool = False,
                main_key: str = "univ", label_key: str = "univLabel"):
     """
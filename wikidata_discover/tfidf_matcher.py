@@ -0,0 +1,230 @@
+import logging
+import math
+from collections import Counter
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Scores at or above ACCEPT are taken as a match without asking the LLM;
+# scores below REJECT are treated as "no match". calibrate_thresholds() on the
+# fuzzy-match test pairs against the pilot school lists (eval/ground_truth.py)
+# gave accept=0.743 / reject=0.510. ACCEPT is rounded up from that; REJECT is
+# set well below it because a rejected name never reaches the LLM, so only
+# names that resemble nothing at all are dropped there.
+TFIDF_ACCEPT = 0.75
+TFIDF_REJECT = 0.25
+# A top hit above MARGIN_FLOOR that beats the runner-up by MARGIN is also
+# accepted, e.g. "Leonard N. Stern School of Business" -> "Stern School".
+# These two are hand-set, not calibrated, and need at least two children.
+TFIDF_MARGIN_FLOOR = 0.45
+TFIDF_MARGIN = 0.25
+
+# Words that name the kind of unit rather than the unit; ignored when checking
+# that an accepted child's name is contained in the query.
+_GENERIC_WORDS = frozenset({
+    "university", "college", "school", "faculty", "institute", "center", "centre",
+    "department", "division", "the", "of", "for", "and", "at", "by",
+})
+
+NGRAM_SIZE = 3
+
+
+def char_ngrams(text: str, n: int = NGRAM_SIZE) -> Counter:
+    """Count character n-grams of a (normalized) name, padded at word edges."""
+    grams: Counter = Counter()
+    for word in text.split():
+        padded = f" {word} "
+        if len(padded) <= n:
+            grams[padded] += 1
+            continue
+        for i in range(len(padded) - n + 1):
+            grams[padded[i:i + n]] += 1
+    return grams
+
+
+def _sparse_backend():
+    """Return scipy.sparse if installed; NumPy dense arrays are used otherwise."""
+    try:
+        from scipy import sparse
+        return sparse
+    except ImportError:
+        return None
+
+
+class TfidfMatcher:
+    """Char n-gram TF-IDF index over a university's children and their altLabels.
+
+    Each child contributes one row per name (label + altLabels); queries are
+    scored by cosine similarity and collapsed to the best row per QID.
+    """
+
+    def __init__(
+        self,
+        children: Sequence[Tuple[str, str]],
+        alt_labels: Optional[Dict[str, List[str]]] = None,
+        normalizer: Callable[[str], str] = str.lower,
+    ):
+        self.normalizer = normalizer
+        alt_labels = alt_labels or {}
+
+        self._owners: List[Tuple[str, str]] = []
+        self._names: Dict[str, List[str]] = {}
+        docs: List[Counter] = []
+        for qid, label in children:
+            for name in [label] + alt_labels.get(qid, []):
+                if not name:
+                    continue
+                grams = char_ngrams(normalizer(name))
+                if grams:
+                    self._owners.append((qid, label))
+                    self._names.setdefault(qid, []).append(name)
+                    docs.append(grams)
+
+        self.vocab: Dict[str, int] = {}
+        df: Counter = Counter()
+        for grams in docs:
+            df.update(grams.keys())
+            for g in grams:
+                self.vocab.setdefault(g, len(self.vocab))
+
+        n_docs = len(docs)
+        # smoothed idf; an unseen n-gram gets the idf of df=0
+        self._idf_oov = math.log((1 + n_docs) / 1) + 1.0
+        self.idf = np.empty(len(self.vocab), dtype=np.float64)
+        for g, col in self.vocab.items():
+            self.idf[col] = math.log((1 + n_docs) / (1 + df[g])) + 1.0
+
+        self._matrix = self._build_matrix(docs)
+
+    def __len__(self) -> int:
+        return len(self._owners)
+
+    def _weights(self, grams: Counter) -> Tuple[List[int], List[float], float]:
+        """Return (known columns, their weights, L2 norm over all n-grams)."""
+        cols, vals = [], []
+        sq = 0.0
+        for g, tf in grams.items():
+            col = self.vocab.get(g)
+            w = tf * (self.idf[col] if col is not None else self._idf_oov)
+            sq += w * w
+            if col is not None:
+                cols.append(col)
+                vals.append(w)
+        return cols, vals, math.sqrt(sq)
+
+    def _build_matrix(self, docs: List[Counter]):
+        rows, cols, vals = [], [], []
+        for i, grams in enumerate(docs):
+            c, v, norm = self._weights(grams)
+            rows.extend([i] * len(c))
+            cols.extend(c)
+            vals.extend(w / norm for w in v)
+
+        shape = (len(docs), len(self.vocab))
+        sparse = _sparse_backend()
+        if sparse is not None:
+            return sparse.csr_matrix((vals, (rows, cols)), shape=shape)
+        dense = np.zeros(shape, dtype=np.float64)
+        dense[rows, cols] = vals
+        return dense
+
+    def _query_vector(self, name: str) -> Optional[np.ndarray]:
+        cols, vals, norm = self._weights(char_ngrams(self.normalizer(name)))
+        if norm == 0.0:
+            return None
+        vec = np.zeros(len(self.vocab), dtype=np.float64)
+        vec[cols] = np.asarray(vals) / norm
+        return vec
+
+    def top_k(self, name: str, k: int = 5) -> List[Tuple[str, str, float]]:
+        """Return up to k (qid, label, cosine) tuples, best first, one per QID."""
+        if not self._owners:
+            return []
+        vec = self._query_vector(name)
+        if vec is None:
+            return []
+        scores = np.asarray(self._matrix @ vec).ravel()
+
+        best: Dict[str, Tuple[str, str, float]] = {}
+        for i in np.argsort(-scores):
+            qid, label = self._owners[i]
+            if qid not in best:
+                best[qid] = (qid, label, float(scores[i]))
+                if len(best) == k:
+                    break
+        return list(best.values())
+
+    def confident_match(self, name: str) -> Optional[Tuple[str, str, float]]:
+        """
+        Return the top child if it clears TFIDF_ACCEPT or wins by TFIDF_MARGIN
+        (only with a runner-up to beat), and every distinctive word of one of
+        its names appears in name. "School of Medicine" is not accepted as
+        "School of Veterinary Medicine" however close the n-grams are.
+        """
+        top = self.top_k(name, 2)
+        if not top:
+            return None
+        score = top[0][2]
+        by_margin = (
+            len(top) > 1 and score >= TFIDF_MARGIN_FLOOR and score - top[1][2] >= TFIDF_MARGIN
+        )
+        if (score >= TFIDF_ACCEPT or by_margin) and self._contained(top[0][0], name):
+            return top[0]
+        return None
+
+    def _words(self, name: str) -> set:
+        return {w.rstrip("s") for w in self.normalizer(name).split() if w not in _GENERIC_WORDS}
+
+    def _contained(self, qid: str, name: str) -> bool:
+        """Whether all distinctive words of one of qid's names occur in name."""
+        query = self._words(name)
+        return any(words and words <= query for words in map(self._words, self._names[qid]))
+
+    def similarity(self, a: str, b: str) -> float:
+        """Cosine similarity of two arbitrary names under this index's idf weights."""
+        wa = self._pair_weights(a)
+        wb = self._pair_weights(b)
+        if not wa or not wb:
+            return 0.0
+        dot = sum(w * wb.get(g, 0.0) for g, w in wa.items())
+        na = math.sqrt(sum(w * w for w in wa.values()))
+        nb = math.sqrt(sum(w * w for w in wb.values()))
+        return dot / (na * nb)
+
+    def _pair_weights(self, name: str) -> Dict[str, float]:
+        weights = {}
+        for g, tf in char_ngrams(self.normalizer(name)).items():
+            col = self.vocab.get(g)
+            weights[g] = tf * (self.idf[col] if col is not None else self._idf_oov)
+        return weights
+
+
+def calibrate_thresholds(
+    pairs: Iterable[Tuple[str, str, bool]],
+    corpus: Sequence[str],
+    normalizer: Callable[[str], str] = str.lower,
+) -> Tuple[float, float]:
+    """Pick (accept, reject) thresholds from labelled name pairs.
+
+    accept is the lowest score above every negative pair (no false accepts);
+    reject is the lowest score of any positive pair (no false rejects).
+    The idf weights come from ``corpus``, a representative list of unit names.
+    """
+    matcher = TfidfMatcher([(str(i), n) for i, n in enumerate(corpus)], normalizer=normalizer)
+    pos, neg = [], []
+    for a, b, same in pairs:
+        (pos if same else neg).append(matcher.similarity(a, b))
+    if not pos or not neg:
+        raise ValueError("calibration needs both positive and negative pairs")
+
+    accept = max(neg) + 1e-3
+    reject = min(pos)
+    if reject > accept:
+        reject = accept
+    logger.info(
+        "calibrate_thresholds: accept=%.3f reject=%.3f (%d pos, %d neg)",
+        accept, reject, len(pos), len(neg),
+    )
+    return accept, reject
@@ -1,16 +1,64 @@
+import hashlib
+import json
 import time
 import logging
+import threading
 import requests
-from typing import List, Tuple
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
 from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
-from .config import USER_AGENT
+from .config import USER_AGENT, WD_API_URL
+from .replay import recorded
 
 logger = logging.getLogger(__name__)
 
-# Polite pause between Wikidata API requests (matches SPARQL pause)
-_WD_API_DELAY = 0.3
+# Wikidata API request budget shared by all threads: a sustained rate with a
+# small burst, so a batch of searches goes out together instead of 0.3s apart
+_WD_API_RATE = 10.0      # requests per second
+_WD_API_BURST = 10
+_WD_API_MAX_WORKERS = 8
 
+# wbgetentities accepts at most 50 IDs per request for normal accounts
+_ENTITY_BATCH = 50
+# claims kept from wbgetentities responses (the API cannot filter them)
+ENTITY_CLAIM_PROPS = ("P31", "P361", "P749", "P856")
 
+_SEARCH_CACHE_DIR = Path(__file__).parent / "results" / "cache" / "wd_search"
+_SEARCH_CACHE_TTL = 7 * 24 * 3600  # seconds
+
+
+class RateLimiter:
+    """Thread-safe token bucket: acquire() blocks until a request may be sent."""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+_api_limiter = RateLimiter(_WD_API_RATE, _WD_API_BURST)
+
+# one keep-alive connection pool for all Wikidata API requests in the process
+_session = requests.Session()
+_session.mount("https://", requests.adapters.HTTPAdapter(pool_maxsize=_WD_API_MAX_WORKERS))
+
+
+@recorded("wbsearchentities", decode=lambda hits: [tuple(h) for h in hits])
 @retry(
     stop=stop_after_attempt(3),
     wait=wait_exponential(multiplier=1, min=2, max=30),
@@ -20,13 +68,189 @@ _WD_API_DELAY = 0.3
     ),
 )
 def quick_wd_search(label: str) -> List[Tuple[str, str]]:
-    time.sleep(_WD_API_DELAY)
+    _api_limiter.acquire()
     url = (
-        "https://www.wikidata.org/w/api.php?"
+        f"{WD_API_URL}?"
         "action=wbsearchentities&format=json&language=en&limit=10&search="
         + requests.utils.quote(label)
     )
-    resp = requests.get(url, headers={"User-Agent": USER_AGENT}, timeout=30)
+    resp = _session.get(url, headers={"User-Agent": USER_AGENT}, timeout=30)
     resp.raise_for_status()
     hits = resp.json().get("search", [])
     return [(h["id"], h["label"]) for h in hits]
+
+
+# ─────────────────────────  ENTITY FETCH  ─────────────────────────
+
+
+@recorded("wbgetentities")
+@retry(
+    stop=stop_after_attempt(3),
+    wait=wait_exponential(multiplier=1, min=2, max=30),
+    retry=retry_if_exception_type((requests.RequestException,)),
+    before_sleep=lambda rs: logger.warning(
+        "wbgetentities retry #%d after %s", rs.attempt_number, rs.outcome.exception()
+    ),
+)
+def _wbgetentities(ids: Sequence[str], props: str, languages: str) -> Dict[str, Any]:
+    _api_limiter.acquire()
+    resp = _session.get(
+        WD_API_URL,
+        params={
+            "action": "wbgetentities",
+            "format": "json",
+            "ids": "|".join(ids),
+            "props": props,
+            "languages": languages,
+        },
+        headers={"User-Agent": USER_AGENT},
+        timeout=60,
+    )
+    resp.raise_for_status()
+    data = resp.json()
+    if "error" in data:
+        raise ValueError(f"wbgetentities error: {data['error'].get('info', data['error'])}")
+    return data.get("entities", {})
+
+
+def _claim_value(claim: Dict[str, Any]) -> Optional[str]:
+    value = claim.get("mainsnak", {}).get("datavalue", {}).get("value")
+    if isinstance(value, dict):
+        return value.get("id")
+    return value
+
+
+def compact_entity(
+    entity: Dict[str, Any], language: str = "en", claim_props: Sequence[str] = ENTITY_CLAIM_PROPS
+) -> Dict[str, Any]:
+    """
+    Reduce a raw wbgetentities entity to what the pipeline uses: label (the
+    QID if there is no label, like the WDQS label service), aliases, the
+    values of claim_props, and lastrevid.
+    """
+    qid = entity["id"]
+    claims = {}
+    for prop in claim_props:
+        values = [_claim_value(c) for c in entity.get("claims", {}).get(prop, [])]
+        claims[prop] = [v for v in values if v is not None]
+    return {
+        "qid": qid,
+        "label": entity.get("labels", {}).get(language, {}).get("value") or qid,
+        "aliases": [a["value"] for a in entity.get("aliases", {}).get(language, [])],
+        "claims": claims,
+        "lastrevid": entity.get("lastrevid"),
+    }
+
+
+def get_entities(
+    qids: Iterable[str],
+    props: Sequence[str] = ("labels", "aliases", "claims"),
+    language: str = "en",
+    claim_props: Sequence[str] = ENTITY_CLAIM_PROPS,
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Resolve many QIDs with wbgetentities, 50 per request, running the
+    requests concurrently under the shared rate limiter. Returns
+    {qid: compact_entity(...)}; missing or deleted items are left out.
+    """
+    unique = list(dict.fromkeys(q for q in qids if q))
+    if not unique:
+        return {}
+    batches = [unique[i:i + _ENTITY_BATCH] for i in range(0, len(unique), _ENTITY_BATCH)]
+    prop_str = "|".join(props)
+
+    result: Dict[str, Dict[str, Any]] = {}
+    with ThreadPoolExecutor(max_workers=min(_WD_API_MAX_WORKERS, len(batches))) as pool:
+        for entities in pool.map(lambda b: _wbgetentities(b, prop_str, language), batches):
+            for qid, entity in entities.items():
+                if "missing" in entity:
+                    continue
+                result[qid] = compact_entity(entity, language, claim_props)
+    logger.debug("get_entities: %d of %d QIDs in %d requests", len(result), len(unique), len(batches))
+    return result
+
+
+def get_revisions(qids: Iterable[str]) -> Dict[str, int]:
+    """Current lastrevid of each QID (wbgetentities props=info, 50 per request)."""
+    entities = get_entities(qids, props=("info",), claim_props=())
+    return {qid: e["lastrevid"] for qid, e in entities.items()}
+
+
+# ─────────────────────────  SEARCH MEMO  ─────────────────────────
+
+_search_memo: Dict[str, List[Tuple[str, str]]] = {}
+_search_memo_lock = threading.Lock()
+
+
+def _search_cache_path(label: str) -> Path:
+    return _SEARCH_CACHE_DIR / f"{hashlib.sha256(label.encode()).hexdigest()}.json"
+
+
+def cached_wd_search(label: str) -> List[Tuple[str, str]]:
+    """quick_wd_search memoized in-process and on disk (results/cache/wd_search/)."""
+    with _search_memo_lock:
+        if label in _search_memo:
+            return _search_memo[label]
+
+    path = _search_cache_path(label)
+    hits: Optional[List[Tuple[str, str]]] = None
+    if path.exists() and time.time() - path.stat().st_mtime < _SEARCH_CACHE_TTL:
+        try:
+            hits = [tuple(h) for h in json.loads(path.read_text())]
+        except Exception:
+            hits = None
+
+    if hits is None:
+        hits = quick_wd_search(label)
+        _SEARCH_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(hits))
+
+    with _search_memo_lock:
+        _search_memo[label] = hits
+    return hits
+
+
+class SearchPrefetcher:
+    """Run wbsearchentities lookups for many labels concurrently.
+
+    Searches are submitted speculatively as soon as a label is known and
+    cancelled if the caller no longer needs them; result() waits for one.
+    All requests go through the shared rate limiter.
+    """
+
+    # close() lets searches already running finish in the background; set
+    # where nothing may outlive the caller (e.g. runs against the bench stubs)
+    wait_on_close = False
+
+    def __init__(self, max_workers: int = _WD_API_MAX_WORKERS):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="wd-search")
+        self._futures: Dict[str, Future] = {}
+        self.stats = {"submitted": 0, "cancelled": 0, "used": 0}
+
+    def submit(self, label: str) -> None:
+        if label not in self._futures:
+            self._futures[label] = self._pool.submit(cached_wd_search, label)
+            self.stats["submitted"] += 1
+
+    def cancel(self, label: str) -> bool:
+        """Cancel a search that has not started yet; a running one just finishes."""
+        fut = self._futures.get(label)
+        if fut is not None and fut.cancel():
+            del self._futures[label]
+            self.stats["cancelled"] += 1
+            return True
+        return False
+
+    def result(self, label: str) -> List[Tuple[str, str]]:
+        self.submit(label)
+        self.stats["used"] += 1
+        return self._futures[label].result()
+
+    def close(self) -> None:
+        self._pool.shutdown(wait=self.wait_on_close, cancel_futures=True)
+
+    def __enter__(self) -> "SearchPrefetcher":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
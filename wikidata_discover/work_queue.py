@@ -0,0 +1,324 @@
+"""
+Lease-based work queue for running discover in several processes or on
+several machines that share a filesystem.
+
+The queue is one SQLite file holding a row per university QID. A worker
+claims the best queued row (or one whose lease expired) inside a
+BEGIN IMMEDIATE transaction, so no two workers get the same QID, and
+keeps the lease alive with a heartbeat thread while discover runs. The
+result is written in the same UPDATE that marks the row done; a worker
+that lost its lease (it stalled past the expiry and someone else took
+over) cannot overwrite the new owner's state. Failed QIDs go back to the
+queue until they have been tried WORK_QUEUE_MAX_ATTEMPTS times.
+
+Workers also share their Wikidata rate limits through the same file
+(SharedRateLimiter), so adding workers adds throughput only until the
+WDQS / API budgets are used up instead of multiplying request rates.
+
+WAL journaling lets readers and the single writer proceed concurrently
+on one machine. WAL needs shared memory, so on a network filesystem set
+WORK_QUEUE_JOURNAL=delete to fall back to the rollback journal and plain
+file locks.
+"""
+
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Optional
+
+import wikidata_discover.config as config
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUEUE_PATH = Path(__file__).parent / "results" / "queue.sqlite"
+
+QUEUED, LEASED, DONE, FAILED = "queued", "leased", "done", "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    qid         TEXT PRIMARY KEY,
+    status      TEXT NOT NULL,
+    priority    REAL NOT NULL DEFAULT 0,
+    seq         INTEGER NOT NULL,
+    attempts    INTEGER NOT NULL DEFAULT 0,
+    worker      TEXT,
+    lease_until REAL,
+    result      TEXT,
+    error       TEXT,
+    updated     REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_by_priority ON jobs (status, priority DESC, seq);
+CREATE TABLE IF NOT EXISTS buckets (
+    name    TEXT PRIMARY KEY,
+    tokens  REAL NOT NULL,
+    updated REAL NOT NULL
+);
+"""
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class WorkQueue:
+    """University QIDs to discover, claimed by workers under expiring leases."""
+
+    def __init__(self, path: Path | str | None = None, max_attempts: Optional[int] = None):
+        self.path = Path(path or config.WORK_QUEUE_PATH or DEFAULT_QUEUE_PATH)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_attempts = max_attempts or config.WORK_QUEUE_MAX_ATTEMPTS
+        # autocommit mode: every transaction below is opened explicitly
+        self._conn = sqlite3.connect(
+            str(self.path), timeout=60, isolation_level=None, check_same_thread=False
+        )
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.RLock()
+        with self._lock:
+            self._conn.execute(f"PRAGMA journal_mode={config.WORK_QUEUE_JOURNAL}")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def _write(self, sql: str, params: tuple = ()) -> int:
+        """Run one statement in its own write transaction; returns rows changed."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                changed = self._conn.execute(sql, params).rowcount
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return changed
+
+    def enqueue(self, qids: Iterable[str], priorities: Optional[Dict[str, float]] = None) -> int:
+        """Add QIDs not already in the queue (in any state); returns how many were added."""
+        priorities = priorities or {}
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                seq = self._conn.execute("SELECT COALESCE(MAX(seq), 0) FROM jobs").fetchone()[0]
+                added = 0
+                for qid in dict.fromkeys(qids):
+                    seq += 1
+                    added += self._conn.execute(
+                        "INSERT OR IGNORE INTO jobs (qid, status, priority, seq, updated) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        (qid, QUEUED, priorities.get(qid, 0.0), seq, now),
+                    ).rowcount
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+        return added
+
+    def claim(self, worker: str, lease: float) -> Optional[str]:
+        """Lease the highest-priority available QID to worker, or None if there is none."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # an expired lease on the last attempt means the worker died on it
+                self._conn.execute(
+                    "UPDATE jobs SET status = ?, error = 'lease expired', updated = ? "
+                    "WHERE status = ? AND lease_until < ? AND attempts >= ?",
+                    (FAILED, now, LEASED, now, self.max_attempts),
+                )
+                row = self._conn.execute(
+                    "SELECT qid FROM jobs WHERE (status = ? OR (status = ? AND lease_until < ?)) "
+                    "AND attempts < ? ORDER BY priority DESC, seq LIMIT 1",
+                    (QUEUED, LEASED, now, self.max_attempts),
+                ).fetchone()
+                if row:
+                    self._conn.execute(
+                        "UPDATE jobs SET status = ?, worker = ?, lease_until = ?, "
+                        "attempts = attempts + 1, updated = ? WHERE qid = ?",
+                        (LEASED, worker, now + lease, now, row["qid"]),
+                    )
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+        return row["qid"] if row else None
+
+    def heartbeat(self, qid: str, worker: str, lease: float) -> bool:
+        """Extend worker's lease on qid; False if the lease was lost."""
+        now = time.time()
+        return self._write(
+            "UPDATE jobs SET lease_until = ?, updated = ? WHERE qid = ? AND worker = ? AND status = ?",
+            (now + lease, now, qid, worker, LEASED),
+        ) == 1
+
+    def complete(self, qid: str, worker: str, result: Dict[str, Any]) -> bool:
+        """Record result and mark qid done, if worker still holds the lease."""
+        return self._write(
+            "UPDATE jobs SET status = ?, result = ?, error = NULL, lease_until = NULL, updated = ? "
+            "WHERE qid = ? AND worker = ? AND status = ?",
+            (DONE, json.dumps(result), time.time(), qid, worker, LEASED),
+        ) == 1
+
+    def fail(self, qid: str, worker: str, error: str) -> bool:
+        """Give qid back to the queue, or mark it failed once its attempts are used up."""
+        return self._write(
+            "UPDATE jobs SET status = CASE WHEN attempts < ? THEN ? ELSE ? END, error = ?, "
+            "lease_until = NULL, updated = ? WHERE qid = ? AND worker = ? AND status = ?",
+            (self.max_attempts, QUEUED, FAILED, error, time.time(), qid, worker, LEASED),
+        ) == 1
+
+    def job(self, qid: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE qid = ?", (qid,)).fetchone()
+        if not row:
+            return None
+        job = dict(row)
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def stats(self) -> Dict[str, int]:
+        """Number of jobs per status; expired leases count as queued."""
+        now = time.time()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT CASE WHEN status = ? AND lease_until < ? THEN ? ELSE status END AS s, "
+                "COUNT(*) AS n FROM jobs GROUP BY s",
+                (LEASED, now, QUEUED),
+            ).fetchall()
+        return {r["s"]: r["n"] for r in rows}
+
+    def rate_limiter(self, name: str, rate: float, burst: int = 1) -> "SharedRateLimiter":
+        return SharedRateLimiter(self, name, rate, burst)
+
+
+class SharedRateLimiter:
+    """
+    Token bucket stored in the queue file, with the same acquire() as
+    wikidata_api.RateLimiter, so every worker process draws from one
+    budget. Uses wall-clock time, which hosts must roughly agree on.
+    """
+
+    def __init__(self, queue: WorkQueue, name: str, rate: float, burst: int = 1):
+        self.queue = queue
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+
+    def acquire(self) -> None:
+        conn, lock = self.queue._conn, self.queue._lock
+        while True:
+            with lock:
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    now = time.time()
+                    row = conn.execute(
+                        "SELECT tokens, updated FROM buckets WHERE name = ?", (self.name,)
+                    ).fetchone()
+                    tokens = float(self.burst) if row is None else min(
+                        self.burst, row["tokens"] + max(0.0, now - row["updated"]) * self.rate
+                    )
+                    granted = tokens >= 1
+                    if granted:
+                        tokens -= 1
+                    conn.execute(
+                        "INSERT OR REPLACE INTO buckets VALUES (?, ?, ?)", (self.name, tokens, now)
+                    )
+                except BaseException:
+                    conn.execute("ROLLBACK")
+                    raise
+                conn.execute("COMMIT")
+            if granted:
+                return
+            time.sleep((1 - tokens) / self.rate)
+
+
+class _Heartbeat:
+    """Renews a lease every lease/3 seconds until stopped; notes if it was lost."""
+
+    def __init__(self, queue: WorkQueue, qid: str, worker: str, lease: float):
+        self.queue, self.qid, self.worker, self.lease = queue, qid, worker, lease
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"lease-{qid}", daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.lease / 3):
+            if not self.queue.heartbeat(self.qid, self.worker, self.lease):
+                logger.warning("lost the lease on %s", self.qid)
+                self.lost = True
+                return
+
+    def __enter__(self) -> "_Heartbeat":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        self._thread.join()
+
+
+def share_rate_limits(queue: WorkQueue) -> None:
+    """Route this process's Wikidata API and WDQS requests through the queue's shared buckets."""
+    from wikidata_discover import sparql_helpers, wikidata_api
+
+    api, sparql = wikidata_api._api_limiter, sparql_helpers.sparql_limiter
+    wikidata_api._api_limiter = queue.rate_limiter("wd_api", api.rate, api.burst)
+    sparql_helpers.sparql_limiter = queue.rate_limiter("sparql", sparql.rate, sparql.burst)
+
+
+def discover_one(qid: str, stream: bool = False) -> Dict[str, Any]:
+    """Run discover for one university; the summary stored as the job result."""
+    from wikidata_discover.discovery import Discovery
+
+    missing, _ = Discovery(qid).discover_missing(stream=stream)
+    return {
+        "missing": sum(1 for m in missing if m["status"] == "missing"),
+        "orphans": sum(1 for m in missing if m["status"] == "orphan"),
+    }
+
+
+def run_worker(
+    queue: WorkQueue,
+    process: Callable[[str], Dict[str, Any]] = discover_one,
+    worker: Optional[str] = None,
+    lease: Optional[float] = None,
+    max_items: Optional[int] = None,
+    wait: bool = False,
+    poll: float = 10.0,
+) -> Dict[str, int]:
+    """
+    Claim and process QIDs until the queue is empty (or, with wait=True,
+    forever), or max_items have been handled. Returns what this worker did.
+    """
+    worker = worker or default_worker_id()
+    lease = lease or config.WORK_QUEUE_LEASE
+    stats = {"done": 0, "failed": 0, "lost": 0}
+    handled = 0
+    while max_items is None or handled < max_items:
+        qid = queue.claim(worker, lease)
+        if qid is None:
+            if not wait:
+                break
+            time.sleep(poll)
+            continue
+        handled += 1
+        logger.info("%s: claimed %s", worker, qid)
+        with _Heartbeat(queue, qid, worker, lease) as beat:
+            try:
+                result = process(qid)
+            except Exception as e:
+                logger.error("%s: %s failed: %s", worker, qid, e)
+                stats["failed" if queue.fail(qid, worker, repr(e)) else "lost"] += 1
+                continue
+        if not beat.lost and queue.complete(qid, worker, result):
+            stats["done"] += 1
+        else:
+            stats["lost"] += 1
+    return stats